@@ -0,0 +1,164 @@
+"""
+ASGI middleware for the image search API.
+"""
+import logging
+from typing import Dict, Optional
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from utils.image_utils import ImageProcessor
+
+logger = logging.getLogger(__name__)
+
+# Allowance for multipart boundaries, part headers and small form fields
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Leading bytes of an uploaded file needed to recognize its format
+SNIFF_BYTES = 16
+
+UNSUPPORTED_FORMAT_MESSAGE = "Unsupported image format (JPEG, PNG, GIF, WEBP, BMP or TIFF expected)"
+
+
+class FirstFileSniffer:
+    """Finds the leading bytes of the first file in a multipart body as it streams in.
+
+    Only the start of the body is buffered: the form fields before the file,
+    the file's part headers and SNIFF_BYTES of its content. Bodies whose
+    first file does not start within MULTIPART_OVERHEAD_BYTES are not sniffed.
+    """
+
+    def __init__(self, boundary: bytes):
+        """
+        Initialize the sniffer.
+
+        Args:
+            boundary: Multipart boundary from the Content-Type header
+        """
+        self._delimiter = b"--" + boundary
+        self._buffer = bytearray()
+        self.done = False
+
+    def feed(self, chunk: bytes) -> Optional[bytes]:
+        """
+        Scan the next chunk of the body.
+
+        Args:
+            chunk: Body bytes in arrival order
+
+        Returns:
+            Leading bytes of the first file once they have arrived (fewer than
+            SNIFF_BYTES for a shorter file), otherwise None
+        """
+        if self.done:
+            return None
+        self._buffer += chunk
+        buffer = self._buffer
+
+        position = buffer.find(self._delimiter)
+        while position >= 0:
+            headers_start = position + len(self._delimiter) + 2
+            headers_end = buffer.find(b"\r\n\r\n", headers_start)
+            if headers_end < 0:
+                break
+            content_start = headers_end + 4
+            next_part = buffer.find(b"\r\n" + self._delimiter, content_start)
+            if b"filename=" in bytes(buffer[headers_start:headers_end]).lower():
+                if next_part >= 0 or len(buffer) >= content_start + SNIFF_BYTES:
+                    end = next_part if 0 <= next_part < content_start + SNIFF_BYTES \
+                        else content_start + SNIFF_BYTES
+                    self._finish()
+                    return bytes(buffer[content_start:end])
+                break
+            position = next_part + 2 if next_part >= 0 else -1
+
+        if len(buffer) > MULTIPART_OVERHEAD_BYTES:
+            self._finish()
+        return None
+
+    def _finish(self) -> None:
+        self.done = True
+        self._buffer = bytearray()
+
+
+def multipart_boundary(content_type: bytes) -> Optional[bytes]:
+    """Get the boundary parameter of a multipart Content-Type header."""
+    for parameter in content_type.split(b";")[1:]:
+        name, _, value = parameter.strip().partition(b"=")
+        if name.lower() == b"boundary" and value:
+            return value.strip(b'"')
+    return None
+
+
+class UploadLimitMiddleware:
+    """Rejects oversized and non-image multipart uploads while they arrive.
+
+    Requests announcing a larger Content-Length are refused before any of
+    the body is read; chunked requests are counted as they stream in and
+    aborted as soon as they pass the limit, so an oversized upload is never
+    fully received or spooled. On paths that take a single file, the first
+    bytes of the file are checked for an image signature as soon as they
+    arrive, so a non-image payload is refused with 415 before the rest of it
+    is received. Multi-file requests are checked per file by the route.
+    """
+
+    def __init__(self, app, max_bytes: int, max_files: Optional[Dict[str, int]] = None):
+        """
+        Initialize the middleware.
+
+        Args:
+            app: ASGI application
+            max_bytes: Largest accepted file size, 0 for no limit
+            max_files: Number of files accepted per request by path (default 1)
+        """
+        self.app = app
+        self.max_bytes = max_bytes
+        self.max_files = max_files or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_type = headers.get(b"content-type", b"")
+        if not content_type.startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        max_files = self.max_files.get(scope["path"], 1)
+        max_body_bytes = (
+            self.max_bytes * max_files + MULTIPART_OVERHEAD_BYTES if self.max_bytes else 0
+        )
+        content_length = headers.get(b"content-length")
+        if max_body_bytes and content_length is not None and content_length.isdigit() \
+                and int(content_length) > max_body_bytes:
+            logger.warning(f"Rejected upload of {int(content_length)} bytes to {scope['path']}")
+            response = JSONResponse(status_code=413, content={"detail": self._too_large_message()})
+            await response(scope, receive, send)
+            return
+
+        boundary = multipart_boundary(content_type)
+        sniffer = FirstFileSniffer(boundary) if max_files == 1 and boundary else None
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                received += len(body)
+                if max_body_bytes and received > max_body_bytes:
+                    logger.warning(f"Aborted upload to {scope['path']} after {received} bytes")
+                    raise HTTPException(status_code=413, detail=self._too_large_message())
+                if sniffer is not None and not sniffer.done:
+                    header = sniffer.feed(body)
+                    # An empty file is left to the route, which reports it as such
+                    if header and ImageProcessor.sniff_image_format(header) is None:
+                        logger.warning(f"Rejected non-image upload to {scope['path']} after {received} bytes")
+                        raise HTTPException(status_code=415, detail=UNSUPPORTED_FORMAT_MESSAGE)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _too_large_message(self) -> str:
+        return f"Upload exceeds the maximum size of {self.max_bytes} bytes"
@@ -2,23 +2,68 @@
 API routes for image search endpoints.
 """
 import logging
-from typing import List, Optional
-from fastapi import APIRouter, File, UploadFile, HTTPException, Query
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException, Query
 from fastapi.responses import JSONResponse
 
-from models.product import SearchResult
+from api.middleware import UNSUPPORTED_FORMAT_MESSAGE
+from config.settings import config
+from models.product import BatchSearchItem, SearchResult, VectorSearchRequest
+from services.inference_executor import InferenceQueueFullError, get_inference_executor
 from services.search_service import get_search_service
+from utils.image_utils import ImageProcessor
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/v1", tags=["search"])
 
 
+def _busy_error(error: InferenceQueueFullError) -> HTTPException:
+    """Build the response for a request rejected by the full inference queue."""
+    logger.warning(str(error))
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, please retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
+
+async def _check_upload(file: UploadFile) -> Optional[Tuple[int, str]]:
+    """
+    Validate an uploaded image from its content type, size and first bytes.
+    
+    Runs after the multipart body has been spooled. A single-file upload with
+    a non-image signature has already been refused by UploadLimitMiddleware
+    while streaming; this check covers the files of batch requests and bodies
+    the middleware could not sniff.
+    
+    Args:
+        file: Uploaded file (already spooled by the multipart parser)
+        
+    Returns:
+        (status_code, detail) if the upload is rejected, otherwise None
+    """
+    if not file.content_type or not file.content_type.startswith('image/'):
+        return 400, "File must be an image (JPEG, PNG, etc.)"
+    
+    header = await file.read(16)
+    if not header:
+        return 400, "Empty image file"
+    
+    if ImageProcessor.sniff_image_format(header) is None:
+        return 415, UNSUPPORTED_FORMAT_MESSAGE
+    
+    if config.MAX_UPLOAD_BYTES and file.size is not None and file.size > config.MAX_UPLOAD_BYTES:
+        return 413, f"Upload exceeds the maximum size of {config.MAX_UPLOAD_BYTES} bytes"
+    return None
+
+
 @router.post("/search/image", response_model=List[SearchResult])
 async def search_by_image(
     file: UploadFile = File(...),
     top_k: Optional[int] = Query(None, ge=1, le=50, description="Number of results to return"),
-    threshold: Optional[float] = Query(None, ge=0.0, le=1.0, description="Minimum similarity threshold")
+    threshold: Optional[float] = Query(None, ge=0.0, le=1.0, description="Minimum similarity threshold"),
+    nprobe: Optional[int] = Query(None, ge=1, le=1024, description="Clusters to scan (IVF index only)")
 ) -> List[SearchResult]:
     """
     Search for similar products by uploading an image.
@@ -27,6 +72,7 @@ async def search_by_image(
         file: Uploaded image file (JPEG, PNG, etc.)
         top_k: Number of top results to return (default: 10)
         threshold: Minimum similarity threshold (default: 0.5)
+        nprobe: Clusters to scan, trading recall for latency (IVF index only)
         
     Returns:
         List of similar products with similarity scores
@@ -35,36 +81,224 @@ async def search_by_image(
         HTTPException: If image processing fails
     """
     try:
-        # Validate file type
-        if not file.content_type or not file.content_type.startswith('image/'):
+        # Validate file type; the upload is already spooled (to disk past 1 MB),
+        # so only its header is sniffed
+        rejection = await _check_upload(file)
+        if rejection is not None:
+            raise HTTPException(status_code=rejection[0], detail=rejection[1])
+        
+        # Perform search off the event loop, decoding straight from the spooled file
+        search_service = get_search_service()
+        results = await get_inference_executor().run(
+            search_service.search_by_image_file,
+            image_file=file.file,
+            top_k=top_k,
+            threshold=threshold,
+            nprobe=nprobe
+        )
+        
+        logger.info(f"Image search completed: {len(results)} results found")
+        return results
+    except HTTPException:
+        raise
+    except InferenceQueueFullError as e:
+        raise _busy_error(e)
+    except Exception as e:
+        logger.error(f"Error in search_by_image endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+
+@router.post("/search/batch", response_model=List[BatchSearchItem])
+async def search_batch(
+    files: List[UploadFile] = File(default=[], description="Query images"),
+    image_urls: List[str] = Form(default=[], description="URLs of query images"),
+    top_k: Optional[int] = Query(None, ge=1, le=50, description="Number of results to return per query"),
+    threshold: Optional[float] = Query(None, ge=0.0, le=1.0, description="Minimum similarity threshold"),
+    nprobe: Optional[int] = Query(None, ge=1, le=1024, description="Clusters to scan (IVF index only)")
+) -> List[BatchSearchItem]:
+    """
+    Search for similar products for several images in one request.
+    
+    All images are embedded in one batched forward pass and scored together.
+    A query that fails reports its error without failing the others.
+    
+    Args:
+        files: Uploaded image files
+        image_urls: URLs of query images
+        top_k: Number of top results to return per query (default: 10)
+        threshold: Minimum similarity threshold (default: 0.5)
+        nprobe: Clusters to scan, trading recall for latency (IVF index only)
+        
+    Returns:
+        One item per query, uploads first and then URLs, in request order
+        
+    Raises:
+        HTTPException: If the batch is empty or too large
+    """
+    try:
+        count = len(files) + len(image_urls)
+        if not count:
             raise HTTPException(
                 status_code=400,
-                detail="File must be an image (JPEG, PNG, etc.)"
+                detail="At least one image file or image URL is required"
             )
-        
-        # Read image bytes
-        image_bytes = await file.read()
-        
-        if not image_bytes:
+        if count > config.MAX_BATCH_QUERIES:
             raise HTTPException(
                 status_code=400,
-                detail="Empty image file"
+                detail=f"At most {config.MAX_BATCH_QUERIES} images are allowed per batch"
             )
         
-        # Perform search
+        # Invalid uploads are reported per item and left out of the search
+        items = [
+            BatchSearchItem(query=file.filename or f"file-{i}")
+            for i, file in enumerate(files)
+        ] + [BatchSearchItem(query=image_url) for image_url in image_urls]
+        accepted: List[int] = []
+        for i, file in enumerate(files):
+            rejection = await _check_upload(file)
+            if rejection is None:
+                accepted.append(i)
+            else:
+                items[i].error = rejection[1]
+        
+        # Perform search off the event loop
         search_service = get_search_service()
-        results = search_service.search_by_image_bytes(
-            image_bytes=image_bytes,
+        outcomes = await get_inference_executor().run(
+            search_service.search_batch,
+            image_files=[files[i].file for i in accepted],
+            image_urls=image_urls,
             top_k=top_k,
-            threshold=threshold
+            threshold=threshold,
+            nprobe=nprobe
         )
         
-        logger.info(f"Image search completed: {len(results)} results found")
+        positions = accepted + list(range(len(files), count))
+        for i, (results, error) in zip(positions, outcomes):
+            items[i].results = results
+            items[i].error = error
+        
+        logger.info(f"Batch search completed for {count} queries")
+        return items
+    except HTTPException:
+        raise
+    except InferenceQueueFullError as e:
+        raise _busy_error(e)
+    except Exception as e:
+        logger.error(f"Error in search_batch endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+
+@router.get("/search/product/{product_id}", response_model=List[SearchResult])
+async def search_by_product(
+    product_id: str,
+    top_k: Optional[int] = Query(None, ge=1, le=50, description="Number of results to return"),
+    threshold: Optional[float] = Query(None, ge=0.0, le=1.0, description="Minimum similarity threshold"),
+    nprobe: Optional[int] = Query(None, ge=1, le=1024, description="Clusters to scan (IVF index only)")
+) -> List[SearchResult]:
+    """
+    Find products similar to a catalog product ("more like this").
+    
+    Uses the product's stored embedding, so no image is downloaded and the
+    model does not run.
+    
+    Args:
+        product_id: ID of the catalog product
+        top_k: Number of top results to return (default: 10)
+        threshold: Minimum similarity threshold (default: 0.5)
+        nprobe: Clusters to scan, trading recall for latency (IVF index only)
+        
+    Returns:
+        List of similar products with similarity scores, excluding the product itself
+        
+    Raises:
+        HTTPException: If the product is not indexed
+    """
+    try:
+        # The first request may still load the model and catalog, so go through
+        # the inference queue and its back-pressure like the other searches
+        search_service = get_search_service()
+        results = await get_inference_executor().run(
+            search_service.search_by_product_id,
+            product_id=product_id,
+            top_k=top_k,
+            threshold=threshold,
+            nprobe=nprobe
+        )
+        
+        if results is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Product {product_id} is not indexed"
+            )
+        
+        logger.info(f"Product search completed: {len(results)} results found")
         return results
     except HTTPException:
         raise
+    except InferenceQueueFullError as e:
+        raise _busy_error(e)
     except Exception as e:
-        logger.error(f"Error in search_by_image endpoint: {str(e)}")
+        logger.error(f"Error in search_by_product endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+
+@router.post("/search/vector", response_model=List[SearchResult])
+async def search_by_vector(
+    request: VectorSearchRequest,
+    top_k: Optional[int] = Query(None, ge=1, le=50, description="Number of results to return"),
+    threshold: Optional[float] = Query(None, ge=0.0, le=1.0, description="Minimum similarity threshold"),
+    nprobe: Optional[int] = Query(None, ge=1, le=1024, description="Clusters to scan (IVF index only)")
+) -> List[SearchResult]:
+    """
+    Search for similar products with a precomputed CLIP image embedding.
+    
+    Args:
+        request: Model name and the vector, as a JSON array or base64 float32
+        top_k: Number of top results to return (default: 10)
+        threshold: Minimum similarity threshold (default: 0.5)
+        nprobe: Clusters to scan, trading recall for latency (IVF index only)
+        
+    Returns:
+        List of similar products with similarity scores
+        
+    Raises:
+        HTTPException: If the vector is malformed or from another model
+    """
+    try:
+        vector = request.query_vector()
+        
+        # The first request may still load the model and catalog, so go through
+        # the inference queue and its back-pressure like the other searches
+        search_service = get_search_service()
+        results = await get_inference_executor().run(
+            search_service.search_by_vector,
+            vector=vector,
+            model=request.model,
+            top_k=top_k,
+            threshold=threshold,
+            nprobe=nprobe
+        )
+        
+        logger.info(f"Vector search completed: {len(results)} results found")
+        return results
+    except InferenceQueueFullError as e:
+        raise _busy_error(e)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Error in search_by_vector endpoint: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
@@ -75,7 +309,8 @@ async def search_by_image(
 async def search_by_url(
     image_url: str = Query(..., description="URL of the image to search"),
     top_k: Optional[int] = Query(None, ge=1, le=50, description="Number of results to return"),
-    threshold: Optional[float] = Query(None, ge=0.0, le=1.0, description="Minimum similarity threshold")
+    threshold: Optional[float] = Query(None, ge=0.0, le=1.0, description="Minimum similarity threshold"),
+    nprobe: Optional[int] = Query(None, ge=1, le=1024, description="Clusters to scan (IVF index only)")
 ) -> List[SearchResult]:
     """
     Search for similar products using an image URL.
@@ -84,6 +319,7 @@ async def search_by_url(
         image_url: URL of the image to search
         top_k: Number of top results to return (default: 10)
         threshold: Minimum similarity threshold (default: 0.5)
+        nprobe: Clusters to scan, trading recall for latency (IVF index only)
         
     Returns:
         List of similar products with similarity scores
@@ -98,18 +334,22 @@ async def search_by_url(
                 detail="Image URL is required"
             )
         
-        # Perform search
+        # Perform search off the event loop
         search_service = get_search_service()
-        results = search_service.search_by_image_url(
+        results = await get_inference_executor().run(
+            search_service.search_by_image_url,
             image_url=image_url,
             top_k=top_k,
-            threshold=threshold
+            threshold=threshold,
+            nprobe=nprobe
         )
         
         logger.info(f"URL search completed: {len(results)} results found")
         return results
     except HTTPException:
         raise
+    except InferenceQueueFullError as e:
+        raise _busy_error(e)
     except Exception as e:
         logger.error(f"Error in search_by_url endpoint: {str(e)}")
         raise HTTPException(
@@ -129,7 +369,7 @@ async def refresh_product_features() -> JSONResponse:
     """
     try:
         search_service = get_search_service()
-        search_service.refresh_product_features()
+        changes = await get_inference_executor().run(search_service.refresh_product_features)
         
         logger.info("Product features refreshed successfully")
         return JSONResponse(
@@ -137,9 +377,13 @@ async def refresh_product_features() -> JSONResponse:
             content={
                 "message": "Product features refreshed successfully",
                 "total_products": len(search_service.products),
-                "indexed_products": len(search_service.product_features)
+                "indexed_products": len(search_service.index),
+                "changes": changes,
+                "indexing": search_service.last_indexing_stats
             }
         )
+    except InferenceQueueFullError as e:
+        raise _busy_error(e)
     except Exception as e:
         logger.error(f"Error in refresh endpoint: {str(e)}")
         raise HTTPException(
@@ -148,6 +392,74 @@ async def refresh_product_features() -> JSONResponse:
         )
 
 
+@router.get("/index/recall")
+async def index_recall(
+    sample_size: int = Query(100, ge=1, le=1000, description="Number of sample queries"),
+    top_k: Optional[int] = Query(None, ge=1, le=100, description="Neighbours compared per query")
+) -> JSONResponse:
+    """
+    Report recall@k of the approximate index against exact search.
+    
+    Args:
+        sample_size: Number of indexed vectors used as sample queries
+        top_k: Number of neighbours compared per query
+        
+    Returns:
+        Recall report of the current index
+    """
+    try:
+        search_service = get_search_service()
+        report = await get_inference_executor().run(
+            search_service.index_recall_report, sample_size, top_k
+        )
+    except InferenceQueueFullError as e:
+        raise _busy_error(e)
+    except Exception as e:
+        logger.error(f"Error in recall endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to measure index recall: {str(e)}"
+        )
+    
+    if report is None:
+        raise HTTPException(
+            status_code=400,
+            detail="The configured index is exact; recall is always 1.0"
+        )
+    return JSONResponse(status_code=200, content=report)
+
+
+@router.get("/model/drift")
+async def model_drift(
+    sample_size: int = Query(32, ge=2, le=256, description="Number of catalog images to compare"),
+    top_k: Optional[int] = Query(None, ge=1, le=50, description="Neighbours compared per image")
+) -> JSONResponse:
+    """
+    Report how far the serving model's embeddings drift from the float32 model.
+    
+    Args:
+        sample_size: Number of catalog images embedded with both models
+        top_k: Number of neighbours compared within the sample
+        
+    Returns:
+        Cosine agreement, top-k overlap, model sizes and latencies
+    """
+    try:
+        search_service = get_search_service()
+        report = await get_inference_executor().run(
+            search_service.model_drift_report, sample_size, top_k
+        )
+        return JSONResponse(status_code=200, content=report)
+    except InferenceQueueFullError as e:
+        raise _busy_error(e)
+    except Exception as e:
+        logger.error(f"Error in drift endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to measure model drift: {str(e)}"
+        )
+
+
 @router.get("/health")
 async def health_check() -> JSONResponse:
     """
@@ -204,8 +516,34 @@ async def detailed_status() -> JSONResponse:
                 "status": "healthy",
                 "model_loaded": search_service._initialized if hasattr(search_service, '_initialized') else False,
                 "total_products": len(search_service.products),
-                "cached_features": len(search_service.product_features),
-                "cache_enabled": search_service.product_features is not None and len(search_service.product_features) > 0
+                "cached_features": len(search_service.index),
+                "cache_enabled": len(search_service.index) > 0,
+                "embedding_cache": (
+                    search_service.embedding_cache.stats()
+                    if search_service.embedding_cache is not None else None
+                ),
+                "query_cache": (
+                    search_service.query_cache.stats()
+                    if search_service.query_cache is not None else None
+                ),
+                "precomputed_neighbors": search_service.neighbor_stats(),
+                "perceptual_hash": (
+                    search_service.image_hashes.stats()
+                    if search_service.image_hashes is not None else None
+                ),
+                "singleflight": {
+                    "queries": search_service.query_flight.stats(),
+                    "downloads": (
+                        search_service.feature_extractor.image_processor.fetch_flight.stats()
+                        if search_service.feature_extractor is not None else None
+                    )
+                },
+                "inference_executor": get_inference_executor().stats(),
+                "micro_batching": (
+                    search_service.feature_extractor.batcher.stats()
+                    if search_service.feature_extractor is not None
+                    and search_service.feature_extractor.batcher is not None else None
+                )
             }
         )
     except Exception as e:
@@ -25,13 +25,93 @@ class Config:
     # Use smaller model to reduce memory (openai/clip-vit-base-patch32 uses ~150MB vs ~500MB for large)
     MODEL_NAME: str = os.getenv("MODEL_NAME", "openai/clip-vit-base-patch32")
     DEVICE: str = os.getenv("DEVICE", "cpu")
+    # "none", or "dynamic_int8" to load only the vision tower with int8 linear layers (CPU only)
+    MODEL_QUANTIZATION: str = os.getenv("MODEL_QUANTIZATION", "none")
+    
+    # Torch backend speedups: "none", "trace" (TorchScript) or "compile" (torch.compile)
+    TORCH_COMPILE_MODE: str = os.getenv("TORCH_COMPILE_MODE", "none")
+    TORCH_CHANNELS_LAST: bool = os.getenv("TORCH_CHANNELS_LAST", "false").lower() == "true"
+    TORCH_BF16: bool = os.getenv("TORCH_BF16", "false").lower() == "true"  # Only used on CPUs with native bf16
+    
+    # Inference Backend ("torch", or "onnx" to serve an exported image encoder with onnxruntime)
+    INFERENCE_BACKEND: str = os.getenv("INFERENCE_BACKEND", "torch")
+    ONNX_MODEL_DIR: str = os.getenv("ONNX_MODEL_DIR", "models/onnx")  # Where exported encoders are kept
+    ONNX_MODEL_PATH: str = os.getenv("ONNX_MODEL_PATH", "")  # Explicit .onnx file, overrides ONNX_MODEL_DIR
+    ONNX_INTRA_OP_THREADS: int = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))  # 0 uses all physical cores
+    ONNX_INTER_OP_THREADS: int = int(os.getenv("ONNX_INTER_OP_THREADS", "1"))
     
     # Memory Optimization
     MAX_BATCH_SIZE: int = int(os.getenv("MAX_BATCH_SIZE", "4"))
+    # Micro-batching of concurrent query images (batches up to MAX_BATCH_SIZE). A lone
+    # request is never held back; when requests overlap, each may wait up to
+    # MICRO_BATCH_WINDOW_MS for the batch to fill, trading a little latency for throughput
+    MICRO_BATCH_ENABLED: bool = os.getenv("MICRO_BATCH_ENABLED", "true").lower() == "true"
+    MICRO_BATCH_WINDOW_MS: float = float(os.getenv("MICRO_BATCH_WINDOW_MS", "10"))
+    # Vectorized CLIP preprocessing (falls back to the HuggingFace processor if parity fails;
+    # always used by the onnx backend, which reads the exported preprocessor config instead)
+    FAST_PREPROCESS: bool = os.getenv("FAST_PREPROCESS", "true").lower() == "true"
+    INDEXING_QUEUE_SIZE: int = int(os.getenv("INDEXING_QUEUE_SIZE", "8"))  # Items buffered between indexing stages
     CACHE_PRODUCTS: bool = os.getenv("CACHE_PRODUCTS", "false").lower() == "true"
     LAZY_LOAD_MODEL: bool = os.getenv("LAZY_LOAD_MODEL", "true").lower() == "true"
     MAX_PRODUCTS: int = int(os.getenv("MAX_PRODUCTS", "100"))  # Limit products to reduce memory
     ENABLE_GC: bool = os.getenv("ENABLE_GC", "true").lower() == "true"  # Force garbage collection
+    # Directory for persisted product embeddings (empty disables the store)
+    EMBEDDING_STORE_DIR: str = os.getenv("EMBEDDING_STORE_DIR", "")
+    # Byte budget of the lazy embedding cache used when CACHE_PRODUCTS=false
+    EMBEDDING_CACHE_MAX_BYTES: int = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+    EMBEDDING_CACHE_SPILL_DIR: str = os.getenv("EMBEDDING_CACHE_SPILL_DIR", "")  # Empty disables spilling
+    
+    # Query Embedding Cache (repeat uploads/URLs skip decoding and inference)
+    QUERY_CACHE_MAX_BYTES: int = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))  # 0 disables
+    QUERY_CACHE_TTL: float = float(os.getenv("QUERY_CACHE_TTL", "600"))  # Seconds, 0 for no expiry
+    
+    # "More like this" neighbour lists computed at index time (0 scores on request)
+    PRECOMPUTE_NEIGHBORS: int = int(os.getenv("PRECOMPUTE_NEIGHBORS", "0"))
+    
+    # Perceptual-hash fast path (near-exact copies of catalog images skip inference;
+    # needs CACHE_PRODUCTS=true)
+    PHASH_ENABLED: bool = os.getenv("PHASH_ENABLED", "false").lower() == "true"
+    PHASH_MAX_DISTANCE: int = int(os.getenv("PHASH_MAX_DISTANCE", "4"))  # Differing bits out of 64
+    
+    # Image Decoding (JPEGs decode at reduced scale, other formats are box-reduced,
+    # keeping the shorter side at least IMAGE_DECODE_SIZE; 0 decodes at full size)
+    IMAGE_DECODE_SIZE: int = int(os.getenv("IMAGE_DECODE_SIZE", "224"))
+    MAX_IMAGE_BYTES: int = int(os.getenv("MAX_IMAGE_BYTES", str(20 * 1024 * 1024)))  # 0 for no limit
+    MAX_IMAGE_PIXELS: int = int(os.getenv("MAX_IMAGE_PIXELS", "50000000"))  # 0 for no limit
+    
+    # Uploads (streamed to a spooled file; larger requests are rejected while receiving)
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+    MAX_BATCH_QUERIES: int = int(os.getenv("MAX_BATCH_QUERIES", "32"))  # Images per /search/batch request
+    
+    # Image Download Configuration
+    DOWNLOAD_WORKERS: int = int(os.getenv("DOWNLOAD_WORKERS", "8"))
+    DOWNLOAD_PER_HOST_LIMIT: int = int(os.getenv("DOWNLOAD_PER_HOST_LIMIT", "4"))
+    HTTP_POOL_SIZE: int = int(os.getenv("HTTP_POOL_SIZE", "10"))
+    DOWNLOAD_TIME_BUDGET: float = float(os.getenv("DOWNLOAD_TIME_BUDGET", "300"))  # Seconds, 0 for no limit
+    
+    # Inference Executor (keeps blocking search work off the event loop)
+    INFERENCE_WORKERS: int = int(os.getenv("INFERENCE_WORKERS", "2"))
+    INFERENCE_QUEUE_SIZE: int = int(os.getenv("INFERENCE_QUEUE_SIZE", "8"))  # Jobs waiting for a worker
+    
+    # Live index updates from MongoDB (change streams, or polling as a fallback)
+    WATCH_PRODUCTS: bool = os.getenv("WATCH_PRODUCTS", "false").lower() == "true"
+    WATCH_POLL_INTERVAL: float = float(os.getenv("WATCH_POLL_INTERVAL", "10"))
+    
+    # Vector Index ("flat" exact float32, "int8" quantized with float32 re-rank,
+    # "ivf" clustered approximate search, or "pq" product-quantized codes)
+    INDEX_TYPE: str = os.getenv("INDEX_TYPE", "flat")
+    INT8_SCALE_MODE: str = os.getenv("INT8_SCALE_MODE", "vector")  # "vector" or "dimension"
+    INT8_RERANK_FACTOR: int = int(os.getenv("INT8_RERANK_FACTOR", "4"))  # Candidates re-ranked per result
+    INT8_RERANK_DIR: str = os.getenv("INT8_RERANK_DIR", "")  # Empty uses the system temp directory
+    IVF_NLIST: int = int(os.getenv("IVF_NLIST", "0"))  # Clusters; 0 sizes them as 4 * sqrt(N)
+    IVF_NPROBE: int = int(os.getenv("IVF_NPROBE", "8"))  # Clusters scored per query
+    IVF_MIN_TRAIN_SIZE: int = int(os.getenv("IVF_MIN_TRAIN_SIZE", "1024"))  # Smaller catalogs use brute force
+    IVF_TRAIN_ITERATIONS: int = int(os.getenv("IVF_TRAIN_ITERATIONS", "10"))
+    PQ_SUBSPACES: int = int(os.getenv("PQ_SUBSPACES", "64"))  # Bytes per vector; must divide the embedding size
+    PQ_RERANK_FACTOR: int = int(os.getenv("PQ_RERANK_FACTOR", "4"))  # 0 returns PQ scores without re-ranking
+    PQ_TRAIN_SIZE: int = int(os.getenv("PQ_TRAIN_SIZE", "20000"))  # Vectors sampled to train the codebooks
+    PQ_TRAIN_ITERATIONS: int = int(os.getenv("PQ_TRAIN_ITERATIONS", "15"))
+    PQ_RERANK_DIR: str = os.getenv("PQ_RERANK_DIR", "")  # Empty uses the system temp directory
     
     # Search Configuration
     TOP_K: int = int(os.getenv("TOP_K", 10))
@@ -17,7 +17,10 @@ if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
 
 from config.settings import config
+from api.middleware import UploadLimitMiddleware
 from api.routes import router
+from services.inference_executor import shutdown_inference_executor
+from services.search_service import shutdown_search_service
 from utils.logger import setup_logger
 
 # Setup logging
@@ -38,6 +41,8 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down Image Search API...")
+    shutdown_search_service()
+    shutdown_inference_executor()
 
 
 # Create FastAPI application
@@ -57,6 +62,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized uploads while they are still being received
+app.add_middleware(
+    UploadLimitMiddleware,
+    max_bytes=config.MAX_UPLOAD_BYTES,
+    max_files={"/api/v1/search/batch": config.MAX_BATCH_QUERIES}
+)
+
 # Include API routes
 app.include_router(router)
 
@@ -71,6 +83,9 @@ async def root():
             "health": "/api/v1/health",
             "search_by_image": "/api/v1/search/image",
             "search_by_url": "/api/v1/search/url",
+            "search_batch": "/api/v1/search/batch",
+            "search_by_product": "/api/v1/search/product/{product_id}",
+            "search_by_vector": "/api/v1/search/vector",
             "refresh": "/api/v1/refresh",
             "docs": "/docs"
         }
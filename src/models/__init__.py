@@ -1,3 +1,3 @@
 """Models package initialization."""
 # Models will be imported directly where needed
-__all__ = ["Product", "SearchResult"]
+__all__ = ["Product", "SearchResult", "BatchSearchItem", "VectorSearchRequest"]
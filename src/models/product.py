@@ -1,11 +1,17 @@
 """
 Product model representing the MongoDB product schema.
 """
-from typing import Optional, Dict, Any, Union
+import base64
+import binascii
+from typing import List, Optional, Dict, Any, Union
 from datetime import datetime
-from pydantic import BaseModel, Field, field_validator
+import numpy as np
+from pydantic import BaseModel, Field, field_validator, model_validator
 from bson import ObjectId
 
+# Largest accepted query embedding dimension
+MAX_VECTOR_DIM = 4096
+
 
 class Product(BaseModel):
     """Product model matching MongoDB schema."""
@@ -66,3 +72,49 @@ class SearchResult(BaseModel):
     
     class Config:
         populate_by_name = True
+
+
+class VectorSearchRequest(BaseModel):
+    """Query embedding computed outside this service."""
+    model: str = Field(..., description="Model that produced the vector")
+    vector: Optional[List[float]] = Field(None, max_length=MAX_VECTOR_DIM)
+    vector_base64: Optional[str] = Field(
+        None,
+        max_length=(MAX_VECTOR_DIM * 4 + 2) // 3 * 4,
+        description="Base64 of little-endian float32 values"
+    )
+    
+    @model_validator(mode='after')
+    def check_single_encoding(self):
+        """Require exactly one of vector and vector_base64."""
+        if (self.vector is None) == (self.vector_base64 is None):
+            raise ValueError("Provide exactly one of vector or vector_base64")
+        return self
+    
+    def query_vector(self) -> np.ndarray:
+        """
+        Decode the query embedding.
+        
+        Returns:
+            Float32 vector
+            
+        Raises:
+            ValueError: If the base64 payload is not a float32 array
+        """
+        if self.vector is not None:
+            return np.asarray(self.vector, dtype=np.float32)
+        
+        try:
+            raw = base64.b64decode(self.vector_base64, validate=True)
+        except binascii.Error as e:
+            raise ValueError(f"vector_base64 is not valid base64: {str(e)}")
+        if len(raw) % 4:
+            raise ValueError("vector_base64 length is not a multiple of 4 bytes (float32)")
+        return np.frombuffer(raw, dtype='<f4').astype(np.float32)
+
+
+class BatchSearchItem(BaseModel):
+    """Results for one query of a batch search."""
+    query: str
+    results: List[SearchResult] = []
+    error: Optional[str] = None
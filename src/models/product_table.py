@@ -0,0 +1,204 @@
+"""
+Columnar in-memory table of catalog products.
+"""
+import logging
+import math
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+
+from models.product import Product
+
+logger = logging.getLogger(__name__)
+
+
+class ProductTable:
+    """Catalog products stored column-wise and indexed by product id.
+
+    Each field is kept as one list (text and dates) or one float64 array
+    (numbers, NaN for missing), instead of one full MongoDB document per
+    product. Documents are validated once when they enter the table, and
+    looking up a product by id is O(1).
+
+    Tables are treated as immutable: upsert() and remove() return a new table,
+    so readers holding the old one are never affected.
+    """
+
+    TEXT_COLUMNS = (
+        "productName",
+        "productImage",
+        "productCategory",
+        "productDescription",
+        "createdAt",
+        "updatedAt",
+    )
+    NUMERIC_COLUMNS = ("productPrice", "productSize", "averageRating", "totalRatings")
+
+    def __init__(self):
+        """Initialize an empty table."""
+        self.ids: List[str] = []
+        self._text: Dict[str, List[Any]] = {name: [] for name in self.TEXT_COLUMNS}
+        self._numeric: Dict[str, np.ndarray] = {
+            name: np.empty(0, dtype=np.float64) for name in self.NUMERIC_COLUMNS
+        }
+        self._positions: Dict[str, int] = {}
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Dict[str, Any]]) -> "ProductTable":
+        """
+        Build a table from MongoDB product documents.
+
+        Documents that do not match the Product schema are skipped.
+
+        Args:
+            documents: Product documents
+
+        Returns:
+            New ProductTable
+        """
+        table = cls()
+        rows = [product for product in map(cls._validate, documents) if product is not None]
+        # Keep the last occurrence of a duplicated id
+        rows = list({product.id: product for product in rows}.values())
+
+        table.ids = [product.id for product in rows]
+        table._positions = {product_id: i for i, product_id in enumerate(table.ids)}
+        for name in cls.TEXT_COLUMNS:
+            table._text[name] = [getattr(product, name) for product in rows]
+        for name in cls.NUMERIC_COLUMNS:
+            table._numeric[name] = np.array(
+                [cls._to_float(getattr(product, name)) for product in rows], dtype=np.float64
+            )
+        return table
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self._positions
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """
+        Iterate over the catalog images.
+
+        Yields:
+            (product_id, image_url) pairs in table order
+        """
+        return zip(self.ids, self._text["productImage"])
+
+    def image_url(self, product_id: str) -> Optional[str]:
+        """
+        Get the image URL of a product.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            Image URL or None if the product is not in the table
+        """
+        position = self._positions.get(product_id)
+        return None if position is None else self._text["productImage"][position]
+
+    def get(self, product_id: str) -> Optional[Product]:
+        """
+        Get a product by id.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            Product model or None if the product is not in the table
+        """
+        position = self._positions.get(product_id)
+        if position is None:
+            return None
+
+        values: Dict[str, Any] = {name: self._text[name][position] for name in self.TEXT_COLUMNS}
+        for name in self.NUMERIC_COLUMNS:
+            value = self._numeric[name][position]
+            if math.isnan(value):
+                values[name] = None
+            elif name == "totalRatings":
+                values[name] = int(value)
+            else:
+                values[name] = float(value)
+
+        # Values were validated when the row was added
+        return Product.model_construct(id=product_id, **values)
+
+    def upsert(self, document: Dict[str, Any]) -> "ProductTable":
+        """
+        Return a copy of the table with a product inserted or replaced.
+
+        Args:
+            document: Product document
+
+        Returns:
+            New ProductTable (this table if the document is invalid)
+        """
+        product = self._validate(document)
+        if product is None:
+            return self
+
+        table = self._copy()
+        position = table._positions.get(product.id)
+        if position is None:
+            position = len(table.ids)
+            table.ids.append(product.id)
+            table._positions[product.id] = position
+            for name in self.TEXT_COLUMNS:
+                table._text[name].append(None)
+            for name in self.NUMERIC_COLUMNS:
+                table._numeric[name] = np.append(table._numeric[name], np.nan)
+
+        for name in self.TEXT_COLUMNS:
+            table._text[name][position] = getattr(product, name)
+        for name in self.NUMERIC_COLUMNS:
+            table._numeric[name][position] = self._to_float(getattr(product, name))
+        return table
+
+    def remove(self, product_id: str) -> "ProductTable":
+        """
+        Return a copy of the table without a product.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            New ProductTable (this table if the product is not present)
+        """
+        position = self._positions.get(product_id)
+        if position is None:
+            return self
+
+        table = ProductTable()
+        table.ids = self.ids[:position] + self.ids[position + 1:]
+        table._positions = {pid: i for i, pid in enumerate(table.ids)}
+        for name in self.TEXT_COLUMNS:
+            column = self._text[name]
+            table._text[name] = column[:position] + column[position + 1:]
+        for name in self.NUMERIC_COLUMNS:
+            table._numeric[name] = np.delete(self._numeric[name], position)
+        return table
+
+    def _copy(self) -> "ProductTable":
+        table = ProductTable()
+        table.ids = list(self.ids)
+        table._positions = dict(self._positions)
+        table._text = {name: list(column) for name, column in self._text.items()}
+        table._numeric = {name: column.copy() for name, column in self._numeric.items()}
+        return table
+
+    @staticmethod
+    def _validate(document: Dict[str, Any]) -> Optional[Product]:
+        try:
+            product = Product(**document)
+        except Exception as e:
+            logger.warning(f"Skipping invalid product {document.get('_id')}: {str(e)}")
+            return None
+        if not product.id or not product.productImage:
+            return None
+        return product
+
+    @staticmethod
+    def _to_float(value: Any) -> float:
+        return float("nan") if value is None else float(value)
@@ -4,6 +4,11 @@ __all__ = [
     "DatabaseService",
     "get_database_service",
     "FeatureExtractor",
+    "FlatIndex",
+    "Int8Index",
+    "IVFIndex",
+    "PQIndex",
+    "PerceptualHashIndex",
     "get_feature_extractor",
     "SearchService",
     "get_search_service"
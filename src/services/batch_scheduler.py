@@ -0,0 +1,169 @@
+"""
+Dynamic micro-batching of concurrent query embeddings.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+from config.settings import config
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-image embedding requests into batches.
+
+    Callers preprocess their image on their own thread and enqueue the pixel
+    values. A single worker thread takes everything already queued, waits up
+    to a small window for more only if that was more than one request, runs
+    one forward pass for everything collected, and resolves each caller's
+    future with its own vector. Requests that arrive while a pass is running
+    form the next batch, so an idle server adds no latency.
+    """
+
+    def __init__(
+        self,
+        feature_extractor,
+        max_batch_size: Optional[int] = None,
+        window_ms: Optional[float] = None
+    ):
+        """
+        Initialize the scheduler (the worker thread starts on first use).
+
+        Args:
+            feature_extractor: FeatureExtractor used for preprocessing and inference
+            max_batch_size: Maximum images per forward pass (default from config)
+            window_ms: Maximum milliseconds to wait for a batch to fill (default from config)
+        """
+        self.feature_extractor = feature_extractor
+        self.max_batch_size = max(1, max_batch_size or config.MAX_BATCH_SIZE)
+        if window_ms is None:
+            window_ms = config.MICRO_BATCH_WINDOW_MS
+        self.window = max(0.0, window_ms) / 1000.0
+        self._queue: "queue.Queue[Tuple[np.ndarray, Future, float]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._images = 0
+        self._batch_sizes: Dict[int, int] = {}
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def submit(self, image: Image.Image) -> Future:
+        """
+        Queue an image for embedding.
+
+        Args:
+            image: PIL Image object
+
+        Returns:
+            Future resolving to the feature vector, or None if extraction failed
+        """
+        future: Future = Future()
+        try:
+            pixel_values = self.feature_extractor.preprocess([image])
+        except Exception as e:
+            logger.error(f"Error preprocessing query image: {str(e)}")
+            future.set_result(None)
+            return future
+
+        self._ensure_worker()
+        self._queue.put((pixel_values, future, time.perf_counter()))
+        return future
+
+    def embed(self, image: Image.Image) -> Optional[np.ndarray]:
+        """
+        Embed an image, sharing a forward pass with concurrent callers.
+
+        Args:
+            image: PIL Image object
+
+        Returns:
+            Feature vector or None if extraction failed
+        """
+        return self.submit(image).result()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get batching statistics.
+
+        Returns:
+            Dictionary with batch counts, batch-size histogram and queue waits
+        """
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "images": self._images,
+                "mean_batch_size": (
+                    round(self._images / self._batches, 2) if self._batches else None
+                ),
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+                "mean_queue_wait_ms": (
+                    round(1000 * self._total_wait / self._images, 2) if self._images else None
+                ),
+                "max_queue_wait_ms": round(1000 * self._max_wait, 2),
+                "queued": self._queue.qsize(),
+                "window_ms": 1000 * self.window,
+                "max_batch_size": self.max_batch_size,
+            }
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="micro-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                # A lone request runs at once; the window is only spent when
+                # other requests were already waiting
+                remaining = deadline - time.perf_counter()
+                if len(batch) == 1 or remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch: List[Tuple[np.ndarray, Future, float]]) -> None:
+        started = time.perf_counter()
+        waits = [started - enqueued_at for _, _, enqueued_at in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._images += len(batch)
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            self._total_wait += sum(waits)
+            self._max_wait = max(self._max_wait, max(waits))
+
+        try:
+            # Assemble the batch in the worker's reusable buffer
+            pixel_values = np.concatenate(
+                [pixels for pixels, _, _ in batch], axis=0,
+                out=self.feature_extractor.batch_buffer(len(batch))
+            )
+            vectors = self.feature_extractor.extract_features_from_pixels(pixel_values)
+        except Exception as e:
+            logger.error(f"Error running micro-batch of {len(batch)} images: {str(e)}")
+            vectors = None
+
+        for i, (_, future, _) in enumerate(batch):
+            future.set_result(None if vectors is None else vectors[i])
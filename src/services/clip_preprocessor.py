@@ -0,0 +1,186 @@
+"""
+Vectorized CLIP image preprocessing.
+"""
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Settings of a CLIPImageProcessor that the preprocessor reproduces
+CONFIG_KEYS = (
+    "do_resize", "do_center_crop", "do_rescale", "do_normalize", "size", "crop_size",
+    "image_mean", "image_std", "resample", "rescale_factor",
+)
+
+
+class ClipPreprocessor:
+    """Produces the pixel values of CLIPImageProcessor with fewer passes.
+
+    Each image is resized with PIL exactly as transformers does (shortest
+    edge, same resampling filter), center-cropped as a NumPy view, and then
+    rescaled and normalized in one table lookup per channel written straight
+    into the output batch. The lookup table is built with the same float
+    operations as transformers, so the values match it bit for bit.
+    """
+
+    def __init__(
+        self,
+        shortest_edge: int,
+        crop_size: Tuple[int, int],
+        image_mean: Sequence[float],
+        image_std: Sequence[float],
+        resample: int = Image.Resampling.BICUBIC,
+        rescale_factor: float = 1 / 255
+    ):
+        """
+        Initialize the preprocessor.
+
+        Args:
+            shortest_edge: Length of the shorter image side after resizing
+            crop_size: (height, width) of the center crop
+            image_mean: Per-channel normalization mean
+            image_std: Per-channel normalization standard deviation
+            resample: PIL resampling filter
+            rescale_factor: Factor mapping uint8 values to [0, 1]
+        """
+        if crop_size[0] > shortest_edge or crop_size[1] > shortest_edge:
+            raise ValueError(f"Crop {crop_size} is larger than the resized image ({shortest_edge})")
+        self.shortest_edge = shortest_edge
+        self.crop_size = crop_size
+        self.resample = resample
+
+        # (3, 256) table of normalized values for every uint8 level
+        levels = (np.arange(256, dtype=np.float64) * rescale_factor).astype(np.float32)
+        mean = np.asarray(image_mean, dtype=np.float32)[:, None]
+        std = np.asarray(image_std, dtype=np.float32)[:, None]
+        self._table = ((levels[None, :] - mean) / std).astype(np.float32)
+        self._buffers = threading.local()
+
+    @classmethod
+    def from_processor(cls, processor) -> "ClipPreprocessor":
+        """
+        Read the preprocessing settings of a CLIPProcessor or CLIPImageProcessor.
+
+        Args:
+            processor: HuggingFace processor
+
+        Returns:
+            ClipPreprocessor instance
+
+        Raises:
+            ValueError: If the processor uses settings this class does not reproduce
+        """
+        image_processor = getattr(processor, "image_processor", processor)
+        return cls.from_config({key: getattr(image_processor, key) for key in CONFIG_KEYS})
+
+    @classmethod
+    def from_config(cls, settings: Dict[str, Any]) -> "ClipPreprocessor":
+        """
+        Read the preprocessing settings of a preprocessor_config.json.
+
+        This needs no transformers install, so it also serves the ONNX backend.
+
+        Args:
+            settings: Parsed preprocessor_config.json of a CLIP model
+
+        Returns:
+            ClipPreprocessor instance
+
+        Raises:
+            ValueError: If the settings are ones this class does not reproduce
+        """
+        size = settings.get("size", {})
+        crop_size = settings.get("crop_size", {})
+        # Older configs store both sizes as plain integers
+        if isinstance(size, int):
+            size = {"shortest_edge": size}
+        if isinstance(crop_size, int):
+            crop_size = {"height": crop_size, "width": crop_size}
+        if not (
+            settings.get("do_resize", True) and settings.get("do_center_crop", True)
+            and settings.get("do_rescale", True) and settings.get("do_normalize", True)
+            and "shortest_edge" in size and "height" in crop_size
+        ):
+            raise ValueError("Unsupported CLIP preprocessing settings")
+        return cls(
+            shortest_edge=size["shortest_edge"],
+            crop_size=(crop_size["height"], crop_size["width"]),
+            image_mean=settings["image_mean"],
+            image_std=settings["image_std"],
+            resample=settings.get("resample", Image.Resampling.BICUBIC),
+            rescale_factor=settings.get("rescale_factor", 1 / 255)
+        )
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        """Shape of the pixel values of one image."""
+        return (3, *self.crop_size)
+
+    def __call__(self, images: List[Image.Image], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Convert images into CLIP pixel values.
+
+        Args:
+            images: List of PIL Image objects
+            out: Float32 array of shape (N, 3, H, W) to write into (allocated if None)
+
+        Returns:
+            Float32 pixel array of shape (N, 3, H, W)
+        """
+        if out is None:
+            out = np.empty((len(images), *self.shape), dtype=np.float32)
+        crop_height, crop_width = self.crop_size
+        for i, image in enumerate(images):
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            width, height = image.size
+            if width <= height:
+                size = (self.shortest_edge, int(self.shortest_edge * height / width))
+            else:
+                size = (int(self.shortest_edge * width / height), self.shortest_edge)
+            pixels = np.asarray(image.resize(size, resample=self.resample))
+            top = (size[1] - crop_height) // 2
+            left = (size[0] - crop_width) // 2
+            pixels = pixels[top:top + crop_height, left:left + crop_width]
+            for channel in range(3):
+                np.take(self._table[channel], pixels[:, :, channel], out=out[i, channel])
+        return out
+
+    def batch_buffer(self, size: int) -> np.ndarray:
+        """
+        Get a reusable pixel buffer owned by the calling thread.
+
+        The buffer is overwritten by the next call on the same thread, so its
+        contents must be consumed before then.
+
+        Args:
+            size: Number of images
+
+        Returns:
+            Float32 array of shape (size, 3, H, W)
+        """
+        buffer = getattr(self._buffers, "pixels", None)
+        if buffer is None or buffer.shape[0] < size:
+            buffer = np.empty((max(size, 1), *self.shape), dtype=np.float32)
+            self._buffers.pixels = buffer
+        return buffer[:size]
+
+    def max_difference(self, processor, images: List[Image.Image]) -> float:
+        """
+        Compare the output with a HuggingFace processor.
+
+        Args:
+            processor: CLIPProcessor or CLIPImageProcessor
+            images: Sample images
+
+        Returns:
+            Largest absolute difference between the pixel values
+        """
+        expected = processor(images=images, return_tensors="np")["pixel_values"]
+        actual = self(images)
+        if actual.shape != expected.shape:
+            return float("inf")
+        return float(np.abs(actual - expected).max())
@@ -1,10 +1,12 @@
 """
 MongoDB database service for managing product data.
 """
-from typing import List, Optional, Dict, Any
+import threading
+from typing import Callable, List, Optional, Dict, Any, Set
 from pymongo import MongoClient
 from pymongo.collection import Collection
 from pymongo.database import Database
+from pymongo.errors import OperationFailure
 import logging
 
 from config.settings import config
@@ -16,12 +18,22 @@ logger = logging.getLogger(__name__)
 class DatabaseService:
     """Service for MongoDB database operations."""
     
-    def __init__(self):
-        """Initialize database connection."""
+    # Filter matching products that can be indexed
+    IMAGE_QUERY = {"productImage": {"$exists": True, "$ne": None, "$ne": ""}}
+    
+    def __init__(self, collection: Optional[Collection] = None):
+        """
+        Initialize database connection.
+        
+        Args:
+            collection: Existing collection to use instead of connecting to
+                MONGO_URI (e.g. a mongomock collection for local testing)
+        """
         self._client: Optional[MongoClient] = None
         self._db: Optional[Database] = None
-        self._collection: Optional[Collection] = None
-        self._connect()
+        self._collection: Optional[Collection] = collection
+        if self._collection is None:
+            self._connect()
     
     def _connect(self) -> None:
         """Establish connection to MongoDB."""
@@ -81,9 +93,7 @@ class DatabaseService:
             List of products with images
         """
         try:
-            query = {
-                "productImage": {"$exists": True, "$ne": None, "$ne": ""}
-            }
+            query = self.IMAGE_QUERY
             
             if limit:
                 products = list(self._collection.find(query).limit(limit))
@@ -97,6 +107,32 @@ class DatabaseService:
             logger.error(f"Error retrieving products with images: {str(e)}")
             return []
     
+    def watch_products(
+        self,
+        on_upsert: Callable[[Dict[str, Any]], None],
+        on_delete: Callable[[str], None],
+        poll_interval: Optional[float] = None
+    ) -> "ProductWatcher":
+        """
+        Start a background watcher that reports product changes.
+        
+        Args:
+            on_upsert: Called with the full document of an inserted or updated product
+            on_delete: Called with the id of a deleted product
+            poll_interval: Seconds between polls when change streams are unavailable
+            
+        Returns:
+            Running ProductWatcher
+        """
+        watcher = ProductWatcher(
+            self._collection,
+            on_upsert,
+            on_delete,
+            poll_interval if poll_interval is not None else config.WATCH_POLL_INTERVAL
+        )
+        watcher.start()
+        return watcher
+    
     def close(self) -> None:
         """Close database connection."""
         if self._client:
@@ -104,6 +140,187 @@ class DatabaseService:
             logger.info("MongoDB connection closed")
 
 
+class ProductWatcher:
+    """Background thread that turns product changes into index mutations.
+    
+    Uses a MongoDB change stream when the server supports one (replica sets
+    and Atlas). A stream that fails after opening (network blip, failover)
+    is reopened from its resume token with exponential backoff; a backend
+    that cannot open a stream the first time (standalone mongod, mongomock),
+    or repeated failures, switches the watcher to polling. Polling finds new and deleted products by diffing
+    the set of ids and updated ones by their updatedAt timestamp, so edits
+    that do not bump updatedAt are missed until the next full refresh.
+    """
+    
+    # Consecutive change stream failures tolerated before falling back to polling
+    STREAM_RETRIES = 5
+    # Backoff between change stream retries, doubling from the first up to the cap
+    STREAM_BACKOFF_SECONDS = 1.0
+    STREAM_BACKOFF_MAX_SECONDS = 30.0
+    
+    def __init__(
+        self,
+        collection: Collection,
+        on_upsert: Callable[[Dict[str, Any]], None],
+        on_delete: Callable[[str], None],
+        poll_interval: float
+    ):
+        """
+        Initialize the watcher.
+        
+        Args:
+            collection: Product collection to watch
+            on_upsert: Called with the full document of an inserted or updated product
+            on_delete: Called with the id of a deleted product
+            poll_interval: Seconds between polls when change streams are unavailable
+        """
+        self._collection = collection
+        self._on_upsert = on_upsert
+        self._on_delete = on_delete
+        self.poll_interval = poll_interval
+        self.mode: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self) -> None:
+        """Start watching in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="product-watcher", daemon=True)
+        self._thread.start()
+    
+    def stop(self) -> None:
+        """Stop watching and wait for the thread to exit."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 5)
+    
+    def _run(self) -> None:
+        resume_token = None
+        failures = 0
+        while not self._stop.is_set():
+            opened = False
+            try:
+                for change in self._watch_change_stream(resume_token):
+                    opened = True
+                    failures = 0
+                    if change is not None:
+                        resume_token = change["_id"]
+                        self._dispatch_change(change)
+                return
+            except Exception as e:
+                if self._stop.is_set():
+                    return
+                if not opened and self.mode is None:
+                    # The backend never opened a stream: a standalone mongod rejects
+                    # it with OperationFailure, mongomock has no watch() at all
+                    logger.info(f"Change streams unavailable ({str(e)}), polling every {self.poll_interval}s")
+                    self._poll()
+                    return
+                if isinstance(e, OperationFailure) and resume_token is not None and not opened:
+                    # The resume point may have left the oplog; start from now
+                    logger.warning("Could not resume the change stream, changes in the gap may be missed")
+                    resume_token = None
+                error = e
+            
+            failures += 1
+            if failures > self.STREAM_RETRIES:
+                logger.warning(
+                    f"Change stream failed {failures} times in a row ({str(error)}), "
+                    f"polling every {self.poll_interval}s"
+                )
+                self._poll()
+                return
+            
+            delay = min(self.STREAM_BACKOFF_SECONDS * 2 ** (failures - 1), self.STREAM_BACKOFF_MAX_SECONDS)
+            logger.warning(f"Change stream failed ({str(error)}), retrying in {delay:.0f}s")
+            self._stop.wait(delay)
+    
+    def _watch_change_stream(self, resume_token: Optional[Dict[str, Any]]):
+        """
+        Open a change stream and yield its changes until stopped.
+        
+        Yields None whenever the server's await period passes without a
+        change, so the caller sees the stream is healthy and the stop flag
+        is checked without an extra sleep.
+        
+        Args:
+            resume_token: Token of the last applied change, to resume after it
+        """
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        with self._collection.watch(
+            pipeline,
+            full_document="updateLookup",
+            resume_after=resume_token,
+            max_await_time_ms=1000
+        ) as stream:
+            self.mode = "change_stream"
+            logger.info("Watching products with a change stream")
+            while not self._stop.is_set():
+                # Blocks on the server for up to max_await_time_ms
+                yield stream.try_next()
+    
+    def _dispatch_change(self, change: Dict[str, Any]) -> None:
+        try:
+            product_id = str(change["documentKey"]["_id"])
+            document = change.get("fullDocument")
+            if change["operationType"] == "delete" or document is None:
+                self._on_delete(product_id)
+            else:
+                self._on_upsert(document)
+        except Exception as e:
+            logger.error(f"Error applying product change: {str(e)}")
+    
+    def _poll(self) -> None:
+        self.mode = "polling"
+        known_ids = self._current_ids()
+        last_updated = self._latest_update()
+        
+        while not self._stop.wait(self.poll_interval):
+            try:
+                current_ids = self._current_ids()
+                for product_id in known_ids - current_ids:
+                    self._on_delete(product_id)
+                
+                changed: Dict[str, Dict[str, Any]] = {}
+                new_ids = current_ids - known_ids
+                if new_ids:
+                    from bson import ObjectId
+                    for document in self._collection.find(
+                        {"_id": {"$in": [ObjectId(i) if ObjectId.is_valid(i) else i for i in new_ids]}}
+                    ):
+                        changed[str(document["_id"])] = document
+                
+                if last_updated is not None:
+                    query = {"$and": [DatabaseService.IMAGE_QUERY, {"updatedAt": {"$gt": last_updated}}]}
+                    for document in self._collection.find(query):
+                        changed[str(document["_id"])] = document
+                
+                for document in changed.values():
+                    updated_at = document.get("updatedAt")
+                    if updated_at is not None and (last_updated is None or updated_at > last_updated):
+                        last_updated = updated_at
+                    self._on_upsert(document)
+                
+                known_ids = current_ids
+            except Exception as e:
+                logger.error(f"Error polling product changes: {str(e)}")
+    
+    def _current_ids(self) -> Set[str]:
+        return {
+            str(document["_id"])
+            for document in self._collection.find(DatabaseService.IMAGE_QUERY, {"_id": 1})
+        }
+    
+    def _latest_update(self) -> Optional[Any]:
+        latest = list(
+            self._collection.find({"updatedAt": {"$exists": True}}, {"updatedAt": 1})
+            .sort("updatedAt", -1)
+            .limit(1)
+        )
+        return latest[0]["updatedAt"] if latest else None
+
+
 # Singleton instance
 _db_service: Optional[DatabaseService] = None
 
@@ -0,0 +1,183 @@
+"""
+Memory-bounded LRU cache for embeddings.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """LRU cache of embedding vectors bounded by their total size in bytes.
+
+    Entries evicted from memory are optionally written to a spill directory
+    and loaded back on the next lookup instead of being recomputed. With a
+    TTL, in-memory entries also expire that many seconds after being stored.
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: str = "", ttl: float = 0):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Maximum bytes of vector data kept in memory
+            spill_dir: Directory for evicted entries (empty disables spilling)
+            ttl: Seconds an entry stays valid (0 for no expiry)
+        """
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._expires_at: Dict[str, float] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.spill_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def dim(self) -> Optional[int]:
+        """Length of the cached vectors, taken from the most recent entry."""
+        with self._lock:
+            if not self._entries:
+                return None
+            return next(reversed(self._entries.values())).shape[-1]
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Look up an embedding, marking it as recently used.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Embedding or None if not cached
+        """
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None and self.ttl and self._expires_at[key] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        vector = self._load_spilled(key)
+        if vector is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.spill_hits += 1
+        self.put(key, vector)
+        return vector
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        """
+        Store an embedding, evicting least recently used entries if needed.
+
+        Args:
+            key: Cache key
+            vector: Embedding to store
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.nbytes > self.max_bytes:
+            return
+
+        evicted = []
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = vector
+            self._bytes += vector.nbytes
+            if self.ttl:
+                self._expires_at[key] = time.monotonic() + self.ttl
+
+            while self._bytes > self.max_bytes:
+                old_key = next(iter(self._entries))
+                evicted.append((old_key, self._remove(old_key)))
+                self.evictions += 1
+
+        for old_key, old_vector in evicted:
+            self._spill(old_key, old_vector)
+
+    def clear(self) -> None:
+        """Drop all in-memory entries (spilled files are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._expires_at.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dictionary of counters and sizes
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "spill_hits": self.spill_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "ttl_seconds": self.ttl,
+            }
+
+    def _remove(self, key: str) -> Optional[np.ndarray]:
+        """Drop an in-memory entry; the caller holds the lock."""
+        vector = self._entries.pop(key, None)
+        if vector is not None:
+            self._bytes -= vector.nbytes
+            self._expires_at.pop(key, None)
+        return vector
+
+    def _spill_path(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.npy")
+
+    def _spill(self, key: str, vector: np.ndarray) -> None:
+        """Write an evicted entry to the spill directory."""
+        if not self.spill_dir:
+            return
+        path = self._spill_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            np.save(path, vector)
+        except Exception as e:
+            logger.warning(f"Could not spill embedding to disk: {str(e)}")
+
+    def _load_spilled(self, key: str) -> Optional[np.ndarray]:
+        """Read an entry back from the spill directory."""
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            return np.load(path)
+        except Exception as e:
+            logger.warning(f"Could not read spilled embedding: {str(e)}")
+            return None
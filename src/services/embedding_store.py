@@ -0,0 +1,192 @@
+"""
+Persistent on-disk store for product embeddings.
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStore:
+    """Float32 embedding matrix stored as a memory-mapped .npy file.
+
+    A JSON sidecar records the product id and image URL hash of every row,
+    stamped with the model name, so embeddings are only reused when both the
+    image and the model that produced them are unchanged.
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    META_FILE = "meta.json"
+
+    def __init__(self, directory: str, model_name: str):
+        """
+        Initialize the store (nothing is read until open() is called).
+
+        Args:
+            directory: Directory holding the store files
+            model_name: Name of the model the embeddings must come from
+        """
+        self.directory = directory
+        self.model_name = model_name
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._rows: Dict[str, Tuple[int, str]] = {}
+        self._opened = False
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.directory, self.VECTORS_FILE)
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, self.META_FILE)
+
+    @property
+    def ids(self) -> List[str]:
+        """Product ids, parallel to the rows of vectors."""
+        self.open()
+        return self._ids
+
+    @property
+    def vectors(self) -> Optional[np.ndarray]:
+        """Read-only memory-mapped N x D matrix, or None if the store is empty."""
+        self.open()
+        return self._vectors
+
+    def __len__(self) -> int:
+        self.open()
+        return len(self._ids)
+
+    @staticmethod
+    def hash_url(image_url: str) -> str:
+        """
+        Hash an image URL for change detection.
+
+        Args:
+            image_url: URL of the image
+
+        Returns:
+            Hex digest of the URL
+        """
+        return hashlib.sha1(image_url.encode("utf-8")).hexdigest()
+
+    def open(self) -> None:
+        """Open the store files if present and valid for the current model."""
+        if self._opened:
+            return
+        self._opened = True
+        self._vectors = None
+        self._ids = []
+        self._rows = {}
+
+        if not (os.path.exists(self.meta_path) and os.path.exists(self.vectors_path)):
+            logger.info(f"No embedding store found in {self.directory}")
+            return
+
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+            if meta.get("model_name") != self.model_name:
+                logger.warning(
+                    f"Embedding store was built with {meta.get('model_name')}, "
+                    f"not {self.model_name} - ignoring it"
+                )
+                return
+
+            vectors = np.load(self.vectors_path, mmap_mode="r")
+            ids = meta.get("ids", [])
+            url_hashes = meta.get("url_hashes", [])
+            if vectors.ndim != 2 or vectors.shape[0] != len(ids) or len(ids) != len(url_hashes):
+                logger.warning("Embedding store files are inconsistent - ignoring them")
+                return
+
+            self._vectors = vectors
+            self._ids = list(ids)
+            self._rows = {
+                product_id: (row, url_hash)
+                for row, (product_id, url_hash) in enumerate(zip(ids, url_hashes))
+            }
+            logger.info(f"Opened embedding store with {len(self._ids)} vectors")
+        except Exception as e:
+            logger.error(f"Error opening embedding store: {str(e)}")
+            self._vectors = None
+            self._ids = []
+            self._rows = {}
+
+    def lookup(self, product_id: str, image_url: str) -> Optional[np.ndarray]:
+        """
+        Get a stored embedding if it matches the product's current image.
+
+        Args:
+            product_id: Product ID
+            image_url: Current image URL of the product
+
+        Returns:
+            Embedding or None if missing or stale
+        """
+        self.open()
+        entry = self._rows.get(product_id)
+        if entry is None:
+            return None
+
+        row, url_hash = entry
+        if url_hash != self.hash_url(image_url):
+            return None
+        return self._vectors[row]
+
+    def save(
+        self,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        image_urls: Sequence[str]
+    ) -> bool:
+        """
+        Replace the store contents and reopen it memory-mapped.
+
+        Args:
+            ids: Product ids, one per row of vectors
+            vectors: N x D matrix of normalized embeddings
+            image_urls: Image URL of each product
+
+        Returns:
+            True if the store was written
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            vectors_tmp = self.vectors_path + ".tmp"
+            meta_tmp = self.meta_path + ".tmp"
+
+            out = np.lib.format.open_memmap(
+                vectors_tmp, mode="w+", dtype=np.float32, shape=vectors.shape
+            )
+            out[:] = vectors
+            out.flush()
+            del out
+
+            meta = {
+                "model_name": self.model_name,
+                "dim": int(vectors.shape[1]),
+                "count": len(ids),
+                "ids": [str(product_id) for product_id in ids],
+                "url_hashes": [self.hash_url(url) for url in image_urls],
+            }
+            with open(meta_tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+            # Release our own mapping before swapping files in
+            self._vectors = None
+            os.replace(vectors_tmp, self.vectors_path)
+            os.replace(meta_tmp, self.meta_path)
+            logger.info(f"Saved {len(ids)} embeddings to {self.directory}")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving embedding store: {str(e)}")
+            return False
+        finally:
+            self._opened = False
+            self.open()
@@ -2,18 +2,30 @@
 Image feature extraction service using CLIP model.
 """
 import gc
+import io
 import logging
-from typing import Optional, List
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, List
 import numpy as np
 from PIL import Image
-import torch
-from transformers import CLIPProcessor, CLIPModel
 
 from config.settings import config
+from services.batch_scheduler import MicroBatcher
+from services.clip_preprocessor import ClipPreprocessor
 from utils.image_utils import ImageProcessor
 
+# torch and transformers are imported where they are used, so the ONNX
+# backend can serve without loading PyTorch
+if TYPE_CHECKING:
+    import torch
+
 logger = logging.getLogger(__name__)
 
+# Largest allowed difference between the vectorized and HuggingFace pixel values
+PREPROCESS_PARITY_TOLERANCE = 1e-5
+
 
 class FeatureExtractor:
     """Service for extracting image features using CLIP model."""
@@ -22,10 +34,39 @@ class FeatureExtractor:
         """Initialize CLIP model and processor."""
         self.device = config.DEVICE
         self.model_name = config.MODEL_NAME
-        self.model: Optional[CLIPModel] = None
-        self.processor: Optional[CLIPProcessor] = None
+        self.backend = config.INFERENCE_BACKEND.lower()
+        if self.backend not in ("torch", "onnx"):
+            raise ValueError(f"Unknown inference backend: {self.backend}")
+        self.quantization = config.MODEL_QUANTIZATION.lower()
+        if self.quantization not in ("none", "dynamic_int8"):
+            raise ValueError(f"Unknown model quantization: {self.quantization}")
+        if self.quantization != "none" and (self.device != "cpu" or self.backend != "torch"):
+            logger.warning(
+                "Dynamic int8 quantization needs the torch backend on CPU, using float32 instead"
+            )
+            self.quantization = "none"
+        self.model = None
+        self.processor = None
+        # Vectorized replacement for self.processor on the hot path
+        self.preprocessor: Optional[ClipPreprocessor] = None
+        # ONNX Runtime session used instead of self.model by the onnx backend
+        self.encoder = None
+        # Torch backend: image encoder (eager, traced or compiled) and its options
+        self.compile_mode = config.TORCH_COMPILE_MODE.lower()
+        if self.compile_mode not in ("none", "trace", "compile"):
+            raise ValueError(f"Unknown torch compile mode: {self.compile_mode}")
+        self._torch_encoder = None
+        self._bf16 = False
+        self._channels_last = config.TORCH_CHANNELS_LAST
+        # Quantized mode loads only the vision tower and its projection
+        self._vision_only = self.quantization != "none"
         self.image_processor = ImageProcessor()
         self._model_loaded = False
+        self._load_lock = threading.Lock()
+        # Coalesces concurrent query images into shared forward passes
+        self.batcher: Optional[MicroBatcher] = (
+            MicroBatcher(self) if config.MICRO_BATCH_ENABLED else None
+        )
         
         # Only load immediately if not using lazy loading
         if not config.LAZY_LOAD_MODEL:
@@ -36,29 +77,255 @@ class FeatureExtractor:
         if self._model_loaded:
             return
             
-        try:
-            logger.info(f"Loading CLIP model: {self.model_name}")
-            # Use low_cpu_mem_usage to reduce memory footprint during loading
-            self.model = CLIPModel.from_pretrained(
-                self.model_name,
-                low_cpu_mem_usage=True,
-                torch_dtype=torch.float32  # Use float32 for CPU
-            )
-            self.processor = CLIPProcessor.from_pretrained(self.model_name)
-            
-            # Move model to device
-            self.model.to(self.device)
-            self.model.eval()
+        with self._load_lock:
+            if self._model_loaded:
+                return
             
-            # Enable memory efficient inference
-            if hasattr(torch, 'inference_mode'):
-                torch.set_grad_enabled(False)
+            try:
+                logger.info(f"Loading CLIP model: {self.model_name} ({self.backend} backend)")
+                if self.backend == "onnx":
+                    from services.onnx_encoder import load_onnx_encoder, load_preprocessor_config
+                    
+                    # Preprocessing settings come from the exported JSON, so
+                    # transformers is never imported by this backend
+                    self.encoder = load_onnx_encoder(self.model_name)
+                    self.preprocessor = ClipPreprocessor.from_config(
+                        load_preprocessor_config(self.encoder.path)
+                    )
+                    self._model_loaded = True
+                    logger.info(f"ONNX image encoder loaded from {self.encoder.path}")
+                    return
+                
+                import torch
+                from transformers import CLIPImageProcessor, CLIPModel, CLIPProcessor
+                
+                if self._vision_only:
+                    self.model = self._quantize(self._load_vision_model())
+                    # The tokenizer is not needed without the text tower
+                    self.processor = CLIPImageProcessor.from_pretrained(self.model_name)
+                else:
+                    # Use low_cpu_mem_usage to reduce memory footprint during loading
+                    self.model = CLIPModel.from_pretrained(
+                        self.model_name,
+                        low_cpu_mem_usage=True,
+                        torch_dtype=torch.float32  # Use float32 for CPU
+                    )
+                    self.processor = CLIPProcessor.from_pretrained(self.model_name)
+                    
+                    # Move model to device
+                    self.model.to(self.device)
+                    self.model.eval()
+                
+                # Enable memory efficient inference
+                if hasattr(torch, 'inference_mode'):
+                    torch.set_grad_enabled(False)
+                
+                self._bf16 = config.TORCH_BF16 and self._bf16_supported()
+                if self._channels_last:
+                    self.model.to(memory_format=torch.channels_last)
+                self._torch_encoder = self._build_torch_encoder()
+                self.preprocessor = self._build_preprocessor()
+                
+                self._model_loaded = True
+                logger.info(
+                    f"CLIP model loaded successfully on {self.device} "
+                    f"(quantization: {self.quantization}, compile: {self.compile_mode}, "
+                    f"bf16: {self._bf16}, channels_last: {self._channels_last}, "
+                    f"{self.model_size_bytes(self.model) / 2**20:.1f} MB)"
+                )
+            except Exception as e:
+                logger.error(f"Error loading CLIP model: {str(e)}")
+                raise
+    
+    @property
+    def model_signature(self) -> str:
+        """Identifies the embedding space, so stored vectors are not mixed across models."""
+        if self.quantization == "none":
+            return self.model_name
+        return f"{self.model_name}+{self.quantization}"
+    
+    @property
+    def embedding_dim(self) -> Optional[int]:
+        """Length of the image embeddings, or None if it is not known without running the model."""
+        self._load_model()
+        if self.backend == "onnx":
+            return self.encoder.output_dim
+        return getattr(self.model.config, "projection_dim", None)
+    
+    def _load_vision_model(self) -> "torch.nn.Module":
+        """Load the float32 CLIP vision tower with its projection head."""
+        import torch
+        from transformers import CLIPVisionModelWithProjection
+        
+        model = CLIPVisionModelWithProjection.from_pretrained(
+            self.model_name,
+            low_cpu_mem_usage=True,
+            torch_dtype=torch.float32
+        )
+        model.to(self.device)
+        model.eval()
+        return model
+    
+    def _quantize(self, model: "torch.nn.Module") -> "torch.nn.Module":
+        """Apply dynamic int8 quantization to the linear layers of a vision model."""
+        import torch
+        
+        engines = torch.backends.quantized.supported_engines
+        for engine in ("fbgemm", "qnnpack"):
+            if engine in engines:
+                torch.backends.quantized.engine = engine
+                break
+        
+        # Weights are stored as int8; activations are quantized per batch at runtime
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    
+    def _image_embeddings(self, model: "torch.nn.Module", pixels: "torch.Tensor") -> "torch.Tensor":
+        """Run the image encoder of a full CLIP model or a vision-only model."""
+        from transformers import CLIPVisionModelWithProjection
+        
+        if isinstance(model, CLIPVisionModelWithProjection):
+            return model(pixel_values=pixels).image_embeds
+        return model.get_image_features(pixel_values=pixels)
+    
+    def _bf16_supported(self) -> bool:
+        """Check whether bf16 autocast is worthwhile for the loaded model."""
+        import torch
+        
+        if self.device != "cpu":
+            return False
+        if self.quantization != "none":
+            logger.warning("bf16 autocast is not combined with int8 quantization")
+            return False
+        # Native bf16 matmuls need AVX512-BF16 or AMX; elsewhere bf16 is emulated and slower
+        for check in ("_is_avx512_bf16_supported", "_is_amx_tile_supported"):
+            supported = getattr(torch.cpu, check, None)
+            if supported is not None and supported():
+                return True
+        logger.warning("CPU has no native bf16 support, running in float32")
+        return False
+    
+    def _image_size(self) -> int:
+        """Input resolution of the vision tower."""
+        model_config = self.model.config
+        return getattr(model_config, "vision_config", model_config).image_size
+    
+    def _build_torch_encoder(self) -> "torch.nn.Module":
+        """
+        Wrap the model's image encoder, trace or compile it, and warm it up.
+        
+        Returns:
+            Module mapping pixel values to unnormalized image embeddings
+        """
+        import torch
+        from transformers import CLIPVisionModelWithProjection
+        
+        vision_only = isinstance(self.model, CLIPVisionModelWithProjection)
+        
+        class ImageEncoder(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
             
-            self._model_loaded = True
-            logger.info(f"CLIP model loaded successfully on {self.device}")
+            def forward(self, pixel_values):
+                if vision_only:
+                    return self.model(pixel_values=pixel_values).image_embeds
+                return self.model.get_image_features(pixel_values=pixel_values)
+        
+        encoder = ImageEncoder(self.model).eval()
+        size = self._image_size()
+        example = self._to_device(torch.zeros(config.MAX_BATCH_SIZE, 3, size, size))
+        
+        def warm_up(module):
+            # Warm up once so the first request does not pay for compilation and allocation
+            with torch.inference_mode(), self._autocast():
+                module(example)
+                module(example[:1])
+        
+        started = time.perf_counter()
+        try:
+            if self.compile_mode == "trace":
+                with torch.no_grad(), self._autocast():
+                    traced = torch.jit.trace(encoder, example, check_trace=False)
+                encoder = torch.jit.freeze(traced.eval())
+            elif self.compile_mode == "compile":
+                encoder = torch.compile(encoder, dynamic=True)
+            # torch.compile only reports most failures on the first call
+            warm_up(encoder)
         except Exception as e:
-            logger.error(f"Error loading CLIP model: {str(e)}")
-            raise
+            if self.compile_mode == "none":
+                raise
+            logger.warning(f"Could not {self.compile_mode} the image encoder, using eager mode: {str(e)}")
+            encoder = ImageEncoder(self.model).eval()
+            warm_up(encoder)
+        logger.info(f"Image encoder warmed up in {time.perf_counter() - started:.2f}s")
+        return encoder
+    
+    def _build_preprocessor(self) -> Optional[ClipPreprocessor]:
+        """
+        Create the vectorized preprocessor and check it against the HuggingFace processor.
+        
+        Returns:
+            ClipPreprocessor, or None to keep using the HuggingFace processor
+        """
+        if not config.FAST_PREPROCESS:
+            return None
+        
+        try:
+            preprocessor = ClipPreprocessor.from_processor(self.processor)
+            # Random images in portrait, landscape, square and non-RGB shapes
+            rng = np.random.default_rng(0)
+            samples = [
+                Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+                for height, width in ((480, 360), (300, 500), (224, 224), (97, 1013))
+            ]
+            samples.append(samples[0].convert("L"))
+            max_diff = preprocessor.max_difference(self.processor, samples)
+        except Exception as e:
+            logger.warning(f"Vectorized preprocessing unavailable, using the HuggingFace processor: {str(e)}")
+            return None
+        
+        if max_diff > PREPROCESS_PARITY_TOLERANCE:
+            logger.warning(
+                f"Vectorized preprocessing differs from the HuggingFace processor by {max_diff:.2e}, "
+                f"using the HuggingFace processor"
+            )
+            return None
+        
+        logger.info(f"Vectorized preprocessing enabled (max difference: {max_diff:.2e})")
+        return preprocessor
+    
+    def _autocast(self):
+        """bf16 autocast context when enabled, otherwise a no-op context."""
+        import torch
+        return torch.autocast("cpu", dtype=torch.bfloat16, enabled=self._bf16)
+    
+    def _to_device(self, pixels: "torch.Tensor") -> "torch.Tensor":
+        """Move pixel values to the model device in the configured memory format."""
+        import torch
+        
+        pixels = pixels.to(self.device)
+        if self._channels_last:
+            pixels = pixels.contiguous(memory_format=torch.channels_last)
+        return pixels
+    
+    @staticmethod
+    def model_size_bytes(model: "torch.nn.Module") -> int:
+        """
+        Get the serialized size of a model's weights.
+        
+        Args:
+            model: PyTorch module
+            
+        Returns:
+            Size in bytes (includes packed quantized weights, unlike parameters())
+        """
+        import torch
+        
+        buffer = io.BytesIO()
+        torch.save(model.state_dict(), buffer)
+        return buffer.tell()
     
     def extract_features_from_image(self, image: Image.Image) -> Optional[np.ndarray]:
         """
@@ -75,23 +342,20 @@ class FeatureExtractor:
             if not self._model_loaded:
                 self._load_model()
             
-            # Process image
-            inputs = self.processor(images=image, return_tensors="pt")
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            # Extract features with memory efficient inference
-            with torch.no_grad():
-                image_features = self.model.get_image_features(**inputs)
+            if self.batcher is not None:
+                return self.batcher.embed(image)
             
-            # Normalize features
-            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-            
-            # Convert to numpy and clear GPU memory if needed
-            features = image_features.cpu().numpy().flatten()
+            # Process image and extract normalized features
+            image_features = self.extract_features_from_pixels(
+                self.preprocess([image], reuse_buffer=True)
+            )
+            if image_features is None:
+                return None
+            features = image_features[0]
             
-            # Clean up tensors
-            del inputs, image_features
+            # Clear GPU memory if needed
             if self.device != "cpu":
+                import torch
                 torch.cuda.empty_cache()
             
             # Force garbage collection if enabled
@@ -147,6 +411,82 @@ class FeatureExtractor:
             logger.error(f"Error extracting features from bytes: {str(e)}")
             return None
     
+    def preprocess(self, images: List[Image.Image], reuse_buffer: bool = False) -> np.ndarray:
+        """
+        Convert images into CLIP pixel values.
+        
+        Args:
+            images: List of PIL Image objects
+            reuse_buffer: Write into the calling thread's reusable batch buffer
+                instead of a new array; the result is only valid until the next
+                reusing call on the same thread
+            
+        Returns:
+            Float32 pixel array of shape (N, 3, H, W)
+        """
+        if not self._model_loaded:
+            self._load_model()
+        
+        if self.preprocessor is not None:
+            out = self.batch_buffer(len(images)) if reuse_buffer else None
+            return self.preprocessor(images, out=out)
+        return self.processor(images=images, return_tensors="np")["pixel_values"]
+    
+    def batch_buffer(self, size: int) -> Optional[np.ndarray]:
+        """
+        Get the calling thread's reusable pixel buffer for assembling a batch.
+        
+        Only batches up to MAX_BATCH_SIZE are buffered; larger ones (such as a
+        /search/batch request) get a fresh array that is freed afterwards, so
+        one big request does not pin its buffer on the thread for good.
+        
+        Args:
+            size: Number of images
+            
+        Returns:
+            Float32 array of shape (size, 3, H, W), or None to allocate a new
+            array (no vectorized preprocessing, or a batch above the cap)
+        """
+        if self.preprocessor is None or size > config.MAX_BATCH_SIZE:
+            return None
+        return self.preprocessor.batch_buffer(size)
+    
+    def extract_features_from_pixels(self, pixel_values: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Extract features from preprocessed pixel values.
+        
+        Args:
+            pixel_values: Float32 pixel array of shape (N, 3, H, W)
+            
+        Returns:
+            Feature matrix as numpy array (N x D) or None if failed
+        """
+        try:
+            if not self._model_loaded:
+                self._load_model()
+            
+            if self.encoder is not None:
+                # The exported graph already normalizes the embeddings
+                return self.encoder(pixel_values)
+            
+            import torch
+            
+            # Extract features without autograd bookkeeping
+            with torch.inference_mode():
+                pixels = self._to_device(torch.from_numpy(pixel_values))
+                with self._autocast():
+                    image_features = self._torch_encoder(pixels)
+                
+                # Normalize features in float32, also after bf16 autocast
+                image_features = image_features.float()
+                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+                
+                # Convert to numpy
+                return image_features.cpu().numpy()
+        except Exception as e:
+            logger.error(f"Error extracting features from pixels: {str(e)}")
+            return None
+    
     def extract_batch_features(self, images: List[Image.Image]) -> Optional[np.ndarray]:
         """
         Extract features from multiple images in batch.
@@ -161,25 +501,86 @@ class FeatureExtractor:
             if not images:
                 return None
             
-            # Process batch
-            inputs = self.processor(images=images, return_tensors="pt", padding=True)
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            # Extract features
-            with torch.no_grad():
-                image_features = self.model.get_image_features(**inputs)
+            # Process batch into this thread's reusable buffer
+            pixel_values = self.preprocess(images, reuse_buffer=True)
             
-            # Normalize features
-            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-            
-            # Convert to numpy
-            features = image_features.cpu().numpy()
-            
-            return features
+            return self.extract_features_from_pixels(pixel_values)
         except Exception as e:
             logger.error(f"Error extracting batch features: {str(e)}")
             return None
 
+    
+    def drift_report(self, images: List[Image.Image], top_k: int = 10) -> Dict[str, Any]:
+        """
+        Compare embeddings of the serving model with the float32 model.
+        
+        The float32 vision model is loaded temporarily for the comparison.
+        
+        Args:
+            images: Sample images
+            top_k: Number of neighbours compared within the sample
+            
+        Returns:
+            Cosine agreement, top-k neighbour overlap, model sizes and latencies
+        """
+        import torch
+        
+        pixel_values = self.preprocess(images)
+        pixels = torch.from_numpy(pixel_values).to(self.device)
+        
+        started = time.perf_counter()
+        served = self.extract_features_from_pixels(pixel_values)
+        served_seconds = time.perf_counter() - started
+        
+        reference_model = self._load_vision_model()
+        try:
+            started = time.perf_counter()
+            with torch.no_grad():
+                reference = self._image_embeddings(reference_model, pixels)
+            reference_seconds = time.perf_counter() - started
+            reference = (reference / reference.norm(dim=-1, keepdim=True)).cpu().numpy()
+            reference_bytes = self.model_size_bytes(reference_model)
+        finally:
+            del reference_model
+            gc.collect()
+        
+        if served is None:
+            raise RuntimeError("Serving model failed to embed the sample images")
+        
+        # Per-image cosine between the two embeddings of the same image
+        agreement = np.sum(served * reference, axis=1)
+        
+        # Overlap of each image's nearest neighbours within the sample
+        k = min(top_k, len(images) - 1)
+        overlap = None
+        if k > 0:
+            served_scores = served @ served.T
+            reference_scores = reference @ reference.T
+            np.fill_diagonal(served_scores, -np.inf)
+            np.fill_diagonal(reference_scores, -np.inf)
+            served_top = np.argpartition(-served_scores, k - 1, axis=1)[:, :k]
+            reference_top = np.argpartition(-reference_scores, k - 1, axis=1)[:, :k]
+            overlap = float(np.mean([
+                len(set(a) & set(b)) / k for a, b in zip(served_top, reference_top)
+            ]))
+        
+        return {
+            "backend": self.backend,
+            "quantization": self.quantization,
+            "images": len(images),
+            "top_k": k,
+            "cosine_mean": round(float(agreement.mean()), 5),
+            "cosine_min": round(float(agreement.min()), 5),
+            "top_k_overlap": None if overlap is None else round(overlap, 4),
+            "model_bytes": (
+                os.path.getsize(self.encoder.path) if self.encoder is not None
+                else self.model_size_bytes(self.model)
+            ),
+            "reference_model_bytes": reference_bytes,
+            "ms_per_image": round(1000 * served_seconds / len(images), 2),
+            "reference_ms_per_image": round(1000 * reference_seconds / len(images), 2),
+        }
+
 
 # Singleton instance
 _feature_extractor: Optional[FeatureExtractor] = None
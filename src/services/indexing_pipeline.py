@@ -0,0 +1,273 @@
+"""
+Pipelined catalog indexing: download, decode/preprocess and batched inference.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+from config.settings import config
+from services.phash_index import dhash
+from utils.image_utils import ImageProcessor
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class StageStats:
+    """Throughput counters for one pipeline stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the stage counters.
+
+        Returns:
+            Dictionary with item counts, busy time and items per second
+        """
+        return {
+            "items": self.items,
+            "failures": self.failures,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items_per_second": (
+                round(self.items / self.busy_seconds, 2) if self.busy_seconds > 0 else None
+            ),
+        }
+
+
+class IndexingPipeline:
+    """Three-stage producer/consumer pipeline for embedding catalog images.
+
+    Downloads run concurrently on ImageProcessor's fetch pool, decode and
+    preprocess run in their own thread, and the calling thread runs batched
+    CLIP inference. Stages are connected by bounded queues, so at most a few
+    batches of images are in memory at once.
+    """
+
+    def __init__(
+        self,
+        feature_extractor,
+        image_processor: Optional[ImageProcessor] = None,
+        batch_size: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        compute_hashes: bool = False
+    ):
+        """
+        Initialize the pipeline.
+
+        Args:
+            feature_extractor: FeatureExtractor used for preprocessing and inference
+            image_processor: ImageProcessor used for downloads and decoding
+            batch_size: Images per forward pass (default from config)
+            queue_size: Capacity of each inter-stage queue (default from config)
+            compute_hashes: Also compute the perceptual hash of each decoded image
+        """
+        self.feature_extractor = feature_extractor
+        self.image_processor = image_processor or feature_extractor.image_processor
+        self.batch_size = max(1, batch_size or config.MAX_BATCH_SIZE)
+        self.queue_size = max(1, queue_size or config.INDEXING_QUEUE_SIZE)
+        self.compute_hashes = compute_hashes
+        self.stats: Dict[str, StageStats] = {}
+        # product_id -> dHash of the image, filled by the last run when enabled
+        self.hashes: Dict[str, int] = {}
+
+    def run(self, items: Iterable[Tuple[str, str]]) -> Dict[str, np.ndarray]:
+        """
+        Embed the images of many products.
+
+        Args:
+            items: (product_id, image_url) pairs
+
+        Returns:
+            Mapping of product_id to feature vector for every image that succeeded
+        """
+        self.stats = {
+            name: StageStats(name) for name in ("download", "preprocess", "inference")
+        }
+        self.hashes = {}
+        downloaded: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        preprocessed: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+
+        workers = [
+            threading.Thread(
+                target=self._download_stage, args=(items, downloaded, stop),
+                name="indexing-download", daemon=True
+            ),
+            threading.Thread(
+                target=self._preprocess_stage, args=(downloaded, preprocessed, stop),
+                name="indexing-preprocess", daemon=True
+            ),
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+
+        try:
+            features = self._inference_stage(preprocessed)
+        finally:
+            stop.set()
+            # Unblock producers waiting on a full queue
+            for q in (downloaded, preprocessed):
+                self._drain(q)
+            for worker in workers:
+                worker.join()
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Indexed {len(features)} images in {elapsed:.2f}s "
+            + ", ".join(
+                f"{name}: {stats.items} ok/{stats.failures} failed "
+                f"({stats.to_dict()['items_per_second']}/s)"
+                for name, stats in self.stats.items()
+            )
+        )
+        return features
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get per-stage statistics of the last run.
+
+        Returns:
+            Dictionary of stage name to counters
+        """
+        return {name: stats.to_dict() for name, stats in self.stats.items()}
+
+    def _download_stage(
+        self,
+        items: Iterable[Tuple[str, str]],
+        output: queue.Queue,
+        stop: threading.Event
+    ) -> None:
+        stats = self.stats["download"]
+        try:
+            # Several products may share an image; it is downloaded once
+            products_by_url: Dict[str, List[str]] = {}
+            for product_id, image_url in items:
+                products_by_url.setdefault(image_url, []).append(product_id)
+
+            downloads = self.image_processor.iter_fetch_image_bytes(products_by_url)
+            started = time.perf_counter()
+            for image_url, image_bytes in downloads:
+                stats.busy_seconds += time.perf_counter() - started
+                if image_bytes is None:
+                    stats.failures += len(products_by_url[image_url])
+                else:
+                    stats.items += len(products_by_url[image_url])
+                    for product_id in products_by_url[image_url]:
+                        self._put(output, (product_id, image_bytes), stop)
+                if stop.is_set():
+                    downloads.close()
+                    break
+                started = time.perf_counter()
+        except Exception as e:
+            logger.error(f"Error in indexing download stage: {str(e)}")
+        finally:
+            self._put(output, _DONE, stop)
+
+    def _preprocess_stage(
+        self,
+        input_queue: queue.Queue,
+        output: queue.Queue,
+        stop: threading.Event
+    ) -> None:
+        stats = self.stats["preprocess"]
+        try:
+            while True:
+                item = self._get(input_queue, stop)
+                if item is _DONE:
+                    break
+                product_id, image_bytes = item
+                started = time.perf_counter()
+                try:
+                    image = self.image_processor.load_image_from_bytes(image_bytes)
+                    pixel_values = (
+                        self.feature_extractor.preprocess([image]) if image is not None else None
+                    )
+                    if pixel_values is not None and self.compute_hashes:
+                        self.hashes[product_id] = dhash(image)
+                except Exception as e:
+                    logger.error(f"Error preprocessing image for product {product_id}: {str(e)}")
+                    pixel_values = None
+                stats.busy_seconds += time.perf_counter() - started
+                if pixel_values is None:
+                    stats.failures += 1
+                    continue
+                stats.items += 1
+                self._put(output, (product_id, pixel_values), stop)
+        finally:
+            self._put(output, _DONE, stop)
+
+    def _inference_stage(self, input_queue: queue.Queue) -> Dict[str, np.ndarray]:
+        stats = self.stats["inference"]
+        features: Dict[str, np.ndarray] = {}
+        batch_ids: List[str] = []
+        batch_pixels: List[Any] = []
+
+        def flush() -> None:
+            if not batch_ids:
+                return
+            started = time.perf_counter()
+            pixel_values = np.concatenate(
+                batch_pixels, axis=0, out=self.feature_extractor.batch_buffer(len(batch_ids))
+            )
+            vectors = self.feature_extractor.extract_features_from_pixels(pixel_values)
+            stats.busy_seconds += time.perf_counter() - started
+            if vectors is None:
+                stats.failures += len(batch_ids)
+            else:
+                stats.items += len(batch_ids)
+                features.update(zip(batch_ids, vectors))
+            batch_ids.clear()
+            batch_pixels.clear()
+
+        while True:
+            item = input_queue.get()
+            if item is _DONE:
+                break
+            product_id, pixel_values = item
+            batch_ids.append(product_id)
+            batch_pixels.append(pixel_values)
+            if len(batch_ids) >= self.batch_size:
+                flush()
+        flush()
+        return features
+
+    @staticmethod
+    def _put(output: queue.Queue, item: Any, stop: threading.Event) -> None:
+        """Put into a bounded queue without blocking forever after a stop."""
+        while True:
+            try:
+                output.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if stop.is_set():
+                    return
+
+    @staticmethod
+    def _get(input_queue: queue.Queue, stop: threading.Event) -> Any:
+        """Get from a queue, returning the end marker once stopped."""
+        while not stop.is_set():
+            try:
+                return input_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    @staticmethod
+    def _drain(q: queue.Queue) -> None:
+        try:
+            while True:
+                q.get_nowait()
+        except queue.Empty:
+            pass
+
@@ -0,0 +1,130 @@
+"""
+Bounded thread-pool executor that keeps blocking search work off the event loop.
+"""
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from config.settings import config
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFullError(Exception):
+    """Raised when the inference work queue has no free slot."""
+
+
+class InferenceExecutor:
+    """Runs CPU-bound work (model inference, downloads, indexing) on worker threads.
+
+    At most max_workers jobs run at once and at most max_queue more wait for
+    a worker; further submissions are rejected immediately instead of piling
+    up behind the ones already accepted.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None):
+        """
+        Initialize the executor.
+
+        Args:
+            max_workers: Number of worker threads (default from config)
+            max_queue: Number of jobs allowed to wait for a worker (default from config)
+        """
+        self.max_workers = max(1, max_workers or config.INFERENCE_WORKERS)
+        self.max_queue = max(0, config.INFERENCE_QUEUE_SIZE if max_queue is None else max_queue)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="inference"
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+        self._completed = 0
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking function on a worker thread and await its result.
+
+        Args:
+            fn: Function to run
+            *args: Positional arguments for fn
+            **kwargs: Keyword arguments for fn
+
+        Returns:
+            Return value of fn
+
+        Raises:
+            InferenceQueueFullError: If all workers are busy and the queue is full
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise InferenceQueueFullError(
+                    f"Inference queue is full ({self._pending} jobs pending)"
+                )
+            self._pending += 1
+
+        try:
+            future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self._release(None)
+            raise
+
+        # Free the slot when the work really ends, even if the awaiting request
+        # was cancelled while the job was still running
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get executor statistics.
+
+        Returns:
+            Dictionary with pool size, pending jobs and counters
+        """
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": min(self._pending, self.max_workers),
+                "queued": max(0, self._pending - self.max_workers),
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self) -> None:
+        """Stop accepting work and wait for running jobs."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _release(self, _future: Optional[Future]) -> None:
+        with self._lock:
+            self._pending -= 1
+            if _future is not None:
+                self._completed += 1
+
+
+# Singleton instance
+_inference_executor: Optional[InferenceExecutor] = None
+
+
+def get_inference_executor() -> InferenceExecutor:
+    """
+    Get or create inference executor instance.
+
+    Returns:
+        InferenceExecutor instance
+    """
+    global _inference_executor
+    if _inference_executor is None:
+        _inference_executor = InferenceExecutor()
+    return _inference_executor
+
+
+def shutdown_inference_executor() -> None:
+    """Shut down the inference executor if it was created."""
+    global _inference_executor
+    if _inference_executor is not None:
+        _inference_executor.shutdown()
+        _inference_executor = None
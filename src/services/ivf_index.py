@@ -0,0 +1,453 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index.
+"""
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from config.settings import config
+from services.vector_index import FlatIndex, select_top_k
+
+logger = logging.getLogger(__name__)
+
+# Rows assigned to centroids at a time during training
+_ASSIGN_CHUNK_ROWS = 8192
+
+
+def train_kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    iterations: int,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    Cluster normalized vectors with spherical k-means.
+
+    Args:
+        vectors: N x D matrix of normalized embeddings
+        n_clusters: Number of centroids
+        iterations: Number of Lloyd iterations
+        seed: Random seed for initialization
+
+    Returns:
+        n_clusters x D matrix of normalized centroids
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, vectors.shape[0])
+    centroids = np.array(vectors[rng.choice(vectors.shape[0], n_clusters, replace=False)])
+
+    for _ in range(iterations):
+        assignments = assign_to_centroids(vectors, centroids)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # Sum each cluster's members over one contiguous run of sorted rows
+        order = np.argsort(assignments, kind='stable')
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)))[nonempty]
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(vectors[order], starts, axis=0)
+
+        # Restart empty clusters from random vectors
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            sums[empty] = vectors[rng.choice(vectors.shape[0], empty.size, replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+
+    return centroids
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Find the most similar centroid of each vector.
+
+    Args:
+        vectors: N x D matrix of normalized embeddings
+        centroids: K x D matrix of normalized centroids
+
+    Returns:
+        Centroid number of each vector
+    """
+    assignments = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], _ASSIGN_CHUNK_ROWS):
+        stop = start + _ASSIGN_CHUNK_ROWS
+        assignments[start:stop] = np.argmax(vectors[start:stop] @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """Approximate cosine-similarity index with a k-means coarse quantizer.
+
+    Vectors are grouped into nlist clusters. A query is compared with the
+    cluster centroids first and only the vectors of the nprobe closest
+    clusters are scored, so the work per query grows with the catalog size
+    divided by nlist rather than with the catalog size.
+
+    The vectors themselves live in a FlatIndex, which also serves queries
+    exactly while the catalog is too small to train the quantizer.
+    """
+
+    def __init__(
+        self,
+        nlist: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        min_train_size: Optional[int] = None,
+        train_iterations: Optional[int] = None
+    ):
+        """
+        Initialize an empty index.
+
+        Args:
+            nlist: Number of clusters, 0 to size it from the catalog (default from config)
+            nprobe: Clusters scored per query (default from config)
+            min_train_size: Smallest catalog that is clustered (default from config)
+            train_iterations: k-means iterations (default from config)
+        """
+        self.nlist = config.IVF_NLIST if nlist is None else nlist
+        self.nprobe = max(1, nprobe or config.IVF_NPROBE)
+        self.min_train_size = config.IVF_MIN_TRAIN_SIZE if min_train_size is None else min_train_size
+        self.train_iterations = train_iterations or config.IVF_TRAIN_ITERATIONS
+        self._flat = FlatIndex()
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        # Rows of each cluster, built on first search and then updated per list.
+        # Updates replace the container and the changed arrays, never modify them,
+        # so copies can share them.
+        self._lists: Optional[List[np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self._flat)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self._flat
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._flat.dim
+
+    @property
+    def ids(self) -> List[str]:
+        """Product ids, parallel to the rows of vectors."""
+        return self._flat.ids
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """N x D float32 matrix of the indexed embeddings."""
+        return self._flat.vectors
+
+    @property
+    def trained(self) -> bool:
+        """Whether queries go through the coarse quantizer."""
+        return self._centroids is not None
+
+    def build(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        """
+        Replace the index contents and train the coarse quantizer.
+
+        Args:
+            ids: Product ids, one per row of vectors
+            vectors: N x D matrix of normalized embeddings
+        """
+        self._flat.build(ids, vectors)
+        self._centroids = None
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._lists = None
+        if len(self) < max(1, self.min_train_size):
+            logger.info(f"IVF index not trained: {len(self)} vectors, brute force in use")
+            return
+        self._train()
+
+    def _train(self) -> None:
+        """Cluster the indexed vectors and assign every row to a list."""
+        vectors = self._flat.vectors
+        nlist = self.nlist or int(round(4 * np.sqrt(vectors.shape[0])))
+        nlist = max(1, min(nlist, vectors.shape[0]))
+        started = time.perf_counter()
+        # Train on a sample; clusters only need a few dozen points each
+        sample_size = min(vectors.shape[0], nlist * 64)
+        sample = np.sort(
+            np.random.default_rng(0).choice(vectors.shape[0], sample_size, replace=False)
+        )
+        self._centroids = train_kmeans(
+            np.asarray(vectors[sample]), nlist, self.train_iterations
+        )
+        self._assignments = assign_to_centroids(vectors, self._centroids)
+        self._lists = None
+        logger.info(
+            f"Trained IVF index with {nlist} lists on {sample_size} vectors "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+    def copy(self) -> "IVFIndex":
+        """
+        Create an independent index with the same contents.
+
+        Returns:
+            New IVFIndex
+        """
+        index = IVFIndex(self.nlist, self.nprobe, self.min_train_size, self.train_iterations)
+        index._flat = self._flat.copy()
+        # Centroids and lists are never modified in place, so they can be shared
+        index._centroids = self._centroids
+        index._assignments = self._assignments[:len(self)].copy()
+        index._lists = self._lists
+        return index
+
+    def add(self, product_id: str, vector: np.ndarray) -> None:
+        """
+        Insert or replace the vector of a product.
+
+        The product joins the list of its closest existing centroid; centroids
+        are only retrained by build(). Only the affected lists are updated. An
+        untrained index is trained once it grows to min_train_size vectors.
+
+        Args:
+            product_id: Product ID
+            vector: Normalized embedding
+        """
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        replaced = product_id in self._flat
+        self._flat.add(product_id, vector)
+        if self._centroids is None:
+            if not replaced and len(self) >= max(1, self.min_train_size):
+                logger.info(f"IVF index grew to {len(self)} vectors, training it")
+                self._train()
+            return
+
+        position = self._flat.position(product_id)
+        if position >= self._assignments.shape[0]:
+            capacity = max(position + 1, 2 * self._assignments.shape[0], 16)
+            assignments = np.empty(capacity, dtype=np.int32)
+            assignments[:self._assignments.shape[0]] = self._assignments
+            self._assignments = assignments
+        previous = int(self._assignments[position]) if replaced else None
+        cluster = int(np.argmax(self._centroids @ vector))
+        self._assignments[position] = cluster
+
+        if self._lists is not None and cluster != previous:
+            lists = list(self._lists)
+            if previous is not None:
+                lists[previous] = lists[previous][lists[previous] != position]
+            lists[cluster] = np.append(lists[cluster], np.intp(position))
+            self._lists = lists
+
+    def remove(self, product_id: str) -> bool:
+        """
+        Remove a product from the index.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            True if the product was indexed
+        """
+        position = self._flat.position(product_id)
+        if position is None:
+            return False
+
+        last = len(self) - 1
+        self._flat.remove(product_id)
+        if self._centroids is not None:
+            # Mirror the swap-with-last removal of the flat index
+            cluster = int(self._assignments[position])
+            moved = int(self._assignments[last])
+            self._assignments[position] = moved
+
+            if self._lists is not None:
+                lists = list(self._lists)
+                lists[cluster] = lists[cluster][lists[cluster] != position]
+                if last != position:
+                    rows = lists[moved].copy()
+                    rows[rows == last] = position
+                    lists[moved] = rows
+                self._lists = lists
+        return True
+
+    def get(self, product_id: str) -> Optional[np.ndarray]:
+        """
+        Get the stored vector of a product.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            Embedding or None if the product is not indexed
+        """
+        return self._flat.get(product_id)
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        threshold: float,
+        nprobe: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the most similar products to a query vector.
+
+        Args:
+            query: Normalized query embedding
+            top_k: Number of top results to return
+            threshold: Minimum similarity threshold
+            nprobe: Clusters to score for this query (default: index setting)
+
+        Returns:
+            List of (product_id, similarity) sorted by descending similarity
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        nprobe = nprobe or self.nprobe
+        centroids = self._centroids
+        if centroids is None or nprobe >= centroids.shape[0]:
+            return self._flat.search(query, top_k, threshold)
+
+        rows = self._candidates(query, nprobe)
+        scores = self._flat.vectors[rows] @ query
+        positions = select_top_k(scores, top_k, threshold)
+        ids = self._flat.ids
+        return [(ids[rows[i]], float(scores[i])) for i in positions]
+
+    def save(self, path: str) -> bool:
+        """
+        Save the trained quantizer (centroids and list assignments).
+
+        The vectors are not included; they are persisted by the embedding store.
+
+        Args:
+            path: Target .npz file
+
+        Returns:
+            True if the file was written
+        """
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    ids=np.array(self.ids, dtype=str),
+                    centroids=(
+                        self._centroids if self._centroids is not None
+                        else np.empty((0, self.dim or 0), dtype=np.float32)
+                    ),
+                    assignments=self._assignments[:len(self)] if self.trained
+                    else np.empty(0, dtype=np.int32)
+                )
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving IVF index to {path}: {str(e)}")
+            return False
+
+    def load(self, path: str, ids: Sequence[str], vectors: np.ndarray) -> bool:
+        """
+        Restore a saved quantizer on top of the given vectors, without retraining.
+
+        Args:
+            path: .npz file written by save()
+            ids: Product ids, one per row of vectors
+            vectors: N x D matrix of normalized embeddings
+
+        Returns:
+            True if the saved quantizer matches the ids and was restored; False
+            also when it was saved untrained but the catalog is now large enough
+            to train
+        """
+        if not os.path.exists(path):
+            return False
+
+        try:
+            with np.load(path) as data:
+                saved_ids = data["ids"].tolist()
+                centroids = data["centroids"].astype(np.float32)
+                assignments = data["assignments"].astype(np.int32)
+        except Exception as e:
+            logger.error(f"Error loading IVF index from {path}: {str(e)}")
+            return False
+
+        if saved_ids != [str(product_id) for product_id in ids]:
+            logger.info("Saved IVF index does not match the catalog, it will be retrained")
+            return False
+
+        if centroids.shape[0] == 0 and len(saved_ids) >= max(1, self.min_train_size):
+            logger.info("Saved IVF index is untrained but the catalog has grown, it will be trained")
+            return False
+
+        self._flat.build(ids, vectors)
+        trained = centroids.shape[0] > 0 and centroids.shape[1] == self.dim
+        self._centroids = centroids if trained else None
+        self._assignments = assignments if trained else np.empty(0, dtype=np.int32)
+        self._lists = None
+        return True
+
+    def recall_report(self, queries: np.ndarray, top_k: int) -> Dict[str, Any]:
+        """
+        Measure recall and scan cost against exact search.
+
+        Args:
+            queries: M x D matrix of normalized query embeddings
+            top_k: Number of neighbours compared per query
+
+        Returns:
+            Recall@k, scanned fraction and latency for a range of nprobe values
+        """
+        nlist = 0 if self._centroids is None else self._centroids.shape[0]
+        report: Dict[str, Any] = {
+            "index_type": "ivf",
+            "trained": self.trained,
+            "nlist": nlist,
+            "nprobe": self.nprobe,
+            "queries": len(queries),
+            "top_k": top_k,
+            "bytes_per_vector": 4 * (self.dim or 0),
+            "nprobe_sweep": [],
+        }
+
+        started = time.perf_counter()
+        truths = [
+            {product_id for product_id, _ in self._flat.search(query, top_k, -1.0)}
+            for query in queries
+        ]
+        exact_ms = 1000 * (time.perf_counter() - started) / max(1, len(queries))
+        report["exact_ms_per_query"] = round(exact_ms, 3)
+
+        expected = max(1, len(queries) * min(top_k, len(self)))
+        probes = sorted({p for p in (1, 2, 4, 8, 16, 32, 64, self.nprobe) if p <= nlist})
+        for nprobe in probes:
+            hits = 0
+            scanned = 0
+            started = time.perf_counter()
+            for query, truth in zip(queries, truths):
+                found = self.search(query, top_k, -1.0, nprobe=nprobe)
+                hits += len(truth & {product_id for product_id, _ in found})
+            elapsed = time.perf_counter() - started
+            for query in queries:
+                scanned += len(self._candidates(np.asarray(query, dtype=np.float32), nprobe))
+            report["nprobe_sweep"].append({
+                "nprobe": nprobe,
+                "recall_at_k": round(hits / expected, 4),
+                "scanned_fraction": round(scanned / max(1, len(queries) * len(self)), 4),
+                "ms_per_query": round(1000 * elapsed / max(1, len(queries)), 3),
+            })
+        return report
+
+    def _candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Rows in the nprobe lists whose centroids are closest to the query."""
+        lists = self._inverted_lists()
+        probes = select_top_k(self._centroids @ query, nprobe, -np.inf)
+        rows = np.concatenate([lists[c] for c in probes])
+        # Sorted rows make the gather from the vector matrix sequential
+        rows.sort()
+        return rows
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        lists = self._lists
+        if lists is None:
+            nlist = self._centroids.shape[0]
+            assignments = self._assignments[:len(self)]
+            order = np.argsort(assignments, kind='stable')
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=nlist))))
+            # Assigned in one step so concurrent searches never see a partial build
+            lists = self._lists = [order[offsets[c]:offsets[c + 1]] for c in range(nlist)]
+        return lists
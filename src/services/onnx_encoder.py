@@ -0,0 +1,245 @@
+"""
+ONNX Runtime backend for the CLIP image encoder.
+
+The encoder is exported offline, where PyTorch and transformers are installed:
+
+    cd src && python -m services.onnx_encoder [--model NAME] [--output PATH]
+"""
+import argparse
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+import numpy as np
+
+from config.settings import config
+
+logger = logging.getLogger(__name__)
+
+# Largest allowed difference between ONNX and PyTorch embeddings after export
+PARITY_TOLERANCE = 1e-4
+
+
+def default_model_path(model_name: str) -> str:
+    """
+    Get the path of the exported encoder for a model.
+
+    Args:
+        model_name: HuggingFace model name
+
+    Returns:
+        Path of the .onnx file
+    """
+    return os.path.join(config.ONNX_MODEL_DIR, f"{model_name.replace('/', '__')}.onnx")
+
+
+def preprocessor_config_path(path: str) -> str:
+    """
+    Get the file holding the image preprocessing settings of an exported encoder.
+
+    Args:
+        path: .onnx file
+
+    Returns:
+        Path of the JSON file saved next to it
+    """
+    return f"{os.path.splitext(path)[0]}.preprocessor_config.json"
+
+
+def load_preprocessor_config(path: str) -> Dict[str, Any]:
+    """
+    Read the image preprocessing settings saved with an exported encoder.
+
+    Args:
+        path: .onnx file
+
+    Returns:
+        Parsed preprocessor_config.json of the model
+
+    Raises:
+        FileNotFoundError: If the encoder was exported without its settings
+    """
+    config_path = preprocessor_config_path(path)
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(
+            f"Preprocessing settings not found at {config_path}; "
+            f"export the encoder again with 'python -m services.onnx_encoder'"
+        )
+    with open(config_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def export_image_encoder(model_name: str, path: str) -> None:
+    """
+    Export the CLIP image encoder, including L2 normalization, to ONNX.
+
+    The model's image preprocessing settings are saved next to it, so the
+    server needs neither PyTorch nor transformers. Both are only needed here,
+    so they are imported lazily.
+
+    Args:
+        model_name: HuggingFace model name
+        path: Target .onnx file
+
+    Raises:
+        RuntimeError: If the exported model does not match PyTorch
+    """
+    import torch
+    from transformers import CLIPImageProcessor, CLIPVisionModelWithProjection
+
+    class _NormalizedImageEncoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            embeds = self.model(pixel_values=pixel_values).image_embeds
+            return embeds / embeds.norm(dim=-1, keepdim=True)
+
+    logger.info(f"Exporting {model_name} image encoder to ONNX: {path}")
+    model = CLIPVisionModelWithProjection.from_pretrained(model_name, torch_dtype=torch.float32)
+    model.eval()
+    encoder = _NormalizedImageEncoder(model)
+    size = model.config.image_size
+    sample = torch.rand(2, 3, size, size)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            encoder,
+            (sample,),
+            tmp_path,
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=17,
+        )
+        expected = encoder(sample).numpy()
+
+    actual = OnnxImageEncoder(tmp_path)(sample.numpy())
+    max_diff = float(np.abs(actual - expected).max())
+    if max_diff > PARITY_TOLERANCE:
+        os.remove(tmp_path)
+        raise RuntimeError(
+            f"ONNX export differs from PyTorch by {max_diff:.2e} (tolerance {PARITY_TOLERANCE:.0e})"
+        )
+
+    # Written first, so an encoder file never exists without its settings
+    CLIPImageProcessor.from_pretrained(model_name).to_json_file(preprocessor_config_path(path))
+    os.replace(tmp_path, path)
+    logger.info(f"Exported ONNX image encoder (max difference from PyTorch: {max_diff:.2e})")
+
+
+class OnnxImageEncoder:
+    """CLIP image encoder served by onnxruntime's CPU execution provider.
+
+    The exported graph takes CLIP pixel values and returns L2-normalized
+    image embeddings, so no PyTorch code runs at serving time.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        intra_op_threads: Optional[int] = None,
+        inter_op_threads: Optional[int] = None
+    ):
+        """
+        Open an inference session.
+
+        Args:
+            path: Exported .onnx file
+            intra_op_threads: Threads used inside one operator, 0 for the ORT default (default from config)
+            inter_op_threads: Threads running independent operators (default from config)
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = (
+            config.ONNX_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+        )
+        options.inter_op_num_threads = (
+            config.ONNX_INTER_OP_THREADS if inter_op_threads is None else inter_op_threads
+        )
+        self.path = path
+        self.session = ort.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_name = self.session.get_inputs()[0].name
+
+    @property
+    def output_dim(self) -> Optional[int]:
+        """Embedding dimension declared by the graph, if it is static."""
+        dim = self.session.get_outputs()[0].shape[-1]
+        return dim if isinstance(dim, int) else None
+
+    def __call__(self, pixel_values: np.ndarray) -> np.ndarray:
+        """
+        Embed a batch of images.
+
+        Args:
+            pixel_values: Float32 pixel array of shape (N, 3, H, W)
+
+        Returns:
+            Normalized feature matrix (N x D)
+        """
+        pixel_values = np.ascontiguousarray(pixel_values, dtype=np.float32)
+        return self.session.run(None, {self._input_name: pixel_values})[0]
+
+
+def model_path(model_name: str) -> str:
+    """
+    Get the configured path of the exported encoder for a model.
+
+    Args:
+        model_name: HuggingFace model name
+
+    Returns:
+        ONNX_MODEL_PATH if set, otherwise the default path under ONNX_MODEL_DIR
+    """
+    return config.ONNX_MODEL_PATH or default_model_path(model_name)
+
+
+def load_onnx_encoder(model_name: str, path: Optional[str] = None) -> OnnxImageEncoder:
+    """
+    Open the exported encoder of a model.
+
+    Exporting needs PyTorch and the full CLIP model, so it is never done in
+    the serving process.
+
+    Args:
+        model_name: HuggingFace model name
+        path: .onnx file (default from config)
+
+    Returns:
+        OnnxImageEncoder instance
+
+    Raises:
+        FileNotFoundError: If the encoder has not been exported
+    """
+    path = path or model_path(model_name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"ONNX image encoder not found at {path}; export it first with "
+            f"'python -m services.onnx_encoder --model {model_name}' (run from src)"
+        )
+    return OnnxImageEncoder(path)
+
+
+def main() -> None:
+    """Export the image encoder of a model to ONNX from the command line."""
+    parser = argparse.ArgumentParser(description="Export the CLIP image encoder to ONNX")
+    parser.add_argument("--model", default=config.MODEL_NAME, help="HuggingFace model name")
+    parser.add_argument("--output", default=None, help=".onnx file (default from config)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    export_image_encoder(args.model, args.output or model_path(args.model))
+
+
+if __name__ == "__main__":
+    main()
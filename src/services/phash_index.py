@@ -0,0 +1,245 @@
+"""
+Perceptual-hash index for spotting near-exact copies of catalog images.
+"""
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def dhash(image: Image.Image) -> int:
+    """
+    Compute the 64-bit difference hash of an image.
+
+    The image is shrunk to 9x8 grayscale and each bit records whether a pixel
+    is brighter than its right neighbour, so re-encoding, resizing and small
+    edits leave most bits unchanged.
+
+    Args:
+        image: PIL Image object
+
+    Returns:
+        Hash as an unsigned 64-bit integer
+    """
+    small = image.convert("L").resize((9, 8), Image.Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distances(hashes: np.ndarray, image_hash: int) -> np.ndarray:
+    """
+    Count differing bits between one hash and many.
+
+    Args:
+        hashes: uint64 array of hashes
+        image_hash: Hash to compare with
+
+    Returns:
+        Number of differing bits per hash
+    """
+    return np.bitwise_count(hashes ^ np.uint64(image_hash))
+
+
+class PerceptualHashIndex:
+    """dHash of every catalog image in one contiguous uint64 array.
+
+    A query hash is compared with the whole catalog by a single vectorized
+    XOR and popcount. Each hash is stored with a key of the image it came
+    from (the embedding store's URL hash), so saved hashes are only reused
+    while the product image is unchanged.
+    """
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self._ids: List[str] = []
+        self._image_keys: List[str] = []
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self._positions
+
+    def build(self, ids: Sequence[str], hashes: Sequence[int], image_keys: Sequence[str]) -> None:
+        """
+        Replace the index contents.
+
+        Args:
+            ids: Product ids
+            hashes: Image hash of each product
+            image_keys: Key of the image each hash was computed from
+        """
+        self._ids = [str(product_id) for product_id in ids]
+        self._image_keys = list(image_keys)
+        self._hashes = np.array(hashes, dtype=np.uint64)
+        self._positions = {product_id: i for i, product_id in enumerate(self._ids)}
+
+    def copy(self) -> "PerceptualHashIndex":
+        """
+        Create an independent index with the same contents and counters.
+
+        Returns:
+            New PerceptualHashIndex
+        """
+        index = PerceptualHashIndex()
+        index.build(self._ids, self._hashes[:len(self)], self._image_keys)
+        index.checks = self.checks
+        index.hits = self.hits
+        return index
+
+    def add(self, product_id: str, image_hash: int, image_key: str = "") -> None:
+        """
+        Insert or replace the hash of a product.
+
+        Args:
+            product_id: Product ID
+            image_hash: Image hash
+            image_key: Key of the image the hash was computed from
+        """
+        position = self._positions.get(product_id)
+        if position is None:
+            position = len(self._ids)
+            if position >= self._hashes.shape[0]:
+                hashes = np.empty(max(16, 2 * position), dtype=np.uint64)
+                hashes[:position] = self._hashes[:position]
+                self._hashes = hashes
+            self._ids.append(product_id)
+            self._image_keys.append(image_key)
+            self._positions[product_id] = position
+        self._hashes[position] = image_hash
+        self._image_keys[position] = image_key
+
+    def remove(self, product_id: str) -> bool:
+        """
+        Remove a product, moving the last entry into its slot.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            True if the product was indexed
+        """
+        position = self._positions.pop(product_id, None)
+        if position is None:
+            return False
+
+        last = len(self._ids) - 1
+        if position != last:
+            self._ids[position] = self._ids[last]
+            self._image_keys[position] = self._image_keys[last]
+            self._hashes[position] = self._hashes[last]
+            self._positions[self._ids[position]] = position
+        self._ids.pop()
+        self._image_keys.pop()
+        return True
+
+    def lookup(self, product_id: str, image_key: str) -> Optional[int]:
+        """
+        Get the hash of a product if it was computed from the given image.
+
+        Args:
+            product_id: Product ID
+            image_key: Key of the product's current image
+
+        Returns:
+            Image hash or None if missing or stale
+        """
+        position = self._positions.get(product_id)
+        if position is None or self._image_keys[position] != image_key:
+            return None
+        return int(self._hashes[position])
+
+    def match(self, image_hash: int, max_distance: int) -> Optional[Tuple[str, int]]:
+        """
+        Find the catalog image closest to a query hash.
+
+        Args:
+            image_hash: Hash of the query image
+            max_distance: Largest Hamming distance accepted as a match
+
+        Returns:
+            (product_id, distance) of the closest image, or None if none is close enough
+        """
+        with self._lock:
+            self.checks += 1
+        if not self._ids:
+            return None
+
+        distances = hamming_distances(self._hashes[:len(self._ids)], image_hash)
+        position = int(np.argmin(distances))
+        distance = int(distances[position])
+        if distance > max_distance:
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return self._ids[position], distance
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get fast-path statistics.
+
+        Returns:
+            Dictionary with indexed images, checks, hits and hit rate
+        """
+        return {
+            "images": len(self),
+            "checks": self.checks,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.checks, 4) if self.checks else None,
+        }
+
+    def save(self, path: str) -> bool:
+        """
+        Save the hashes.
+
+        Args:
+            path: Target .npz file
+
+        Returns:
+            True if the file was written
+        """
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    ids=np.array(self._ids, dtype=str),
+                    image_keys=np.array(self._image_keys, dtype=str),
+                    hashes=self._hashes[:len(self)]
+                )
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving image hashes to {path}: {str(e)}")
+            return False
+
+    def load(self, path: str) -> bool:
+        """
+        Replace the index contents with saved hashes.
+
+        Args:
+            path: .npz file written by save()
+
+        Returns:
+            True if the file was read
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                self.build(data["ids"].tolist(), data["hashes"], data["image_keys"].tolist())
+            return True
+        except Exception as e:
+            logger.error(f"Error loading image hashes from {path}: {str(e)}")
+            return False
@@ -0,0 +1,470 @@
+"""
+Product-quantization (PQ) compressed vector index.
+"""
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from config.settings import config
+from services.vector_index import (
+    FlatIndex, measure_recall, rerank_candidates, select_top_k, spill_vectors
+)
+
+logger = logging.getLogger(__name__)
+
+# Centroids per subspace, so each sub-code fits in one byte
+PQ_CENTROIDS = 256
+
+# Rows encoded at a time
+_CHUNK_ROWS = 16384
+
+
+def train_codebooks(
+    vectors: np.ndarray,
+    n_subspaces: int,
+    iterations: int,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    Train one k-means codebook per subspace.
+
+    Args:
+        vectors: N x D training vectors, D divisible by n_subspaces
+        n_subspaces: Number of subspaces (bytes per encoded vector)
+        iterations: Number of Lloyd iterations
+        seed: Random seed for initialization
+
+    Returns:
+        n_subspaces x K x (D / n_subspaces) codebooks
+    """
+    rng = np.random.default_rng(seed)
+    n, dim = vectors.shape
+    sub_dim = dim // n_subspaces
+    k = min(PQ_CENTROIDS, n)
+    codebooks = np.empty((n_subspaces, k, sub_dim), dtype=np.float32)
+
+    for m in range(n_subspaces):
+        sub = np.ascontiguousarray(vectors[:, m * sub_dim:(m + 1) * sub_dim], dtype=np.float32)
+        centroids = sub[rng.choice(n, k, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = _nearest(sub, centroids)
+            counts = np.bincount(assignments, minlength=k)
+            order = np.argsort(assignments, kind='stable')
+            nonempty = np.flatnonzero(counts)
+            starts = np.concatenate(([0], np.cumsum(counts)))[nonempty]
+            centroids[nonempty] = (
+                np.add.reduceat(sub[order], starts, axis=0) / counts[nonempty, None]
+            )
+            # Restart empty clusters from random points
+            empty = np.flatnonzero(counts == 0)
+            if empty.size:
+                centroids[empty] = sub[rng.choice(n, empty.size, replace=False)]
+        codebooks[m] = centroids
+
+    return codebooks
+
+
+def encode(vectors: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    """
+    Encode vectors as the nearest centroid of every subspace.
+
+    Args:
+        vectors: N x D matrix
+        codebooks: M x K x (D / M) codebooks
+
+    Returns:
+        N x M uint8 codes
+    """
+    n_subspaces, _, sub_dim = codebooks.shape
+    codes = np.empty((vectors.shape[0], n_subspaces), dtype=np.uint8)
+    for start in range(0, vectors.shape[0], _CHUNK_ROWS):
+        chunk = np.asarray(vectors[start:start + _CHUNK_ROWS], dtype=np.float32)
+        for m in range(n_subspaces):
+            sub = chunk[:, m * sub_dim:(m + 1) * sub_dim]
+            codes[start:start + chunk.shape[0], m] = _nearest(sub, codebooks[m])
+    return codes
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid (Euclidean) of each row."""
+    # argmin |x - c|^2 == argmax (x.c - |c|^2 / 2)
+    half_norms = 0.5 * np.einsum('kd,kd->k', centroids, centroids)
+    return np.argmax(vectors @ centroids.T - half_norms, axis=1)
+
+
+class PQIndex:
+    """Vector index storing each embedding as M one-byte product-quantization codes.
+
+    Every vector is split into M subspaces and each part is replaced by the
+    number of its closest centroid in that subspace's 256-entry codebook. A
+    query builds an M x 256 table of inner products with the codebooks once,
+    after which the score of any vector is the sum of M table lookups
+    (asymmetric distance computation). Catalogs too small to fill the
+    codebooks are searched exactly until the next build().
+
+    The best top_k * rerank_factor candidates can optionally be re-scored with
+    the float32 vectors, which stay memory-mapped (from the embedding store or
+    an unlinked temporary file) rather than on the heap.
+    """
+
+    def __init__(
+        self,
+        n_subspaces: Optional[int] = None,
+        rerank_factor: Optional[int] = None,
+        train_size: Optional[int] = None,
+        train_iterations: Optional[int] = None,
+        rerank_dir: Optional[str] = None
+    ):
+        """
+        Initialize an empty index.
+
+        Args:
+            n_subspaces: Number of subspaces, i.e. bytes per vector (default from config)
+            rerank_factor: Candidates re-ranked per result, 0 to disable (default from config)
+            train_size: Maximum number of vectors used for training (default from config)
+            train_iterations: k-means iterations per codebook (default from config)
+            rerank_dir: Directory for the memory-mapped float32 vectors (default from config)
+        """
+        self.n_subspaces = n_subspaces or config.PQ_SUBSPACES
+        self.rerank_factor = max(
+            0, config.PQ_RERANK_FACTOR if rerank_factor is None else rerank_factor
+        )
+        self.train_size = train_size or config.PQ_TRAIN_SIZE
+        self.train_iterations = train_iterations or config.PQ_TRAIN_ITERATIONS
+        if rerank_dir is None:
+            rerank_dir = config.PQ_RERANK_DIR
+        self._full = FlatIndex(spill_dir=rerank_dir)
+        self._codebooks: Optional[np.ndarray] = None
+        # Stored subspace-major (M x capacity) so each lookup pass reads one
+        # contiguous row of codes
+        self._codes: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._full)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self._full
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._full.dim
+
+    @property
+    def ids(self) -> List[str]:
+        """Product ids, parallel to the rows of vectors."""
+        return self._full.ids
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """N x D float32 matrix of the indexed embeddings (memory-mapped)."""
+        return self._full.vectors
+
+    @property
+    def trained(self) -> bool:
+        """Whether queries are scored from PQ codes."""
+        return self._codebooks is not None
+
+    @property
+    def codes(self) -> np.ndarray:
+        """N x M uint8 codes."""
+        if self._codes is None:
+            return np.empty((0, self.n_subspaces), dtype=np.uint8)
+        return self._codes[:, :len(self)].T
+
+    def memory_bytes(self) -> int:
+        """
+        Get the heap size of the compressed representation.
+
+        Returns:
+            Bytes used by codes and codebooks
+        """
+        codebooks = 0 if self._codebooks is None else self._codebooks.nbytes
+        return self.codes.nbytes + codebooks
+
+    def build(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        """
+        Replace the index contents, training the codebooks and encoding every vector.
+
+        Args:
+            ids: Product ids, one per row of vectors
+            vectors: N x D matrix of normalized embeddings
+        """
+        # Move the float32 copy off the heap; only re-ranking reads it
+        self._full.build(ids, spill_vectors(vectors, self._full.spill_dir))
+        vectors = self._full.vectors
+        self._codebooks = None
+        self._codes = None
+        if len(ids) < PQ_CENTROIDS:
+            logger.info(f"PQ index not trained: {len(ids)} vectors, brute force in use")
+            return
+
+        if vectors.shape[1] % self.n_subspaces:
+            raise ValueError(
+                f"Embedding dimension {vectors.shape[1]} is not divisible by "
+                f"{self.n_subspaces} PQ subspaces"
+            )
+
+        started = time.perf_counter()
+        sample_size = min(vectors.shape[0], self.train_size)
+        sample = np.sort(
+            np.random.default_rng(0).choice(vectors.shape[0], sample_size, replace=False)
+        )
+        self._codebooks = train_codebooks(
+            np.asarray(vectors[sample]), self.n_subspaces, self.train_iterations
+        )
+        trained = time.perf_counter()
+        self._codes = np.ascontiguousarray(encode(vectors, self._codebooks).T)
+        logger.info(
+            f"Trained PQ codebooks ({self.n_subspaces} x {self._codebooks.shape[1]}) on "
+            f"{sample_size} vectors in {trained - started:.2f}s, encoded "
+            f"{vectors.shape[0]} vectors in {time.perf_counter() - trained:.2f}s"
+        )
+
+    def copy(self) -> "PQIndex":
+        """
+        Create an independent index with the same contents.
+
+        Returns:
+            New PQIndex
+        """
+        index = PQIndex(
+            self.n_subspaces, self.rerank_factor, self.train_size,
+            self.train_iterations, self._full.spill_dir
+        )
+        index._full = self._full.copy()
+        # Codebooks are never modified in place, so they can be shared
+        index._codebooks = self._codebooks
+        if self._codes is not None:
+            index._codes = self._codes[:, :len(self)].copy()
+        return index
+
+    def add(self, product_id: str, vector: np.ndarray) -> None:
+        """
+        Insert or replace the vector of a product.
+
+        The vector is encoded with the existing codebooks; they are only
+        retrained by build().
+
+        Args:
+            product_id: Product ID
+            vector: Normalized embedding
+        """
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        self._full.add(product_id, vector)
+        if self._codebooks is None:
+            return
+
+        position = self._full.position(product_id)
+        if position >= self._codes.shape[1]:
+            capacity = max(position + 1, 2 * self._codes.shape[1], 16)
+            codes = np.empty((self.n_subspaces, capacity), dtype=np.uint8)
+            codes[:, :self._codes.shape[1]] = self._codes
+            self._codes = codes
+        self._codes[:, position] = encode(vector[None, :], self._codebooks)[0]
+
+    def remove(self, product_id: str) -> bool:
+        """
+        Remove a product from the index.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            True if the product was indexed
+        """
+        position = self._full.position(product_id)
+        if position is None:
+            return False
+
+        last = len(self) - 1
+        self._full.remove(product_id)
+        # Mirror the swap-with-last removal of the float32 index
+        if self._codes is not None:
+            self._codes[:, position] = self._codes[:, last]
+        return True
+
+    def get(self, product_id: str) -> Optional[np.ndarray]:
+        """
+        Get the stored float32 vector of a product.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            Embedding or None if the product is not indexed
+        """
+        return self._full.get(product_id)
+
+    def approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """
+        Score every indexed vector with asymmetric distance computation.
+
+        Args:
+            query: Normalized query embedding
+
+        Returns:
+            Approximate cosine similarity per row
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        n_subspaces, _, sub_dim = self._codebooks.shape
+        # M x K inner products between each query part and its codebook
+        table = np.einsum('md,mkd->mk', query.reshape(n_subspaces, sub_dim), self._codebooks)
+
+        codes = self._codes[:, :len(self)]
+        scores = np.zeros(codes.shape[1], dtype=np.float32)
+        for m in range(n_subspaces):
+            scores += table[m].take(codes[m])
+        return scores
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        threshold: float,
+        rerank: Optional[bool] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the most similar products to a query vector.
+
+        Args:
+            query: Normalized query embedding
+            top_k: Number of top results to return
+            threshold: Minimum similarity threshold
+            rerank: Re-score candidates with float32 vectors (default: if rerank_factor > 0)
+
+        Returns:
+            List of (product_id, similarity) sorted by descending similarity
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if self._codebooks is None:
+            return self._full.search(query, top_k, threshold)
+
+        approx = self.approximate_scores(query)
+        if rerank is None:
+            rerank = self.rerank_factor > 0
+        if not rerank:
+            positions = select_top_k(approx, top_k, threshold)
+            return [(self.ids[i], float(approx[i])) for i in positions]
+
+        candidates = select_top_k(approx, top_k * max(1, self.rerank_factor), -np.inf)
+        return rerank_candidates(self._full.vectors, self.ids, query, candidates, top_k, threshold)
+
+    def save(self, path: str) -> bool:
+        """
+        Save the codebooks and codes.
+
+        The float32 vectors are not included; they are persisted by the embedding store.
+
+        Args:
+            path: Target .npz file
+
+        Returns:
+            True if the file was written
+        """
+        if self._codebooks is None:
+            return False
+
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    ids=np.array(self.ids, dtype=str),
+                    codebooks=self._codebooks,
+                    codes=self.codes
+                )
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving PQ index to {path}: {str(e)}")
+            return False
+
+    def load(self, path: str, ids: Sequence[str], vectors: np.ndarray) -> bool:
+        """
+        Restore saved codebooks and codes on top of the given vectors.
+
+        Args:
+            path: .npz file written by save()
+            ids: Product ids, one per row of vectors
+            vectors: N x D matrix of normalized embeddings
+
+        Returns:
+            True if the saved codes match the ids and were restored
+        """
+        if not os.path.exists(path):
+            return False
+
+        try:
+            with np.load(path) as data:
+                saved_ids = data["ids"].tolist()
+                codebooks = data["codebooks"].astype(np.float32)
+                codes = data["codes"].astype(np.uint8)
+        except Exception as e:
+            logger.error(f"Error loading PQ index from {path}: {str(e)}")
+            return False
+
+        if saved_ids != [str(product_id) for product_id in ids] \
+                or codebooks.shape[0] != self.n_subspaces \
+                or codebooks.shape[0] * codebooks.shape[2] != np.shape(vectors)[1]:
+            logger.info("Saved PQ index does not match the catalog, it will be retrained")
+            return False
+
+        self._full.build(ids, vectors)
+        self._codebooks = codebooks
+        self._codes = np.ascontiguousarray(codes.T)
+        return True
+
+    def recall_report(self, queries: np.ndarray, top_k: int) -> Dict[str, Any]:
+        """
+        Measure recall against exact search, and the recall/size tradeoff.
+
+        The current index is measured on the whole catalog. The tradeoff sweep
+        trains throwaway indexes with other subspace counts on a sample of the
+        catalog (at most train_size vectors) and measures them on that sample.
+
+        Args:
+            queries: M x D matrix of normalized query embeddings
+            top_k: Number of neighbours compared per query
+
+        Returns:
+            Recall@k of the index, and recall@k per bytes-per-vector setting
+        """
+        report: Dict[str, Any] = {
+            "index_type": "pq",
+            "queries": len(queries),
+            "top_k": top_k,
+            "rerank_factor": self.rerank_factor,
+            "float32_bytes_per_vector": 4 * (self.dim or 0),
+        }
+        report.update(self._measure(queries, top_k))
+
+        sweep = []
+        if len(self) and len(queries):
+            sample_size = min(len(self), self.train_size)
+            sample = np.sort(
+                np.random.default_rng(1).choice(len(self), sample_size, replace=False)
+            )
+            sample_ids = [self.ids[i] for i in sample]
+            sample_vectors = np.asarray(self.vectors[sample])
+            for n_subspaces in (8, 16, 32, 64, 128):
+                if self.dim % n_subspaces:
+                    continue
+                candidate = PQIndex(
+                    n_subspaces, self.rerank_factor, self.train_size, self.train_iterations, ""
+                )
+                candidate.build(sample_ids, sample_vectors)
+                sweep.append({"n_subspaces": n_subspaces, **candidate._measure(queries, top_k)})
+        report["sample_size"] = len(sample) if sweep else 0
+        report["tradeoff"] = sweep
+        return report
+
+    def _measure(self, queries: np.ndarray, top_k: int) -> Dict[str, Any]:
+        """Recall@k with and without re-ranking, and compressed size."""
+        return {
+            "trained": self.trained,
+            "bytes_per_vector": self.n_subspaces,
+            **measure_recall(self, queries, top_k),
+            "index_bytes": self.memory_bytes(),
+        }
@@ -0,0 +1,291 @@
+"""
+Int8-quantized vector index with full-precision re-ranking.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from config.settings import config
+from services.vector_index import (
+    FlatIndex, measure_recall, rerank_candidates, select_top_k, spill_vectors
+)
+
+logger = logging.getLogger(__name__)
+
+# Rows converted to float32 at a time while scoring int8 codes
+_SCORE_CHUNK_ROWS = 4096
+
+
+class Int8Index:
+    """Vector index that scores int8 codes and re-ranks with float32 vectors.
+
+    Every embedding is stored as int8 codes plus a float32 scale, either one
+    per vector or one per dimension, which takes a quarter of the float32 size.
+    A search scores all codes, keeps the best top_k * rerank_factor
+    candidates, and scores those again exactly. The float32 vectors used for
+    re-ranking are memory-mapped (from the embedding store, or from an unlinked
+    temporary file), so they live in the page cache instead of the heap.
+    """
+
+    def __init__(
+        self,
+        scale_mode: Optional[str] = None,
+        rerank_factor: Optional[int] = None,
+        rerank_dir: Optional[str] = None
+    ):
+        """
+        Initialize an empty index.
+
+        Args:
+            scale_mode: "vector" or "dimension" scales (default from config)
+            rerank_factor: Candidates re-ranked per requested result (default from config)
+            rerank_dir: Directory for the memory-mapped float32 vectors (default from config)
+        """
+        self.scale_mode = (scale_mode or config.INT8_SCALE_MODE).lower()
+        if self.scale_mode not in ("vector", "dimension"):
+            raise ValueError(f"Unknown int8 scale mode: {self.scale_mode}")
+        self.rerank_factor = max(1, rerank_factor or config.INT8_RERANK_FACTOR)
+        if rerank_dir is None:
+            rerank_dir = config.INT8_RERANK_DIR
+        self._full = FlatIndex(spill_dir=rerank_dir)
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._full)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self._full
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._full.dim
+
+    @property
+    def ids(self) -> List[str]:
+        """Product ids, parallel to the rows of vectors."""
+        return self._full.ids
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """N x D float32 matrix of the indexed embeddings (memory-mapped)."""
+        return self._full.vectors
+
+    @property
+    def codes(self) -> np.ndarray:
+        """N x D int8 codes."""
+        if self._codes is None:
+            return np.empty((0, 0), dtype=np.int8)
+        return self._codes[:len(self)]
+
+    def memory_bytes(self) -> int:
+        """
+        Get the heap size of the quantized representation.
+
+        Returns:
+            Bytes used by codes and scales
+        """
+        if self._codes is None:
+            return 0
+        scales = self._scales[:len(self)] if self.scale_mode == "vector" else self._scales
+        return self.codes.nbytes + scales.nbytes
+
+    def build(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        """
+        Replace the index contents.
+
+        Args:
+            ids: Product ids, one per row of vectors
+            vectors: N x D matrix of normalized embeddings
+        """
+        # Move the float32 copy off the heap; only re-ranking reads it
+        self._full.build(ids, spill_vectors(vectors, self._full.spill_dir))
+        vectors = self._full.vectors
+        if self.scale_mode == "dimension":
+            self._scales = self._dimension_scales(vectors)
+        self._codes = np.empty(vectors.shape, dtype=np.int8)
+        if self.scale_mode == "vector":
+            self._scales = np.empty(vectors.shape[0], dtype=np.float32)
+        for start in range(0, vectors.shape[0], _SCORE_CHUNK_ROWS):
+            stop = start + _SCORE_CHUNK_ROWS
+            self._encode_rows(slice(start, stop), vectors[start:stop])
+
+    def copy(self) -> "Int8Index":
+        """
+        Create an independent index with the same contents.
+
+        Returns:
+            New Int8Index
+        """
+        index = Int8Index(self.scale_mode, self.rerank_factor, self._full.spill_dir)
+        index._full = self._full.copy()
+        if self._codes is not None:
+            index._codes = self.codes.copy()
+            index._scales = self._scales.copy() if self.scale_mode == "dimension" \
+                else self._scales[:len(self)].copy()
+        return index
+
+    def add(self, product_id: str, vector: np.ndarray) -> None:
+        """
+        Insert or replace the vector of a product.
+
+        Args:
+            product_id: Product ID
+            vector: Normalized embedding
+        """
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        self._full.add(product_id, vector)
+        position = self._full.position(product_id)
+
+        if self._codes is None:
+            self._codes = np.empty((0, vector.shape[0]), dtype=np.int8)
+            if self.scale_mode == "dimension":
+                # Scales are fixed by the first vectors; later outliers are clipped
+                self._scales = self._dimension_scales(vector[None, :])
+            else:
+                self._scales = np.empty(0, dtype=np.float32)
+
+        if position >= self._codes.shape[0]:
+            capacity = max(position + 1, 2 * self._codes.shape[0], 16)
+            codes = np.empty((capacity, self._codes.shape[1]), dtype=np.int8)
+            codes[:self._codes.shape[0]] = self._codes
+            self._codes = codes
+            if self.scale_mode == "vector":
+                scales = np.empty(capacity, dtype=np.float32)
+                scales[:self._scales.shape[0]] = self._scales
+                self._scales = scales
+
+        self._encode_rows(slice(position, position + 1), vector[None, :])
+
+    def remove(self, product_id: str) -> bool:
+        """
+        Remove a product from the index.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            True if the product was indexed
+        """
+        position = self._full.position(product_id)
+        if position is None:
+            return False
+
+        last = len(self) - 1
+        self._full.remove(product_id)
+        # Mirror the swap-with-last removal of the float32 index
+        if position != last:
+            self._codes[position] = self._codes[last]
+            if self.scale_mode == "vector":
+                self._scales[position] = self._scales[last]
+        return True
+
+    def get(self, product_id: str) -> Optional[np.ndarray]:
+        """
+        Get the stored float32 vector of a product.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            Embedding or None if the product is not indexed
+        """
+        return self._full.get(product_id)
+
+    def approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """
+        Score every indexed vector from its int8 codes.
+
+        Args:
+            query: Normalized query embedding
+
+        Returns:
+            Approximate cosine similarity per row
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        codes = self.codes
+        if self.scale_mode == "dimension":
+            query = query * self._scales
+
+        scores = np.empty(codes.shape[0], dtype=np.float32)
+        # Convert a bounded number of rows at a time to keep the temporary small
+        for start in range(0, codes.shape[0], _SCORE_CHUNK_ROWS):
+            stop = start + _SCORE_CHUNK_ROWS
+            scores[start:stop] = codes[start:stop].astype(np.float32) @ query
+
+        if self.scale_mode == "vector":
+            scores *= self._scales[:codes.shape[0]]
+        return scores
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        threshold: float,
+        rerank: bool = True
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the most similar products to a query vector.
+
+        Args:
+            query: Normalized query embedding
+            top_k: Number of top results to return
+            threshold: Minimum similarity threshold
+            rerank: Re-score candidates with float32 vectors
+
+        Returns:
+            List of (product_id, similarity) sorted by descending similarity
+        """
+        if not len(self):
+            return []
+
+        query = np.asarray(query, dtype=np.float32).ravel()
+        approx = self.approximate_scores(query)
+        if not rerank:
+            positions = select_top_k(approx, top_k, threshold)
+            return [(self.ids[i], float(approx[i])) for i in positions]
+
+        candidates = select_top_k(approx, top_k * self.rerank_factor, -np.inf)
+        return rerank_candidates(self._full.vectors, self.ids, query, candidates, top_k, threshold)
+
+    def recall_report(
+        self,
+        queries: np.ndarray,
+        top_k: int
+    ) -> Dict[str, Any]:
+        """
+        Measure recall against exact float32 search.
+
+        Args:
+            queries: M x D matrix of normalized query embeddings
+            top_k: Number of neighbours compared per query
+
+        Returns:
+            Recall@k with and without re-ranking, and memory per vector
+        """
+        return {
+            "index_type": "int8",
+            "scale_mode": self.scale_mode,
+            "queries": len(queries),
+            "top_k": top_k,
+            "rerank_factor": self.rerank_factor,
+            **measure_recall(self, queries, top_k),
+            "bytes_per_vector": round(self.memory_bytes() / max(1, len(self)), 1),
+            "float32_bytes_per_vector": 4 * (self.dim or 0),
+        }
+
+    def _dimension_scales(self, vectors: np.ndarray) -> np.ndarray:
+        scales = np.abs(vectors).max(axis=0).astype(np.float32) / 127.0
+        scales[scales == 0] = 1.0
+        return scales
+
+    def _encode_rows(self, rows: slice, vectors: np.ndarray) -> None:
+        """Quantize vectors into the given rows of the code matrix."""
+        if self.scale_mode == "vector":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._scales[rows] = scales
+            scaled = vectors / scales[:, None]
+        else:
+            scaled = vectors / self._scales
+        self._codes[rows] = np.clip(np.rint(scaled), -127, 127).astype(np.int8)
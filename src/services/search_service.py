@@ -2,15 +2,26 @@
 Image search service for finding similar products.
 """
 import gc
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
+import os
+import threading
+import time
+from typing import BinaryIO, Callable, List, Dict, Any, Optional, Tuple
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 
 from config.settings import config
-from models.product import SearchResult, Product
-from services.database import get_database_service
+from models.product import SearchResult
+from models.product_table import ProductTable
+from services.database import ProductWatcher, get_database_service
+from services.embedding_cache import EmbeddingCache
+from services.embedding_store import EmbeddingStore
 from services.feature_extractor import get_feature_extractor
+from services.indexing_pipeline import IndexingPipeline
+from services.phash_index import PerceptualHashIndex, dhash
+from services.vector_index import create_index, nearest_neighbors, select_top_k
+from utils.image_utils import ImageProcessor
+from utils.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
@@ -22,68 +33,415 @@ class SearchService:
         """Initialize search service."""
         self.db_service = None
         self.feature_extractor = None
-        self.product_features: Dict[str, np.ndarray] = {}
-        self.products: List[Dict[str, Any]] = []
+        self.index = create_index()
+        self.embedding_store: Optional[EmbeddingStore] = None
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        # Embeddings of recent query images, keyed by upload hash or normalized URL
+        self.query_cache: Optional[EmbeddingCache] = (
+            EmbeddingCache(config.QUERY_CACHE_MAX_BYTES, ttl=config.QUERY_CACHE_TTL)
+            if config.QUERY_CACHE_MAX_BYTES > 0 else None
+        )
+        # Identical queries arriving together share one download and embedding
+        self.query_flight = SingleFlight()
+        # Perceptual hashes of indexed images for the near-duplicate fast path
+        self.image_hashes: Optional[PerceptualHashIndex] = None
+        # Precomputed "more like this" lists: (index they were computed from,
+        # ids, row of each id, neighbour positions, neighbour scores)
+        self._neighbors: Optional[Tuple[Any, List[str], Dict[str, int], np.ndarray, np.ndarray]] = None
+        self.last_indexing_stats: Dict[str, Dict[str, Any]] = {}
+        self.products = ProductTable()
         self._initialized = False
+        self._init_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # product_id -> (updatedAt, image URL hash) of the products last loaded
+        self._fingerprints: Dict[str, Tuple[str, str]] = {}
+        self._watcher: Optional[ProductWatcher] = None
+        # Catalog size the on-demand embedding cache was last reported too small for
+        self._cache_budget_warned: Optional[int] = None
     
     def _ensure_initialized(self) -> None:
         """Lazy initialization - only load when needed."""
         if self._initialized:
             return
         
-        logger.info("Lazy loading search service components...")
-        self.db_service = get_database_service()
-        self.feature_extractor = get_feature_extractor()
-        
-        # Only pre-compute features if caching is enabled
-        if config.CACHE_PRODUCTS:
-            self._initialize_product_features()
-        else:
-            logger.info("Product feature caching disabled - will compute on-demand")
-            # Load limited products to reduce memory
-            max_products = config.MAX_PRODUCTS if hasattr(config, 'MAX_PRODUCTS') else None
-            self.products = self.db_service.get_products_with_images(limit=max_products)
-            logger.info(f"Loaded {len(self.products)} products (limit: {max_products})")
-        
-        self._initialized = True
+        # Requests run on executor threads, so only one may initialize
+        with self._init_lock:
+            if self._initialized:
+                return
+            
+            logger.info("Lazy loading search service components...")
+            self.db_service = get_database_service()
+            self.feature_extractor = get_feature_extractor()
+            
+            if config.EMBEDDING_STORE_DIR:
+                self.embedding_store = EmbeddingStore(
+                    config.EMBEDDING_STORE_DIR, self.feature_extractor.model_signature
+                )
+            
+            # Only pre-compute features if caching is enabled
+            if config.CACHE_PRODUCTS:
+                if config.PHASH_ENABLED:
+                    self.image_hashes = PerceptualHashIndex()
+                self._initialize_product_features()
+            else:
+                logger.info("Product feature caching disabled - will compute on-demand")
+                self.embedding_cache = EmbeddingCache(
+                    max_bytes=config.EMBEDDING_CACHE_MAX_BYTES,
+                    spill_dir=config.EMBEDDING_CACHE_SPILL_DIR
+                )
+                self.products, self._fingerprints = self._load_products()
+            
+            self._initialized = True
+            
+            if config.WATCH_PRODUCTS:
+                self._watcher = self.db_service.watch_products(
+                    on_upsert=self.apply_product_upsert,
+                    on_delete=self.apply_product_delete
+                )
     
     def _initialize_product_features(self) -> None:
         """Pre-compute features for all products in database."""
         try:
             logger.info("Initializing product features...")
-            # Limit products to reduce memory
-            max_products = config.MAX_PRODUCTS if hasattr(config, 'MAX_PRODUCTS') else None
-            self.products = self.db_service.get_products_with_images(limit=max_products)
+            self.products, fingerprints = self._load_products()
             
-            if not self.products:
+            if not len(self.products):
                 logger.warning("No products with images found in database")
                 return
             
-            success_count = 0
-            for product in self.products:
-                product_id = str(product.get('_id'))
-                image_url = product.get('productImage')
-                
-                if not image_url:
-                    continue
-                
-                # Extract features
-                features = self.feature_extractor.extract_features_from_url(image_url)
+            # Reuse persisted features when the image is unchanged
+            known: Dict[str, np.ndarray] = {}
+            missing = []
+            for product_id, image_url in self.products.items():
+                features = None
+                if self.embedding_store is not None:
+                    features = self.embedding_store.lookup(product_id, image_url)
                 
                 if features is not None:
-                    self.product_features[product_id] = features
-                    success_count += 1
-                    logger.debug(f"Extracted features for product {product_id}")
+                    known[product_id] = features
+                else:
+                    missing.append((product_id, image_url))
+            
+            reused_count = len(known)
+            hashes: Dict[str, int] = {}
+            if missing:
+                known.update(self._compute_features(
+                    missing, hashes if self.image_hashes is not None else None
+                ))
+            
+            ids: List[str] = []
+            vectors: List[np.ndarray] = []
+            image_urls: List[str] = []
+            for product_id, image_url in self.products.items():
+                features = known.get(product_id)
+                if features is not None:
+                    ids.append(product_id)
+                    vectors.append(features)
+                    image_urls.append(image_url)
+            
+            if vectors:
+                self._build_index(ids, vectors, image_urls, changed=reused_count < len(ids))
+                if self.image_hashes is not None:
+                    self._build_image_hashes(ids, image_urls, hashes)
+                self._build_neighbors()
             
-            logger.info(f"Successfully extracted features for {success_count}/{len(self.products)} products")
+            self._fingerprints = {product_id: fingerprints[product_id] for product_id in ids}
+            
+            logger.info(
+                f"Successfully extracted features for {len(ids)}/{len(self.products)} products "
+                f"({reused_count} reused from embedding store)"
+            )
         except Exception as e:
             logger.error(f"Error initializing product features: {str(e)}")
     
+    def _load_products(self) -> Tuple[ProductTable, Dict[str, Tuple[str, str]]]:
+        """
+        Load the catalog from the database into a product table.
+        
+        Returns:
+            Product table and the fingerprint of every product in it
+        """
+        # Limit products to reduce memory
+        max_products = config.MAX_PRODUCTS if hasattr(config, 'MAX_PRODUCTS') else None
+        documents = self.db_service.get_products_with_images(limit=max_products)
+        products = ProductTable.from_documents(documents)
+        
+        fingerprints = {str(d.get('_id')): self._fingerprint(d) for d in documents}
+        fingerprints = {product_id: fingerprints[product_id] for product_id in products.ids}
+        logger.info(f"Loaded {len(products)} products (limit: {max_products})")
+        return products, fingerprints
+    
+    def _compute_features(
+        self,
+        items: List[Tuple[str, str]],
+        hashes: Optional[Dict[str, int]] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Embed product images through the batched indexing pipeline.
+        
+        Args:
+            items: (product_id, image_url) pairs
+            hashes: Filled with the perceptual hash of each decoded image, if given
+            
+        Returns:
+            Mapping of product_id to feature vector
+        """
+        pipeline = IndexingPipeline(self.feature_extractor, compute_hashes=hashes is not None)
+        features = pipeline.run(items)
+        self.last_indexing_stats = pipeline.report()
+        if hashes is not None:
+            hashes.update(pipeline.hashes)
+        return features
+    
+    def _compute_hashes(self, items: List[Tuple[str, str]]) -> Dict[str, int]:
+        """
+        Download product images and compute their perceptual hashes.
+        
+        Args:
+            items: (product_id, image_url) pairs
+            
+        Returns:
+            Mapping of product_id to image hash
+        """
+        product_ids: Dict[str, List[str]] = {}
+        for product_id, image_url in items:
+            product_ids.setdefault(image_url, []).append(product_id)
+        
+        hashes: Dict[str, int] = {}
+        image_processor = self.feature_extractor.image_processor
+        for image_url, image in image_processor.iter_download_images(list(product_ids)):
+            if image is not None:
+                image_hash = dhash(image)
+                for product_id in product_ids[image_url]:
+                    hashes[product_id] = image_hash
+        return hashes
+    
+    def _build_image_hashes(
+        self,
+        ids: List[str],
+        image_urls: List[str],
+        computed: Dict[str, int]
+    ) -> None:
+        """
+        Build the perceptual hash index for the indexed products.
+        
+        Hashes come from the indexing pipeline, then from the saved hash file
+        when the image is unchanged; only the remaining images are downloaded.
+        
+        Args:
+            ids: Indexed product ids
+            image_urls: Image URL of each product
+            computed: Hashes computed while embedding
+        """
+        saved = PerceptualHashIndex()
+        path = self._image_hashes_path()
+        if path is not None:
+            saved.load(path)
+        
+        hashes = PerceptualHashIndex()
+        missing = []
+        for product_id, image_url in zip(ids, image_urls):
+            image_key = EmbeddingStore.hash_url(image_url)
+            image_hash = computed.get(product_id)
+            if image_hash is None:
+                image_hash = saved.lookup(product_id, image_key)
+            
+            if image_hash is None:
+                missing.append((product_id, image_url))
+            else:
+                hashes.add(product_id, image_hash, image_key)
+        
+        if missing:
+            urls = dict(missing)
+            for product_id, image_hash in self._compute_hashes(missing).items():
+                hashes.add(product_id, image_hash, EmbeddingStore.hash_url(urls[product_id]))
+        
+        if path is not None and (computed or missing or len(saved) != len(hashes)):
+            hashes.save(path)
+        self.image_hashes = hashes
+        logger.info(f"Perceptual hashes ready for {len(hashes)}/{len(ids)} products")
+    
+    def _update_image_hashes(
+        self,
+        removed: List[str],
+        changed: List[Tuple[str, str]],
+        computed: Dict[str, int]
+    ) -> None:
+        """
+        Apply catalog changes to the perceptual hash index.
+        
+        Args:
+            removed: Product ids no longer indexed
+            changed: (product_id, image_url) pairs whose image was re-embedded
+            computed: Hashes computed while embedding
+        """
+        if self.image_hashes is None or not (removed or changed):
+            return
+        
+        # Edit a copy so queries keep using the current hashes meanwhile
+        hashes = self.image_hashes.copy()
+        for product_id in removed:
+            hashes.remove(product_id)
+        for product_id, image_url in changed:
+            if product_id in computed:
+                hashes.add(product_id, computed[product_id], EmbeddingStore.hash_url(image_url))
+            else:
+                hashes.remove(product_id)
+        
+        path = self._image_hashes_path()
+        if path is not None:
+            hashes.save(path)
+        self.image_hashes = hashes
+    
+    def _build_neighbors(self) -> None:
+        """
+        Precompute the exact neighbour lists of the current index.
+        
+        Lists are tied to the index they were computed from: an index swapped
+        in by a live product change makes them stale, and "more like this"
+        queries are scored on request until the next refresh rebuilds them.
+        """
+        index = self.index
+        k = config.PRECOMPUTE_NEIGHBORS
+        if k <= 0 or (self._neighbors is not None and self._neighbors[0] is index):
+            return
+        
+        try:
+            started = time.perf_counter()
+            ids = list(index.ids)
+            positions, scores = nearest_neighbors(index.vectors, k)
+            self._neighbors = (index, ids, {pid: i for i, pid in enumerate(ids)}, positions, scores)
+            logger.info(
+                f"Precomputed {positions.shape[1]} neighbours for {len(ids)} products "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+        except Exception as e:
+            logger.error(f"Error precomputing neighbours: {str(e)}")
+    
+    def neighbor_stats(self) -> Optional[Dict[str, Any]]:
+        """
+        Describe the precomputed neighbour lists.
+        
+        Returns:
+            Products covered, neighbours per product and whether the lists
+            match the current index, or None if none were computed
+        """
+        neighbors = self._neighbors
+        if neighbors is None:
+            return None
+        return {
+            "products": len(neighbors[1]),
+            "k": int(neighbors[3].shape[1]),
+            "current": neighbors[0] is self.index,
+        }
+    
+    def _image_hashes_path(self) -> Optional[str]:
+        """Get the file for the perceptual hashes, if an embedding store is configured."""
+        if self.embedding_store is None:
+            return None
+        return os.path.join(self.embedding_store.directory, "phash.npz")
+    
+    def _build_index(
+        self,
+        ids: List[str],
+        vectors: List[np.ndarray],
+        image_urls: List[str],
+        changed: bool
+    ) -> None:
+        """
+        Build the search index, persisting it first when a store is configured.
+        
+        Args:
+            ids: Product ids
+            vectors: Feature vector of each product
+            image_urls: Image URL of each product
+            changed: Whether any vector was newly computed
+        """
+        index = create_index()
+        store = self.embedding_store
+        if store is not None and (changed or store.ids != ids):
+            store.save(ids, np.vstack(vectors), image_urls)
+        
+        if store is not None and store.ids == ids:
+            # Serve straight from the memory-mapped file so the vectors live
+            # in the page cache rather than on the Python heap, and reuse the
+            # saved index structure when no vector changed
+            if changed or not self._load_index_structure(index, ids, store.vectors):
+                index.build(ids, store.vectors)
+                self._save_index_structure(index)
+        else:
+            index.build(ids, np.vstack(vectors))
+        
+        # Swap in the finished index so concurrent searches never see a partial one
+        self.index = index
+    
+    def _persist_index(self, index, image_urls: Dict[str, str]) -> None:
+        """
+        Save an updated index to the embedding store, if one is configured.
+        
+        Args:
+            index: Index to save; it is rebuilt on the memory-mapped copy
+            image_urls: Image URL of every indexed product
+        """
+        store = self.embedding_store
+        if store is None:
+            return
+        
+        ids = list(index.ids)
+        if store.save(ids, index.vectors, [image_urls[product_id] for product_id in ids]):
+            self._save_index_structure(index)
+            if not self._load_index_structure(index, ids, store.vectors):
+                index.build(ids, store.vectors)
+    
+    def _index_structure_path(self, index) -> Optional[str]:
+        """Get the file for the trained structure of an index, if it has one."""
+        if self.embedding_store is None or not hasattr(index, 'save'):
+            return None
+        return os.path.join(self.embedding_store.directory, f"{config.INDEX_TYPE.lower()}_index.npz")
+    
+    def _save_index_structure(self, index) -> None:
+        """Save the trained structure of an index next to the embedding store."""
+        path = self._index_structure_path(index)
+        if path is not None:
+            index.save(path)
+    
+    def _load_index_structure(self, index, ids: List[str], vectors: np.ndarray) -> bool:
+        """
+        Restore the saved structure of an index onto the given vectors.
+        
+        Args:
+            index: Index to restore
+            ids: Product ids
+            vectors: Feature vector of each product
+            
+        Returns:
+            True if a matching structure was restored without retraining
+        """
+        path = self._index_structure_path(index)
+        return path is not None and index.load(path, ids, vectors)
+    
+    @staticmethod
+    def _fingerprint(product: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Summarize the fields of a product that decide whether it changed.
+        
+        Args:
+            product: Product document
+            
+        Returns:
+            (updatedAt, image URL hash) tuple
+        """
+        return (
+            str(product.get('updatedAt')),
+            EmbeddingStore.hash_url(product.get('productImage') or '')
+        )
+    
     def search_by_image_bytes(
         self, 
         image_bytes: bytes, 
         top_k: Optional[int] = None,
-        threshold: Optional[float] = None
+        threshold: Optional[float] = None,
+        nprobe: Optional[int] = None
     ) -> List[SearchResult]:
         """
         Search for similar products using uploaded image bytes.
@@ -92,6 +450,7 @@ class SearchService:
             image_bytes: Image data in bytes
             top_k: Number of top results to return (default from config)
             threshold: Minimum similarity threshold (default from config)
+            nprobe: Clusters to scan with an IVF index (default from config)
             
         Returns:
             List of SearchResult objects sorted by similarity
@@ -106,26 +465,231 @@ class SearchService:
             if threshold is None:
                 threshold = config.SIMILARITY_THRESHOLD
             
-            # Extract features from query image
-            query_features = self.feature_extractor.extract_features_from_bytes(image_bytes)
+            # Extract features from query image, unless the same bytes were seen recently
+            query_features = self._query_features(
+                f"bytes:{hashlib.blake2b(image_bytes, digest_size=16).hexdigest()}",
+                lambda: self._embed_query_image(
+                    self.feature_extractor.image_processor.load_image_from_bytes(image_bytes)
+                )
+            )
             
             if query_features is None:
                 logger.error("Failed to extract features from query image")
                 return []
             
             # Calculate similarities
-            results = self._calculate_similarities(query_features, top_k, threshold)
+            results = self._calculate_similarities(query_features, top_k, threshold, nprobe)
             
             return results
         except Exception as e:
             logger.error(f"Error in search_by_image_bytes: {str(e)}")
             return []
     
+    def search_by_image_file(
+        self,
+        image_file: BinaryIO,
+        top_k: Optional[int] = None,
+        threshold: Optional[float] = None,
+        nprobe: Optional[int] = None
+    ) -> List[SearchResult]:
+        """
+        Search for similar products using an uploaded image file.
+        
+        The file is hashed and decoded in chunks, so the upload is never held
+        in memory as one bytes object.
+        
+        Args:
+            image_file: Seekable binary file with the image data
+            top_k: Number of top results to return (default from config)
+            threshold: Minimum similarity threshold (default from config)
+            nprobe: Clusters to scan with an IVF index (default from config)
+            
+        Returns:
+            List of SearchResult objects sorted by similarity
+        """
+        try:
+            # Ensure services are initialized
+            self._ensure_initialized()
+            
+            # Use defaults if not provided
+            if top_k is None:
+                top_k = config.TOP_K
+            if threshold is None:
+                threshold = config.SIMILARITY_THRESHOLD
+            
+            # Extract features from query image, unless the same bytes were seen recently
+            query_features = self._query_features(
+                self._file_query_key(image_file),
+                lambda: self._embed_query_image(
+                    self.feature_extractor.image_processor.load_image_from_file(image_file)
+                )
+            )
+            
+            if query_features is None:
+                logger.error("Failed to extract features from uploaded image")
+                return []
+            
+            # Calculate similarities
+            results = self._calculate_similarities(query_features, top_k, threshold, nprobe)
+            
+            return results
+        except Exception as e:
+            logger.error(f"Error in search_by_image_file: {str(e)}")
+            return []
+    
+    def search_by_product_id(
+        self,
+        product_id: str,
+        top_k: Optional[int] = None,
+        threshold: Optional[float] = None,
+        nprobe: Optional[int] = None
+    ) -> Optional[List[SearchResult]]:
+        """
+        Find products similar to a catalog product from its stored embedding.
+        
+        No image is downloaded and the model does not run: results come from
+        the precomputed neighbour lists when they are current and long
+        enough, otherwise the product's indexed vector is scored directly.
+        
+        Args:
+            product_id: Product ID
+            top_k: Number of top results to return (default from config)
+            threshold: Minimum similarity threshold (default from config)
+            nprobe: Clusters to scan with an IVF index (default from config)
+            
+        Returns:
+            List of SearchResult objects sorted by similarity, excluding the
+            product itself, or None if the product is not in the catalog
+        """
+        try:
+            # Ensure services are initialized
+            self._ensure_initialized()
+            
+            # Use defaults if not provided
+            if top_k is None:
+                top_k = config.TOP_K
+            if threshold is None:
+                threshold = config.SIMILARITY_THRESHOLD
+            
+            if not config.CACHE_PRODUCTS:
+                return self._search_by_product_on_demand(product_id, top_k, threshold)
+            
+            index = self.index
+            neighbors = self._neighbors
+            if neighbors is not None and neighbors[0] is index and top_k <= neighbors[3].shape[1]:
+                _, ids, rows, positions, scores = neighbors
+                row = rows.get(product_id)
+                if row is None:
+                    return None
+                
+                matches = [
+                    (ids[position], float(score))
+                    for position, score in zip(positions[row, :top_k], scores[row, :top_k])
+                    if score >= threshold
+                ]
+                return self._to_search_results(matches)
+            
+            query_features = index.get(product_id)
+            if query_features is None:
+                return None
+            
+            if nprobe is not None and hasattr(index, 'nprobe'):
+                matches = index.search(query_features, top_k + 1, threshold, nprobe=nprobe)
+            else:
+                matches = index.search(query_features, top_k + 1, threshold)
+            matches = [match for match in matches if match[0] != product_id][:top_k]
+            return self._to_search_results(matches)
+        except Exception as e:
+            logger.error(f"Error in search_by_product_id: {str(e)}")
+            return []
+    
+    def _search_by_product_on_demand(
+        self,
+        product_id: str,
+        top_k: int,
+        threshold: float
+    ) -> Optional[List[SearchResult]]:
+        """
+        Find similar products when product features are computed on demand.
+        
+        The product's vector comes from the embedding cache, and is only
+        computed if it has been evicted.
+        """
+        image_url = self.products.image_url(product_id)
+        if image_url is None:
+            return None
+        
+        cache_key = f"{product_id}:{EmbeddingStore.hash_url(image_url)}"
+        query_features = self.embedding_cache.get(cache_key)
+        if query_features is None:
+            query_features = self._compute_features([(product_id, image_url)]).get(product_id)
+            if query_features is None:
+                return []
+            self.embedding_cache.put(cache_key, query_features)
+        
+        results = self._calculate_similarities_on_demand(query_features, top_k + 1, threshold)
+        results = [result for result in results if result.product.id != product_id][:top_k]
+        for rank, result in enumerate(results, start=1):
+            result.rank = rank
+        return results
+    
+    def search_by_vector(
+        self,
+        vector: np.ndarray,
+        model: str,
+        top_k: Optional[int] = None,
+        threshold: Optional[float] = None,
+        nprobe: Optional[int] = None
+    ) -> List[SearchResult]:
+        """
+        Search for similar products with a query embedding computed elsewhere.
+        
+        The vector goes straight to scoring; nothing is decoded and the model
+        does not run. It is L2-normalized before scoring.
+        
+        Args:
+            vector: Query embedding
+            model: Model that produced the vector (model name or signature)
+            top_k: Number of top results to return (default from config)
+            threshold: Minimum similarity threshold (default from config)
+            nprobe: Clusters to scan with an IVF index (default from config)
+            
+        Returns:
+            List of SearchResult objects sorted by similarity
+            
+        Raises:
+            ValueError: If the vector does not belong to the catalog's embedding space
+        """
+        self._ensure_initialized()
+        
+        signature = self.feature_extractor.model_signature
+        if model not in (self.feature_extractor.model_name, signature):
+            raise ValueError(f"Vector is from model '{model}', but the catalog is embedded with '{signature}'")
+        
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        dim = self._embedding_dim()
+        if dim is not None and query.shape[0] != dim:
+            raise ValueError(f"Vector has {query.shape[0]} dimensions, expected {dim}")
+        if not np.all(np.isfinite(query)):
+            raise ValueError("Vector contains NaN or infinite values")
+        norm = float(np.linalg.norm(query))
+        if norm == 0.0:
+            raise ValueError("Vector has zero length")
+        
+        # Use defaults if not provided
+        if top_k is None:
+            top_k = config.TOP_K
+        if threshold is None:
+            threshold = config.SIMILARITY_THRESHOLD
+        
+        return self._calculate_similarities(query / norm, top_k, threshold, nprobe)
+    
     def search_by_image_url(
         self, 
         image_url: str, 
         top_k: Optional[int] = None,
-        threshold: Optional[float] = None
+        threshold: Optional[float] = None,
+        nprobe: Optional[int] = None
     ) -> List[SearchResult]:
         """
         Search for similar products using image URL.
@@ -134,6 +698,7 @@ class SearchService:
             image_url: URL of the query image
             top_k: Number of top results to return (default from config)
             threshold: Minimum similarity threshold (default from config)
+            nprobe: Clusters to scan with an IVF index (default from config)
             
         Returns:
             List of SearchResult objects sorted by similarity
@@ -148,26 +713,307 @@ class SearchService:
             if threshold is None:
                 threshold = config.SIMILARITY_THRESHOLD
             
-            # Extract features from query image
-            query_features = self.feature_extractor.extract_features_from_url(image_url)
+            # Extract features from query image, unless the same URL was seen recently
+            query_features = self._query_features(
+                f"url:{ImageProcessor.normalize_url(image_url)}",
+                lambda: self._embed_query_image(
+                    self.feature_extractor.image_processor.download_image(image_url)
+                )
+            )
             
             if query_features is None:
                 logger.error("Failed to extract features from query image URL")
                 return []
             
             # Calculate similarities
-            results = self._calculate_similarities(query_features, top_k, threshold)
+            results = self._calculate_similarities(query_features, top_k, threshold, nprobe)
             
             return results
         except Exception as e:
             logger.error(f"Error in search_by_image_url: {str(e)}")
             return []
     
+    @staticmethod
+    def _file_query_key(image_file: BinaryIO) -> str:
+        """
+        Get the query cache key of an image file, reading it in chunks.
+        
+        The key equals the one search_by_image_bytes uses for the same bytes.
+        
+        Args:
+            image_file: Seekable binary file
+            
+        Returns:
+            Query cache key
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        image_file.seek(0)
+        for chunk in iter(lambda: image_file.read(1 << 16), b''):
+            digest.update(chunk)
+        return f"bytes:{digest.hexdigest()}"
+    
+    def _query_features(
+        self,
+        key: str,
+        compute: Callable[[], Optional[np.ndarray]]
+    ) -> Optional[np.ndarray]:
+        """
+        Get query features from the query cache, computing them on a miss.
+        
+        Concurrent misses for the same key wait for a single computation.
+        
+        Args:
+            key: Cache key of the query image
+            compute: Function extracting the features
+            
+        Returns:
+            Feature vector or None if extraction failed
+        """
+        cache = self.query_cache
+        if cache is not None:
+            features = cache.get(key)
+            if features is not None:
+                return features
+        
+        def compute_and_cache() -> Optional[np.ndarray]:
+            features = compute()
+            # Cached before the waiting callers are released
+            if features is not None and cache is not None:
+                cache.put(key, features)
+            return features
+        
+        return self.query_flight.do(key, compute_and_cache)
+    
+    def _embed_query_image(self, image) -> Optional[np.ndarray]:
+        """
+        Embed a query image, skipping inference for near-exact catalog copies.
+        
+        When the perceptual hash fast path is enabled and the image hash is
+        within PHASH_MAX_DISTANCE bits of an indexed image, that product's
+        stored vector is used as the query embedding.
+        
+        Args:
+            image: Decoded query image, or None if decoding failed
+            
+        Returns:
+            Feature vector or None if extraction failed
+        """
+        if image is None:
+            return None
+        
+        features = self._match_image_hash(image)
+        if features is not None:
+            return features
+        
+        return self.feature_extractor.extract_features_from_image(image)
+    
+    def _match_image_hash(self, image) -> Optional[np.ndarray]:
+        """
+        Look up the stored vector of a catalog image the query image nearly copies.
+        
+        Args:
+            image: Decoded query image
+            
+        Returns:
+            Stored feature vector, or None without a perceptual hash match
+        """
+        hashes = self.image_hashes
+        if hashes is None:
+            return None
+        
+        match = hashes.match(dhash(image), config.PHASH_MAX_DISTANCE)
+        if match is None:
+            return None
+        
+        features = self.index.get(match[0])
+        if features is None:
+            return None
+        logger.debug(f"Query matched product {match[0]} by perceptual hash (distance {match[1]})")
+        return np.array(features, dtype=np.float32)
+    
+    def search_batch(
+        self,
+        image_files: List[BinaryIO],
+        image_urls: List[str],
+        top_k: Optional[int] = None,
+        threshold: Optional[float] = None,
+        nprobe: Optional[int] = None
+    ) -> List[Tuple[List[SearchResult], Optional[str]]]:
+        """
+        Search for similar products for many query images at once.
+        
+        Images missing from the query cache are embedded in one batched
+        forward pass and all queries are scored together. Images another
+        request is already embedding are waited for instead of embedded again.
+        
+        Args:
+            image_files: Seekable binary files with uploaded images
+            image_urls: URLs of query images
+            top_k: Number of top results to return per query (default from config)
+            threshold: Minimum similarity threshold (default from config)
+            nprobe: Clusters to scan with an IVF index (default from config)
+            
+        Returns:
+            (results, error) per query, files first and then URLs, in request order
+        """
+        self._ensure_initialized()
+        
+        # Use defaults if not provided
+        if top_k is None:
+            top_k = config.TOP_K
+        if threshold is None:
+            threshold = config.SIMILARITY_THRESHOLD
+        
+        count = len(image_files) + len(image_urls)
+        features: List[Optional[np.ndarray]] = [None] * count
+        errors: List[Optional[str]] = [None] * count
+        cache = self.query_cache
+        image_processor = self.feature_extractor.image_processor
+        
+        keys = [self._file_query_key(image_file) for image_file in image_files]
+        keys.extend(f"url:{ImageProcessor.normalize_url(image_url)}" for image_url in image_urls)
+        if cache is not None:
+            features = [cache.get(key) for key in keys]
+        
+        # Queries with the same key (identical bytes or URL) are processed once,
+        # and keys another request is already embedding are waited for
+        positions: Dict[str, List[int]] = {}
+        for i, key in enumerate(keys):
+            if features[i] is None:
+                positions.setdefault(key, []).append(i)
+        claimed, in_flight = self.query_flight.claim(positions)
+        
+        computed: Dict[str, np.ndarray] = {}
+        try:
+            # Decode the uploads and download the URLs that missed the cache
+            images: Dict[str, Any] = {}
+            url_keys: Dict[str, str] = {}
+            for key in claimed:
+                group = positions[key]
+                if group[0] < len(image_files):
+                    image = image_processor.load_image_from_file(image_files[group[0]])
+                    if image is None:
+                        for i in group:
+                            errors[i] = "Could not decode image"
+                    else:
+                        images[key] = image
+                else:
+                    url_keys[image_urls[group[0] - len(image_files)]] = key
+            for image_url, image in image_processor.iter_download_images(list(url_keys)):
+                key = url_keys[image_url]
+                if image is None:
+                    for i in positions[key]:
+                        errors[i] = "Could not download or decode image"
+                else:
+                    images[key] = image
+            
+            # Near-exact catalog copies skip inference; the rest share one forward pass
+            to_embed = []
+            for key, image in images.items():
+                matched = self._match_image_hash(image)
+                if matched is None:
+                    to_embed.append(key)
+                else:
+                    computed[key] = matched
+            
+            if to_embed:
+                vectors = self.feature_extractor.extract_batch_features([images[key] for key in to_embed])
+                if vectors is None:
+                    for key in to_embed:
+                        for i in positions[key]:
+                            errors[i] = "Failed to extract image features"
+                else:
+                    computed.update(zip(to_embed, vectors))
+        finally:
+            for key in claimed:
+                key_features = computed.get(key)
+                # Cached before the waiting callers are released
+                if key_features is not None and cache is not None:
+                    cache.put(key, key_features)
+                self.query_flight.resolve(key, key_features)
+        
+        # Only waited for once this request's own keys are released
+        for key, future in in_flight.items():
+            try:
+                key_features = future.result()
+            except Exception as e:
+                logger.error(f"Error extracting shared query features: {str(e)}")
+                key_features = None
+            if key_features is None:
+                for i in positions[key]:
+                    errors[i] = "Failed to extract image features"
+            else:
+                computed[key] = key_features
+        
+        for key, key_features in computed.items():
+            for i in positions[key]:
+                features[i] = key_features
+        
+        queries = [i for i in range(count) if features[i] is not None]
+        results: List[Tuple[List[SearchResult], Optional[str]]] = [([], error) for error in errors]
+        if queries:
+            matches = self._calculate_batch_similarities(
+                np.vstack([features[i] for i in queries]), top_k, threshold, nprobe
+            )
+            for i, query_results in zip(queries, matches):
+                results[i] = (query_results, None)
+        
+        logger.info(f"Batch search completed for {len(queries)}/{count} queries")
+        return results
+    
+    def _calculate_batch_similarities(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        threshold: float,
+        nprobe: Optional[int] = None
+    ) -> List[List[SearchResult]]:
+        """
+        Calculate similarity scores for several queries.
+        
+        Indexes that support it score all queries with one matrix-matrix
+        product; others are searched query by query.
+        
+        Args:
+            queries: Query feature vectors (Q x D)
+            top_k: Number of top results to return per query
+            threshold: Minimum similarity threshold
+            nprobe: Clusters to scan with an IVF index (default from config)
+            
+        Returns:
+            One list of SearchResult objects per query
+        """
+        index = self.index
+        if not config.CACHE_PRODUCTS or not hasattr(index, 'search_batch'):
+            return [
+                self._calculate_similarities(query, top_k, threshold, nprobe) for query in queries
+            ]
+        
+        try:
+            return [
+                self._to_search_results(matches)
+                for matches in index.search_batch(queries, top_k, threshold)
+            ]
+        except Exception as e:
+            logger.error(f"Error calculating batch similarities: {str(e)}")
+            return [[] for _ in range(len(queries))]
+    
+    def _embedding_dim(self) -> Optional[int]:
+        """Length of the catalog embeddings, or None if it cannot be known yet."""
+        if config.CACHE_PRODUCTS and self.index.dim is not None:
+            return self.index.dim
+        dim = self.feature_extractor.embedding_dim
+        if dim is None and self.embedding_cache is not None:
+            # On-demand mode: fall back to a product vector embedded earlier
+            dim = self.embedding_cache.dim
+        return dim
+    
     def _calculate_similarities(
         self, 
         query_features: np.ndarray, 
         top_k: int,
-        threshold: float
+        threshold: float,
+        nprobe: Optional[int] = None
     ) -> List[SearchResult]:
         """
         Calculate similarity scores between query and all products.
@@ -176,6 +1022,7 @@ class SearchService:
             query_features: Feature vector of query image
             top_k: Number of top results to return
             threshold: Minimum similarity threshold
+            nprobe: Clusters to scan with an IVF index (default from config)
             
         Returns:
             List of SearchResult objects sorted by similarity
@@ -185,54 +1032,17 @@ class SearchService:
             if not config.CACHE_PRODUCTS:
                 return self._calculate_similarities_on_demand(query_features, top_k, threshold)
             
-            if not self.product_features:
+            index = self.index
+            if not len(index):
                 logger.warning("No product features available for comparison")
                 return []
             
-            similarities = []
+            if nprobe is not None and hasattr(index, 'nprobe'):
+                top_similarities = index.search(query_features, top_k, threshold, nprobe=nprobe)
+            else:
+                top_similarities = index.search(query_features, top_k, threshold)
             
-            # Calculate cosine similarity for each product
-            for product_id, product_features in self.product_features.items():
-                similarity = cosine_similarity(
-                    query_features.reshape(1, -1),
-                    product_features.reshape(1, -1)
-                )[0][0]
-                
-                # Apply threshold
-                if similarity >= threshold:
-                    similarities.append({
-                        'product_id': product_id,
-                        'similarity': float(similarity)
-                    })
-            
-            # Sort by similarity (descending)
-            similarities.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            # Take top K
-            top_similarities = similarities[:top_k]
-            
-            # Create SearchResult objects
-            results = []
-            for rank, item in enumerate(top_similarities, start=1):
-                product_id = item['product_id']
-                similarity = item['similarity']
-                
-                # Find product data
-                product_data = next(
-                    (p for p in self.products if str(p.get('_id')) == product_id),
-                    None
-                )
-                
-                if product_data:
-                    # Convert MongoDB document to Product model
-                    product = Product(**product_data)
-                    
-                    result = SearchResult(
-                        product=product,
-                        similarity_score=similarity,
-                        rank=rank
-                    )
-                    results.append(result)
+            results = self._to_search_results(top_similarities)
             
             logger.info(f"Found {len(results)} similar products (threshold: {threshold})")
             return results
@@ -240,6 +1050,30 @@ class SearchService:
             logger.error(f"Error calculating similarities: {str(e)}")
             return []
     
+    def _to_search_results(self, top_similarities: List[Tuple[str, float]]) -> List[SearchResult]:
+        """
+        Create SearchResult objects for index matches.
+        
+        Args:
+            top_similarities: (product_id, similarity) sorted by descending similarity
+            
+        Returns:
+            List of SearchResult objects for the products still in the catalog
+        """
+        results = []
+        products = self.products
+        for rank, (product_id, similarity) in enumerate(top_similarities, start=1):
+            product = products.get(product_id)
+            
+            if product is not None:
+                result = SearchResult(
+                    product=product,
+                    similarity_score=similarity,
+                    rank=rank
+                )
+                results.append(result)
+        return results
+    
     def _calculate_similarities_on_demand(
         self, 
         query_features: np.ndarray, 
@@ -248,56 +1082,81 @@ class SearchService:
     ) -> List[SearchResult]:
         """
         Calculate similarities by computing product features on-demand.
-        This uses less memory but is slower than pre-computed features.
+        Features are kept in a byte-bounded LRU cache, so each product is only
+        embedded again after it has been evicted.
         """
         try:
-            if not self.products:
+            products = self.products
+            if not len(products):
                 logger.warning("No products available")
                 return []
             
-            similarities = []
-            
-            # Compute features on-demand for each product
-            for product in self.products:
-                product_id = str(product.get('_id'))
-                image_url = product.get('productImage')
-                
-                if not image_url:
-                    continue
-                
-                # Extract features on-the-fly
-                product_features = self.feature_extractor.extract_features_from_url(image_url)
+            # Look up cached features and collect the products missing from the cache
+            cached: Dict[str, np.ndarray] = {}
+            missing = []
+            cache_keys: Dict[str, str] = {}
+            for product_id, image_url in products.items():
+                cache_key = f"{product_id}:{EmbeddingStore.hash_url(image_url)}"
+                cache_keys[product_id] = cache_key
+                product_features = self.embedding_cache.get(cache_key)
                 
                 if product_features is None:
-                    continue
+                    missing.append((product_id, image_url))
+                else:
+                    cached[product_id] = product_features
+            
+            # Compute missing features in batches; products another query is
+            # already embedding are waited for instead of embedded twice
+            if missing:
+                flight_keys = {
+                    f"catalog:{cache_keys[product_id]}": (product_id, image_url)
+                    for product_id, image_url in missing
+                }
+                claimed, in_flight = self.query_flight.claim(flight_keys)
+                computed: Dict[str, np.ndarray] = {}
+                try:
+                    if claimed:
+                        computed = self._compute_features([flight_keys[key] for key in claimed])
+                finally:
+                    for key in claimed:
+                        product_id = flight_keys[key][0]
+                        product_features = computed.get(product_id)
+                        # Cached before the waiting queries are released
+                        if product_features is not None:
+                            self.embedding_cache.put(cache_keys[product_id], product_features)
+                        self.query_flight.resolve(key, product_features)
+                cached.update(computed)
                 
-                # Calculate similarity
-                similarity = cosine_similarity(
-                    query_features.reshape(1, -1),
-                    product_features.reshape(1, -1)
-                )[0][0]
+                # Only waited for once this query's own products are released
+                for key, future in in_flight.items():
+                    product_features = future.result()
+                    if product_features is not None:
+                        cached[flight_keys[key][0]] = product_features
                 
-                # Apply threshold
-                if similarity >= threshold:
-                    similarities.append({
-                        'product_id': product_id,
-                        'product_data': product,
-                        'similarity': float(similarity)
-                    })
+                self._check_embedding_cache_budget(len(products))
             
-            # Sort by similarity (descending)
-            similarities.sort(key=lambda x: x['similarity'], reverse=True)
+            candidates = []
+            vectors = []
+            for product_id in products.ids:
+                product_features = cached.get(product_id)
+                if product_features is not None:
+                    candidates.append(product_id)
+                    vectors.append(product_features)
             
-            # Take top K
-            top_similarities = similarities[:top_k]
+            if not vectors:
+                return []
+            
+            # Score all computed features at once and keep the top K
+            scores = np.vstack(vectors) @ query_features.astype(np.float32).ravel()
+            positions = select_top_k(scores, top_k, threshold)
             
             # Create SearchResult objects
             results = []
-            for rank, item in enumerate(top_similarities, start=1):
-                product = Product(**item['product_data'])
+            for rank, position in enumerate(positions, start=1):
+                product = products.get(candidates[position])
                 result = SearchResult(
                     product=product,
-                    similarity_score=item['similarity'],
+                    similarity_score=float(scores[position]),
                     rank=rank
                 )
                 results.append(result)
@@ -313,13 +1172,241 @@ class SearchService:
             logger.error(f"Error in on-demand similarity calculation: {str(e)}")
             return []
     
-    def refresh_product_features(self) -> None:
-        """Refresh product features from database."""
+    def _check_embedding_cache_budget(self, product_count: int) -> None:
+        """
+        Warn once per catalog size when the catalog does not fit the embedding cache.
+        
+        The LRU then evicts products before the next query reaches them, so
+        every query embeds (or reads back from the spill directory) most of
+        the catalog again.
+        
+        Args:
+            product_count: Number of products in the catalog
+        """
+        dim = self._embedding_dim()
+        if dim is None or self._cache_budget_warned == product_count:
+            return
+        
+        catalog_bytes = product_count * dim * np.dtype(np.float32).itemsize
+        if catalog_bytes <= self.embedding_cache.max_bytes:
+            return
+        
+        self._cache_budget_warned = product_count
+        fallback = (
+            "read back from EMBEDDING_CACHE_SPILL_DIR" if self.embedding_cache.spill_dir
+            else "re-embedded"
+        )
+        logger.warning(
+            f"Catalog embeddings need {catalog_bytes} bytes but EMBEDDING_CACHE_MAX_BYTES is "
+            f"{self.embedding_cache.max_bytes}; evicted products are {fallback} on every query. "
+            f"Raise EMBEDDING_CACHE_MAX_BYTES or enable CACHE_PRODUCTS"
+        )
+    
+    def index_recall_report(self, sample_size: int = 100, top_k: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Measure how well the approximate index agrees with exact search.
+        
+        Indexed vectors are used as sample queries.
+        
+        Args:
+            sample_size: Number of sample queries
+            top_k: Number of neighbours compared per query (default from config)
+            
+        Returns:
+            Recall report, or None if the index is exact
+        """
+        self._ensure_initialized()
+        index = self.index
+        if not hasattr(index, 'recall_report'):
+            return None
+        
+        top_k = top_k or config.TOP_K
+        if not len(index):
+            return index.recall_report(np.empty((0, index.dim or 0), dtype=np.float32), top_k)
+        
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(index), size=min(sample_size, len(index)), replace=False)
+        return index.recall_report(np.asarray(index.vectors[np.sort(rows)]), top_k)
+    
+    def model_drift_report(self, sample_size: int = 32, top_k: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Measure how far the serving model's embeddings drift from float32.
+        
+        Args:
+            sample_size: Number of catalog images to embed with both models
+            top_k: Number of neighbours compared within the sample (default from config)
+            
+        Returns:
+            Drift report from the feature extractor
+        """
+        self._ensure_initialized()
+        urls = sorted({image_url for _, image_url in self.products.items()})
+        if not urls:
+            raise ValueError("No catalog images available for the drift report")
+        
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(urls), size=min(sample_size, len(urls)), replace=False)
+        images = [
+            image for _, image in self.feature_extractor.image_processor.iter_download_images(
+                [urls[i] for i in sample]
+            )
+            if image is not None
+        ]
+        if not images:
+            raise ValueError("None of the sampled catalog images could be downloaded")
+        
+        return self.feature_extractor.drift_report(images, top_k or config.TOP_K)
+    
+    def refresh_product_features(self) -> Dict[str, int]:
+        """
+        Refresh product features from database.
+        
+        The catalog is diffed against the current index by _id, updatedAt and
+        image URL hash: only new products and products whose image changed are
+        embedded, deleted products are dropped and all other vectors are reused.
+        
+        Returns:
+            Counts of added, updated, removed and unchanged products
+        """
         logger.info("Refreshing product features...")
         self._ensure_initialized()
-        self.product_features.clear()
-        self.products.clear()
-        self._initialize_product_features()
+        
+        with self._refresh_lock:
+            products, latest = self._load_products()
+            current = self._fingerprints
+            added = [pid for pid in latest if pid not in current]
+            updated = [pid for pid in latest if pid in current and latest[pid] != current[pid]]
+            removed = [pid for pid in current if pid not in latest]
+            summary = {
+                "added": len(added),
+                "updated": len(updated),
+                "removed": len(removed),
+                "unchanged": len(latest) - len(added) - len(updated),
+            }
+            
+            if config.CACHE_PRODUCTS:
+                image_urls = dict(products.items())
+                # Metadata-only edits keep their vector; only new images are embedded
+                to_embed = [
+                    (pid, image_urls[pid]) for pid in added + updated
+                    if pid not in self.index or latest[pid][1] != current[pid][1]
+                ]
+                hashes: Optional[Dict[str, int]] = {} if self.image_hashes is not None else None
+                features = self._compute_features(to_embed, hashes) if to_embed else {}
+                
+                # Edit a copy so searches keep using the current index meanwhile
+                index = self.index.copy()
+                for pid in removed:
+                    index.remove(pid)
+                for pid, _ in to_embed:
+                    if pid in features:
+                        index.add(pid, features[pid])
+                    else:
+                        # Drop the stale vector; the product is retried next refresh
+                        index.remove(pid)
+                
+                if removed or to_embed:
+                    self._persist_index(index, image_urls)
+                self.index = index
+                self._update_image_hashes(
+                    removed + [pid for pid, _ in to_embed if pid not in features],
+                    [(pid, url) for pid, url in to_embed if pid in features],
+                    hashes or {}
+                )
+                self._build_neighbors()
+                latest = {pid: fp for pid, fp in latest.items() if pid in index}
+            
+            # On-demand features are cached by image URL hash, so changed images
+            # simply miss the cache and only the product list needs replacing
+            self.products = products
+            self._fingerprints = latest
+            
+            logger.info(f"Product features refreshed: {summary}")
+            return summary
+    
+    def apply_product_upsert(self, product: Dict[str, Any]) -> None:
+        """
+        Apply an inserted or updated product to the loaded catalog and index.
+        
+        Args:
+            product: Full product document
+        """
+        if not self._initialized:
+            return
+        
+        product_id = str(product.get('_id'))
+        image_url = product.get('productImage')
+        if not image_url:
+            self.apply_product_delete(product_id)
+            return
+        
+        with self._refresh_lock:
+            fingerprint = self._fingerprint(product)
+            previous = self._fingerprints.get(product_id)
+            if previous is None and config.MAX_PRODUCTS and len(self._fingerprints) >= config.MAX_PRODUCTS:
+                logger.debug(f"Ignoring new product {product_id}: MAX_PRODUCTS reached")
+                return
+            
+            products = self.products.upsert(product)
+            if product_id not in products:
+                # The document does not match the Product schema
+                return
+            
+            if config.CACHE_PRODUCTS and (
+                product_id not in self.index or previous is None or previous[1] != fingerprint[1]
+            ):
+                hashes: Optional[Dict[str, int]] = {} if self.image_hashes is not None else None
+                features = self._compute_features([(product_id, image_url)], hashes).get(product_id)
+                index = self.index.copy()
+                if features is not None:
+                    index.add(product_id, features)
+                else:
+                    index.remove(product_id)
+                # Write the change through so a restart does not re-embed it; this
+                # also moves the edited copy back onto the memory-mapped store
+                self._persist_index(index, dict(products.items()))
+                self.index = index
+                if features is not None:
+                    self._update_image_hashes([], [(product_id, image_url)], hashes or {})
+                else:
+                    self._update_image_hashes([product_id], [], {})
+                if features is None:
+                    return
+            
+            self.products = products
+            self._fingerprints = {**self._fingerprints, product_id: fingerprint}
+            logger.info(f"Applied change to product {product_id}")
+    
+    def apply_product_delete(self, product_id: str) -> None:
+        """
+        Remove a deleted product from the loaded catalog and index.
+        
+        Args:
+            product_id: Product ID
+        """
+        if not self._initialized:
+            return
+        
+        with self._refresh_lock:
+            products = self.products.remove(product_id)
+            if product_id in self.index:
+                index = self.index.copy()
+                index.remove(product_id)
+                self._persist_index(index, dict(products.items()))
+                self.index = index
+                self._update_image_hashes([product_id], [], {})
+            
+            self.products = products
+            self._fingerprints = {
+                pid: fp for pid, fp in self._fingerprints.items() if pid != product_id
+            }
+            logger.info(f"Removed product {product_id}")
+    
+    def close(self) -> None:
+        """Stop the product watcher, if running."""
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
 
 
 # Singleton instance
@@ -337,3 +1424,9 @@ def get_search_service() -> SearchService:
     if _search_service is None:
         _search_service = SearchService()
     return _search_service
+
+
+def shutdown_search_service() -> None:
+    """Stop background work of the search service if it was created."""
+    if _search_service is not None:
+        _search_service.close()
@@ -0,0 +1,427 @@
+"""
+In-memory vector index for scoring product embeddings.
+"""
+import logging
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from config.settings import config
+
+logger = logging.getLogger(__name__)
+
+
+def select_top_k(scores: np.ndarray, top_k: int, threshold: float) -> np.ndarray:
+    """
+    Select the positions of the best scores above a threshold.
+
+    Uses a partial sort so only the top K candidates are fully ordered.
+
+    Args:
+        scores: 1-D array of similarity scores
+        top_k: Maximum number of positions to return
+        threshold: Minimum similarity threshold
+
+    Returns:
+        Positions into scores, sorted by descending score
+    """
+    if top_k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.intp)
+
+    candidates = np.flatnonzero(scores >= threshold)
+    if candidates.size > top_k:
+        partition = np.argpartition(scores[candidates], -top_k)[-top_k:]
+        candidates = np.sort(candidates[partition])
+
+    order = np.argsort(-scores[candidates], kind='stable')
+    return candidates[order]
+
+
+def nearest_neighbors(
+    vectors: np.ndarray,
+    k: int,
+    chunk_size: int = 1024
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the exact k nearest neighbours of every row among the other rows.
+
+    Rows are scored against the whole matrix one chunk at a time, so peak
+    memory is chunk_size x N scores.
+
+    Args:
+        vectors: N x D matrix of normalized embeddings
+        k: Neighbours per row
+        chunk_size: Rows scored per matrix product
+
+    Returns:
+        (positions, scores), both N x min(k, N - 1), sorted by descending score
+    """
+    count = vectors.shape[0]
+    k = max(0, min(k, count - 1))
+    positions = np.empty((count, k), dtype=np.int32)
+    scores = np.empty((count, k), dtype=np.float32)
+    if k == 0:
+        return positions, scores
+
+    for start in range(0, count, chunk_size):
+        stop = min(start + chunk_size, count)
+        chunk_scores = np.asarray(vectors[start:stop]) @ np.asarray(vectors).T
+        rows = np.arange(stop - start)
+        # A product is not its own neighbour
+        chunk_scores[rows, rows + start] = -np.inf
+        top = np.argpartition(-chunk_scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(chunk_scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        positions[start:stop] = np.take_along_axis(top, order, axis=1)
+        scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+    return positions, scores
+
+
+def temporary_memmap(shape: Tuple[int, ...], directory: str = "") -> np.memmap:
+    """
+    Allocate a float32 array backed by an unlinked temporary file.
+
+    Args:
+        shape: Array shape
+        directory: Directory for the file (empty for the system temp directory)
+
+    Returns:
+        Writable memory-mapped array
+    """
+    return np.memmap(
+        tempfile.TemporaryFile(dir=directory or None),
+        dtype=np.float32, mode='w+', shape=shape
+    )
+
+
+def spill_vectors(vectors: np.ndarray, directory: str = "") -> np.ndarray:
+    """
+    Move a float32 matrix off the heap into an unlinked temporary file.
+
+    Args:
+        vectors: N x D matrix
+        directory: Directory for the file (empty for the system temp directory)
+
+    Returns:
+        Memory-mapped copy, or the input if it is already memory-mapped or empty
+    """
+    if isinstance(vectors, np.memmap) or not len(vectors):
+        return vectors
+    spilled = temporary_memmap(np.shape(vectors), directory)
+    spilled[:] = vectors
+    return spilled
+
+
+def rerank_candidates(
+    vectors: np.ndarray,
+    ids: Sequence[str],
+    query: np.ndarray,
+    candidates: np.ndarray,
+    top_k: int,
+    threshold: float
+) -> List[Tuple[str, float]]:
+    """
+    Score candidate rows exactly with their float32 vectors and keep the best.
+
+    Args:
+        vectors: N x D float32 matrix, usually memory-mapped
+        ids: Product ids, parallel to the rows of vectors
+        query: Normalized query embedding
+        candidates: Rows chosen by an approximate score
+        top_k: Number of top results to return
+        threshold: Minimum similarity threshold
+
+    Returns:
+        List of (product_id, similarity) sorted by descending similarity
+    """
+    # Sorted rows make the gather from the memory-mapped vectors sequential
+    rows = np.sort(candidates)
+    exact = vectors[rows] @ query
+    order = select_top_k(exact, top_k, threshold)
+    rows = rows[order]
+    return [(ids[row], float(score)) for row, score in zip(rows, exact[order])]
+
+
+class FlatIndex:
+    """Exact cosine-similarity index over a contiguous float32 matrix.
+
+    Vectors are expected to be L2-normalized (as produced by FeatureExtractor),
+    so cosine similarity reduces to a single matrix-vector product.
+    """
+
+    def __init__(self, spill_dir: Optional[str] = None):
+        """
+        Initialize an empty index.
+
+        Args:
+            spill_dir: If set, vectors are kept in an unlinked temporary file in
+                this directory (memory-mapped) instead of on the Python heap
+        """
+        self.spill_dir = spill_dir
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._owns_buffer = False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self._positions
+
+    @property
+    def dim(self) -> Optional[int]:
+        """Embedding dimension, or None if the index has never held vectors."""
+        return None if self._vectors is None else self._vectors.shape[1]
+
+    @property
+    def ids(self) -> List[str]:
+        """Product ids, parallel to the rows of vectors."""
+        return self._ids
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """N x D float32 matrix of the indexed embeddings."""
+        if self._vectors is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._vectors[:len(self._ids)]
+
+    def build(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        """
+        Replace the index contents.
+
+        Args:
+            ids: Product ids, one per row of vectors
+            vectors: N x D matrix of normalized embeddings
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids):
+            raise ValueError(
+                f"Expected {len(ids)} x D vectors, got shape {vectors.shape}"
+            )
+
+        # The matrix may be shared with the caller (or memory-mapped), so it is
+        # copied on the first mutation rather than up front
+        self._vectors = vectors
+        self._owns_buffer = False
+        self._ids = [str(product_id) for product_id in ids]
+        self._positions = {product_id: i for i, product_id in enumerate(self._ids)}
+
+    def copy(self) -> "FlatIndex":
+        """
+        Create an independent index with the same contents.
+
+        The matrix is shared until either index is mutated, so copying is cheap
+        and a copy can be edited while the original keeps serving searches.
+
+        Returns:
+            New FlatIndex
+        """
+        index = FlatIndex(spill_dir=self.spill_dir)
+        if self._ids:
+            index.build(list(self._ids), self.vectors)
+        return index
+
+    def add(self, product_id: str, vector: np.ndarray) -> None:
+        """
+        Insert or replace the vector of a product.
+
+        Args:
+            product_id: Product ID
+            vector: Normalized embedding
+        """
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        position = self._positions.get(product_id)
+        if position is None:
+            position = len(self._ids)
+            self._reserve(position + 1, vector.shape[0])
+            self._ids.append(product_id)
+            self._positions[product_id] = position
+        elif not self._owns_buffer:
+            self._reserve(len(self._ids), vector.shape[0])
+
+        self._vectors[position] = vector
+
+    def remove(self, product_id: str) -> bool:
+        """
+        Remove a product from the index.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            True if the product was indexed
+        """
+        position = self._positions.pop(product_id, None)
+        if position is None:
+            return False
+
+        last = len(self._ids) - 1
+        if position != last:
+            if not self._owns_buffer:
+                self._reserve(last + 1, self._vectors.shape[1])
+            # Move the last row into the freed slot to keep the matrix dense
+            moved_id = self._ids[last]
+            self._vectors[position] = self._vectors[last]
+            self._ids[position] = moved_id
+            self._positions[moved_id] = position
+        self._ids.pop()
+        return True
+
+    def position(self, product_id: str) -> Optional[int]:
+        """
+        Get the row of a product in vectors.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            Row number or None if the product is not indexed
+        """
+        return self._positions.get(product_id)
+
+    def get(self, product_id: str) -> Optional[np.ndarray]:
+        """
+        Get the stored vector of a product.
+
+        Args:
+            product_id: Product ID
+
+        Returns:
+            Embedding or None if the product is not indexed
+        """
+        position = self._positions.get(product_id)
+        if position is None:
+            return None
+        return self._vectors[position]
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        threshold: float
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the most similar products to a query vector.
+
+        Args:
+            query: Normalized query embedding
+            top_k: Number of top results to return
+            threshold: Minimum similarity threshold
+
+        Returns:
+            List of (product_id, similarity) sorted by descending similarity
+        """
+        if not self._ids:
+            return []
+
+        query = np.asarray(query, dtype=np.float32).ravel()
+        scores = self.vectors @ query
+        positions = select_top_k(scores, top_k, threshold)
+        return [(self._ids[i], float(scores[i])) for i in positions]
+
+    def search_batch(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        threshold: float
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Find the most similar products to several query vectors at once.
+
+        All queries are scored with one matrix-matrix product.
+
+        Args:
+            queries: Normalized query embeddings (Q x D)
+            top_k: Number of top results to return per query
+            threshold: Minimum similarity threshold
+
+        Returns:
+            One list of (product_id, similarity) per query, sorted by descending similarity
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if not self._ids:
+            return [[] for _ in range(queries.shape[0])]
+
+        scores = queries @ self.vectors.T
+        results = []
+        for row in scores:
+            positions = select_top_k(row, top_k, threshold)
+            results.append([(self._ids[i], float(row[i])) for i in positions])
+        return results
+
+    def _reserve(self, size: int, dim: int) -> None:
+        """Make room for at least size rows in a writable buffer."""
+        if self._vectors is not None:
+            if self._vectors.shape[1] != dim:
+                raise ValueError(
+                    f"Vector dimension {dim} does not match index dimension {self._vectors.shape[1]}"
+                )
+            if self._owns_buffer and self._vectors.shape[0] >= size:
+                return
+
+        # Grow geometrically so repeated inserts stay amortized O(1)
+        capacity = max(size, 2 * len(self._ids), 16)
+        if self.spill_dir is not None:
+            buffer = temporary_memmap((capacity, dim), self.spill_dir)
+        else:
+            buffer = np.empty((capacity, dim), dtype=np.float32)
+        if self._ids:
+            buffer[:len(self._ids)] = self._vectors[:len(self._ids)]
+        self._vectors = buffer
+        self._owns_buffer = True
+
+
+def measure_recall(index, queries: np.ndarray, top_k: int) -> Dict[str, float]:
+    """
+    Measure recall of a compressed index against exact float32 search.
+
+    Args:
+        index: Index whose search() accepts a rerank flag
+        queries: M x D matrix of normalized query embeddings
+        top_k: Number of neighbours compared per query
+
+    Returns:
+        Recall@k without and with re-ranking
+    """
+    exact_index = FlatIndex()
+    exact_index.build(index.ids, index.vectors)
+    approx_hits = 0
+    reranked_hits = 0
+    for query in queries:
+        truth = {product_id for product_id, _ in exact_index.search(query, top_k, -1.0)}
+        approx = index.search(query, top_k, -1.0, rerank=False)
+        reranked = index.search(query, top_k, -1.0, rerank=True)
+        approx_hits += len(truth & {product_id for product_id, _ in approx})
+        reranked_hits += len(truth & {product_id for product_id, _ in reranked})
+
+    expected = max(1, len(queries) * min(top_k, len(index)))
+    return {
+        "recall_at_k": round(approx_hits / expected, 4),
+        "recall_at_k_reranked": round(reranked_hits / expected, 4),
+    }
+
+
+def create_index(index_type: Optional[str] = None):
+    """
+    Create an empty vector index of the configured type.
+
+    Args:
+        index_type: "flat", "int8", "ivf" or "pq" (default from config)
+
+    Returns:
+        New index instance
+    """
+    index_type = (index_type or config.INDEX_TYPE).lower()
+    if index_type == "flat":
+        return FlatIndex()
+    if index_type == "int8":
+        from services.quantized_index import Int8Index
+        return Int8Index()
+    if index_type == "ivf":
+        from services.ivf_index import IVFIndex
+        return IVFIndex()
+    if index_type == "pq":
+        from services.pq_index import PQIndex
+        return PQIndex()
+    raise ValueError(f"Unknown index type: {index_type}")
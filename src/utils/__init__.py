@@ -1,3 +1,3 @@
 """Utilities package initialization."""
 # Utils will be imported directly where needed
-__all__ = ["ImageProcessor", "setup_logger"]
+__all__ = ["ImageProcessor", "SingleFlight", "setup_logger"]
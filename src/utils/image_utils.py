@@ -3,14 +3,44 @@ Image utilities for processing and downloading images.
 """
 import io
 import logging
-from typing import Optional
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from PIL import Image
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from config.settings import config
+from utils.singleflight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
+# Download threads shared by every ImageProcessor, created on first use
+_fetch_pool: Optional[ThreadPoolExecutor] = None
+_fetch_pool_lock = threading.Lock()
+
+
+def get_fetch_pool() -> ThreadPoolExecutor:
+    """
+    Get or create the shared image download thread pool.
+    
+    Returns:
+        ThreadPoolExecutor with DOWNLOAD_WORKERS threads
+    """
+    global _fetch_pool
+    if _fetch_pool is None:
+        with _fetch_pool_lock:
+            if _fetch_pool is None:
+                _fetch_pool = ThreadPoolExecutor(
+                    max_workers=max(1, config.DOWNLOAD_WORKERS),
+                    thread_name_prefix="image-fetch"
+                )
+    return _fetch_pool
+
 
 class ImageProcessor:
     """Utility class for image processing operations."""
@@ -23,58 +53,324 @@ class ImageProcessor:
             backoff_factor=1,
             status_forcelist=[429, 500, 502, 503, 504]
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        # Size the pool so concurrent downloads reuse connections instead of
+        # opening (and discarding) a new one per request
+        adapter = HTTPAdapter(
+            max_retries=retry_strategy,
+            pool_connections=config.HTTP_POOL_SIZE,
+            pool_maxsize=config.HTTP_POOL_SIZE
+        )
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
+        # Concurrent downloads of the same URL share one request
+        self.fetch_flight = SingleFlight()
     
-    def download_image(self, image_url: str, timeout: int = 10) -> Optional[Image.Image]:
+    @staticmethod
+    def normalize_url(image_url: str) -> str:
         """
-        Download image from URL.
+        Normalize an image URL so equivalent spellings map to the same key.
+        
+        Lowercases the scheme and host, drops default ports and the fragment,
+        and sorts the query parameters.
+        
+        Args:
+            image_url: URL of the image
+            
+        Returns:
+            Normalized URL
+        """
+        parts = urlsplit(image_url.strip())
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or "").lower()
+        if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+            host = f"{host}:{parts.port}"
+        if parts.username or parts.password:
+            host = f"{parts.netloc.rsplit('@', 1)[0]}@{host}"
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        return urlunsplit((scheme, host, parts.path or "/", query, ""))
+    
+    def fetch_image_bytes(self, image_url: str, timeout: int = 10) -> Optional[bytes]:
+        """
+        Download raw image bytes from URL without decoding them.
         
         Args:
             image_url: URL of the image
             timeout: Request timeout in seconds
             
         Returns:
-            PIL Image object or None if failed
+            Image data in bytes or None if failed
         """
+        return self.fetch_flight.do(
+            self.normalize_url(image_url),
+            lambda: self._fetch_image_bytes(image_url, timeout)
+        )
+    
+    def _fetch_image_bytes(self, image_url: str, timeout: int) -> Optional[bytes]:
         try:
             response = self.session.get(image_url, timeout=timeout)
             response.raise_for_status()
-            
-            image = Image.open(io.BytesIO(response.content))
-            
-            # Convert RGBA to RGB if necessary
-            if image.mode == 'RGBA':
-                image = image.convert('RGB')
-            
-            return image
+            return response.content
         except Exception as e:
             logger.error(f"Error downloading image from {image_url}: {str(e)}")
             return None
     
-    def load_image_from_bytes(self, image_bytes: bytes) -> Optional[Image.Image]:
+    def download_image(self, image_url: str, timeout: int = 10) -> Optional[Image.Image]:
         """
-        Load image from bytes.
+        Download image from URL.
         
         Args:
-            image_bytes: Image data in bytes
+            image_url: URL of the image
+            timeout: Request timeout in seconds
             
         Returns:
             PIL Image object or None if failed
         """
+        image_bytes = self.fetch_image_bytes(image_url, timeout=timeout)
+        if image_bytes is None:
+            return None
+        return self.load_image_from_bytes(image_bytes)
+    
+    def iter_fetch_image_bytes(
+        self,
+        image_urls: Iterable[str],
+        max_workers: Optional[int] = None,
+        per_host_limit: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        timeout: int = 10
+    ) -> Iterator[Tuple[str, Optional[bytes]]]:
+        """
+        Download many images concurrently, yielding them as they arrive.
+        
+        Duplicate URLs are downloaded once. Downloads run on the shared fetch
+        pool, and at most max_workers of this call's requests are submitted
+        at any time, so results are not buffered without bound.
+        
+        Args:
+            image_urls: URLs of the images
+            max_workers: Maximum concurrent downloads for this call (default from config)
+            per_host_limit: Maximum concurrent requests per host (default from config)
+            time_budget: Total seconds for all downloads; URLs not finished in
+                time are yielded as failures (default from config, 0 for none)
+            timeout: Per-request timeout in seconds
+            
+        Yields:
+            (image_url, image bytes or None if failed) in completion order
+        """
+        max_workers = max(1, max_workers or config.DOWNLOAD_WORKERS)
+        per_host_limit = max(1, per_host_limit or config.DOWNLOAD_PER_HOST_LIMIT)
+        if time_budget is None:
+            time_budget = config.DOWNLOAD_TIME_BUDGET
+        deadline = time.monotonic() + time_budget if time_budget > 0 else None
+        
+        host_slots: Dict[str, threading.BoundedSemaphore] = defaultdict(
+            lambda: threading.BoundedSemaphore(per_host_limit)
+        )
+        slots_lock = threading.Lock()
+        
+        def fetch(image_url: str) -> Optional[bytes]:
+            with slots_lock:
+                slot = host_slots[urlsplit(image_url).netloc]
+            with slot:
+                request_timeout = timeout
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    request_timeout = min(timeout, remaining)
+                return self.fetch_image_bytes(image_url, timeout=request_timeout)
+        
+        pending_urls = iter(dict.fromkeys(image_urls))
+        in_flight: Dict[Future, str] = {}
+        executor = get_fetch_pool()
         try:
-            image = Image.open(io.BytesIO(image_bytes))
+            while True:
+                # Keep a bounded number of requests submitted ahead of the consumer
+                while len(in_flight) < max_workers:
+                    image_url = next(pending_urls, None)
+                    if image_url is None:
+                        break
+                    in_flight[executor.submit(fetch, image_url)] = image_url
+                
+                if not in_flight:
+                    return
+                
+                wait_timeout = None
+                if deadline is not None:
+                    wait_timeout = max(0.0, deadline - time.monotonic())
+                done: Set[Future] = wait(in_flight, timeout=wait_timeout, return_when=FIRST_COMPLETED)[0]
+                
+                if not done:
+                    logger.warning(
+                        f"Image download time budget of {time_budget}s exhausted, "
+                        f"abandoning {len(in_flight)} in-flight downloads"
+                    )
+                    for future, image_url in list(in_flight.items()):
+                        future.cancel()
+                        yield image_url, None
+                    for image_url in pending_urls:
+                        yield image_url, None
+                    return
+                
+                for future in done:
+                    image_url = in_flight.pop(future)
+                    try:
+                        yield image_url, future.result()
+                    except Exception as e:
+                        logger.error(f"Error downloading image from {image_url}: {str(e)}")
+                        yield image_url, None
+        finally:
+            # The pool is shared, so only drop this call's queued downloads
+            for future in in_flight:
+                future.cancel()
+    
+    def iter_download_images(
+        self,
+        image_urls: Iterable[str],
+        **fetch_options
+    ) -> Iterator[Tuple[str, Optional[Image.Image]]]:
+        """
+        Download and decode many images concurrently, yielding them as they arrive.
+        
+        Args:
+            image_urls: URLs of the images
+            **fetch_options: Options passed to iter_fetch_image_bytes
             
-            # Convert RGBA to RGB if necessary
-            if image.mode == 'RGBA':
-                image = image.convert('RGB')
+        Yields:
+            (image_url, PIL Image or None if failed) in completion order
+        """
+        for image_url, image_bytes in self.iter_fetch_image_bytes(image_urls, **fetch_options):
+            if image_bytes is None:
+                yield image_url, None
+            else:
+                yield image_url, self.load_image_from_bytes(image_bytes)
+    
+    def load_image_from_bytes(
+        self,
+        image_bytes: bytes,
+        target_size: Optional[int] = None
+    ) -> Optional[Image.Image]:
+        """
+        Load image from bytes as RGB, decoding no more pixels than needed.
+        
+        Args:
+            image_bytes: Image data in bytes
+            target_size: Smallest shorter side to keep, 0 for full size (default from config)
             
-            return image
+        Returns:
+            PIL Image object or None if failed
+        """
+        try:
+            if not self._within_byte_budget(len(image_bytes)):
+                return None
+            return self._decode_image(io.BytesIO(image_bytes), target_size)
         except Exception as e:
             logger.error(f"Error loading image from bytes: {str(e)}")
             return None
     
+    def load_image_from_file(
+        self,
+        image_file: BinaryIO,
+        target_size: Optional[int] = None
+    ) -> Optional[Image.Image]:
+        """
+        Load image from a seekable binary file, such as a spooled upload.
+        
+        The decoder reads straight from the file, so the encoded image is
+        never copied into one bytes object.
+        
+        Args:
+            image_file: Binary file positioned anywhere
+            target_size: Smallest shorter side to keep, 0 for full size (default from config)
+            
+        Returns:
+            PIL Image object or None if failed
+        """
+        try:
+            size = image_file.seek(0, io.SEEK_END)
+            if not self._within_byte_budget(size):
+                return None
+            image_file.seek(0)
+            return self._decode_image(image_file, target_size)
+        except Exception as e:
+            logger.error(f"Error loading image from file: {str(e)}")
+            return None
+    
+    @staticmethod
+    def sniff_image_format(header: bytes) -> Optional[str]:
+        """
+        Identify an image format from the first bytes of a file.
+        
+        Args:
+            header: At least the first 12 bytes of the file
+            
+        Returns:
+            Format name (JPEG, PNG, GIF, WEBP, BMP or TIFF) or None if unrecognized
+        """
+        if header.startswith(b'\xff\xd8\xff'):
+            return 'JPEG'
+        if header.startswith(b'\x89PNG\r\n\x1a\n'):
+            return 'PNG'
+        if header[:6] in (b'GIF87a', b'GIF89a'):
+            return 'GIF'
+        if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+            return 'WEBP'
+        if header.startswith(b'BM'):
+            return 'BMP'
+        if header[:4] in (b'II*\x00', b'MM\x00*'):
+            return 'TIFF'
+        return None
+    
+    @staticmethod
+    def _within_byte_budget(size: int) -> bool:
+        """Check an encoded image size against MAX_IMAGE_BYTES, logging rejections."""
+        if config.MAX_IMAGE_BYTES and size > config.MAX_IMAGE_BYTES:
+            logger.error(f"Image of {size} bytes exceeds MAX_IMAGE_BYTES ({config.MAX_IMAGE_BYTES})")
+            return False
+        return True
+    
+    @staticmethod
+    def _decode_image(source: BinaryIO, target_size: Optional[int]) -> Optional[Image.Image]:
+        """
+        Decode an image as RGB at reduced resolution.
+        
+        The pixel budget is checked from the header before any pixel data is
+        decoded. JPEGs are decoded at a reduced DCT scale and other formats
+        are box-reduced by an integer factor, in both cases keeping the
+        shorter side at least target_size.
+        
+        Args:
+            source: Binary file positioned at the start of the image
+            target_size: Smallest shorter side to keep, 0 for full size (default from config)
+            
+        Returns:
+            PIL Image object or None if over the pixel budget
+        """
+        # Only the header is read here
+        image = Image.open(source)
+        width, height = image.size
+        if config.MAX_IMAGE_PIXELS and width * height > config.MAX_IMAGE_PIXELS:
+            logger.error(
+                f"Image of {width}x{height} pixels exceeds MAX_IMAGE_PIXELS ({config.MAX_IMAGE_PIXELS})"
+            )
+            return None
+        
+        if target_size is None:
+            target_size = config.IMAGE_DECODE_SIZE
+        if target_size > 0 and image.format == 'JPEG':
+            image.draft('RGB', (target_size, target_size))
+        
+        # One conversion covers every mode (P, L, LA, RGBA, CMYK, ...)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        else:
+            image.load()
+        
+        factor = min(image.size) // target_size if target_size > 0 else 1
+        if factor >= 2:
+            image = image.reduce(factor)
+        
+        return image
+    
     def resize_image(self, image: Image.Image, max_size: tuple = (512, 512)) -> Image.Image:
         """
         Resize image while maintaining aspect ratio.
@@ -0,0 +1,108 @@
+"""
+Duplicate suppression for concurrent calls with the same key.
+"""
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+
+class SingleFlight:
+    """Runs a function at most once at a time per key.
+
+    The first caller for a key runs the function; callers arriving with the
+    same key while it is still running wait for that result instead of
+    starting their own. Once the call finishes the key is forgotten, so later
+    callers run the function again (combine with a cache to reuse results).
+    """
+
+    def __init__(self):
+        """Initialize with no calls in flight."""
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn for key, or wait for the identical call already in flight.
+
+        Args:
+            key: Identity of the call
+            fn: Function to run
+
+        Returns:
+            Return value of fn (exceptions are raised in every waiting caller)
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.executions += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+    def claim(self, keys: Iterable[str]) -> Tuple[Dict[str, Future], Dict[str, Future]]:
+        """
+        Start calls for several keys at once, for callers that compute them together.
+
+        Every claimed key must be finished with resolve(), also on failure;
+        until then other callers with that key wait for it.
+
+        Args:
+            keys: Identities of the calls
+
+        Returns:
+            (claimed, in_flight): futures of the keys this caller now runs, and
+            of the keys another caller is already running
+        """
+        claimed: Dict[str, Future] = {}
+        in_flight: Dict[str, Future] = {}
+        with self._lock:
+            for key in keys:
+                future = self._calls.get(key)
+                if future is None:
+                    claimed[key] = self._calls[key] = Future()
+                    self.executions += 1
+                else:
+                    in_flight[key] = future
+                    self.shared += 1
+        return claimed, in_flight
+
+    def resolve(self, key: str, result: Any) -> None:
+        """
+        Finish a call started with claim() and release its waiting callers.
+
+        Args:
+            key: Identity of the call
+            result: Value returned to the waiting callers
+        """
+        with self._lock:
+            future = self._calls.pop(key)
+        future.set_result(result)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get call statistics.
+
+        Returns:
+            Dictionary with executions, shared results and calls in flight
+        """
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "shared": self.shared,
+                "in_flight": len(self._calls),
+            }
@@ -0,0 +1,82 @@
+"""
+Tests for the IVF index.
+"""
+import numpy as np
+
+from services.ivf_index import IVFIndex
+
+
+def random_vectors(count: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_index() -> IVFIndex:
+    return IVFIndex(nlist=4, nprobe=2, min_train_size=15, train_iterations=5)
+
+
+def test_index_trains_once_it_grows_past_min_train_size():
+    vectors = random_vectors(40)
+    ids = [f"p{i}" for i in range(40)]
+    index = make_index()
+    index.build(ids[:10], vectors[:10])
+    assert not index.trained
+
+    for product_id, vector in zip(ids[10:], vectors[10:]):
+        index.add(product_id, vector)
+
+    assert index.trained
+    assert len(index) == 40
+    # Every row is in exactly one inverted list
+    rows = np.sort(np.concatenate(index._inverted_lists()))
+    assert np.array_equal(rows, np.arange(40))
+
+
+def test_load_retrains_untrained_index_that_has_grown(tmp_path):
+    vectors = random_vectors(40)
+    ids = [f"p{i}" for i in range(40)]
+    path = str(tmp_path / "ivf_index.npz")
+
+    small = make_index()
+    small.build(ids[:10], vectors[:10])
+    assert small.save(path)
+    # A small catalog keeps using the saved untrained structure
+    assert make_index().load(path, ids[:10], vectors[:10])
+
+    # Saved untrained with the ids of a catalog that has since grown
+    grown = IVFIndex(nlist=4, nprobe=2, min_train_size=100)
+    grown.build(ids, vectors)
+    assert grown.save(path)
+    restored = make_index()
+    assert not restored.load(path, ids, vectors)
+
+    restored.build(ids, vectors)
+    assert restored.trained
+    assert restored.save(path)
+    reloaded = make_index()
+    assert reloaded.load(path, ids, vectors)
+    assert reloaded.trained
+
+
+def test_incremental_lists_match_a_rebuild():
+    rng = np.random.default_rng(1)
+    vectors = random_vectors(400, seed=2)
+    index = make_index()
+    index.build([f"p{i}" for i in range(100)], vectors[:100])
+    index._inverted_lists()
+
+    live = [f"p{i}" for i in range(100)]
+    for step, vector in enumerate(vectors[100:]):
+        action = rng.random()
+        if action < 0.3 and len(live) > 20:
+            assert index.remove(live.pop(rng.integers(len(live))))
+        elif action < 0.6:
+            index.add(live[rng.integers(len(live))], vector)
+        else:
+            live.append(f"n{step}")
+            index.add(live[-1], vector)
+
+    rebuilt = index.copy()
+    rebuilt._lists = None
+    for incremental, expected in zip(index._inverted_lists(), rebuilt._inverted_lists()):
+        assert np.array_equal(np.sort(incremental), np.sort(expected))
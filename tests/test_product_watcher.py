@@ -0,0 +1,149 @@
+"""
+Tests for the product watcher (change streams and polling fallback).
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import mongomock
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from services.database import ProductWatcher
+
+
+class Recorder:
+    """Collects the callbacks of a watcher."""
+
+    def __init__(self):
+        self.upserts = []
+        self.deletes = []
+        self._lock = threading.Lock()
+
+    def on_upsert(self, document):
+        with self._lock:
+            self.upserts.append(document)
+
+    def on_delete(self, product_id):
+        with self._lock:
+            self.deletes.append(product_id)
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def product(name: str, updated_at: datetime) -> dict:
+    return {
+        "_id": ObjectId(),
+        "productName": name,
+        "productPrice": 1.0,
+        "productImage": f"https://example.com/{name}.jpg",
+        "updatedAt": updated_at,
+    }
+
+
+def test_polling_reports_inserts_updates_and_deletes():
+    collection = mongomock.MongoClient().shop.products
+    started = datetime(2024, 1, 1)
+    existing = product("existing", started)
+    removed = product("removed", started)
+    collection.insert_many([existing, removed])
+
+    recorder = Recorder()
+    watcher = ProductWatcher(collection, recorder.on_upsert, recorder.on_delete, poll_interval=0.05)
+    watcher.start()
+    try:
+        # mongomock has no change streams, so the watcher polls without retrying first
+        assert wait_for(lambda: watcher.mode == "polling", timeout=1.0)
+
+        added = product("added", started)
+        collection.insert_one(added)
+        assert wait_for(lambda: any(d["_id"] == added["_id"] for d in recorder.upserts))
+
+        collection.update_one(
+            {"_id": existing["_id"]},
+            {"$set": {"productName": "renamed", "updatedAt": started + timedelta(minutes=1)}}
+        )
+        assert wait_for(lambda: any(d.get("productName") == "renamed" for d in recorder.upserts))
+
+        collection.delete_one({"_id": removed["_id"]})
+        assert wait_for(lambda: str(removed["_id"]) in recorder.deletes)
+    finally:
+        watcher.stop()
+
+
+class FakeStream:
+    """Change stream cursor replaying scripted events."""
+
+    def __init__(self, events):
+        self._events = list(events)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def try_next(self):
+        if not self._events:
+            time.sleep(0.01)
+            return None
+        event = self._events.pop(0)
+        if isinstance(event, Exception):
+            raise event
+        return event
+
+
+class FakeCollection:
+    """Collection whose watch() calls open the scripted streams in turn."""
+
+    def __init__(self, streams):
+        self._streams = list(streams)
+        self.resume_tokens = []
+
+    def watch(self, pipeline, **kwargs):
+        self.resume_tokens.append(kwargs.get("resume_after"))
+        events = self._streams.pop(0) if self._streams else []
+        if isinstance(events, Exception):
+            raise events
+        return FakeStream(events)
+
+
+def change(token: str, operation: str, document: dict) -> dict:
+    return {
+        "_id": {"_data": token},
+        "operationType": operation,
+        "documentKey": {"_id": document["_id"]},
+        "fullDocument": None if operation == "delete" else document,
+    }
+
+
+def test_change_stream_dispatches_and_resumes_after_failures():
+    first = product("first", datetime(2024, 1, 1))
+    second = product("second", datetime(2024, 1, 1))
+    collection = FakeCollection([
+        [change("1", "insert", first), AutoReconnect("connection reset")],
+        [change("2", "update", second), AutoReconnect("connection reset")],
+        OperationFailure("resume point no longer in the oplog"),
+        [change("3", "delete", first)],
+    ])
+
+    recorder = Recorder()
+    watcher = ProductWatcher(collection, recorder.on_upsert, recorder.on_delete, poll_interval=0.05)
+    watcher.STREAM_BACKOFF_SECONDS = 0.01
+    watcher.start()
+    try:
+        assert wait_for(lambda: recorder.deletes == [str(first["_id"])])
+    finally:
+        watcher.stop()
+
+    assert watcher.mode == "change_stream"
+    assert [document["_id"] for document in recorder.upserts] == [first["_id"], second["_id"]]
+    # Reopened after the last applied change; a rejected resume restarts from now
+    assert collection.resume_tokens == [None, {"_data": "1"}, {"_data": "2"}, None]
@@ -0,0 +1,99 @@
+"""
+Tests for the streaming upload checks of UploadLimitMiddleware.
+"""
+import asyncio
+
+from fastapi import FastAPI, File, UploadFile
+
+from api.middleware import SNIFF_BYTES, FirstFileSniffer, UploadLimitMiddleware
+
+BOUNDARY = b"testboundary"
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+def multipart_body(content: bytes) -> bytes:
+    return (
+        b"--" + BOUNDARY + b"\r\n"
+        b'Content-Disposition: form-data; name="note"\r\n\r\n'
+        b"hello\r\n"
+        b"--" + BOUNDARY + b"\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="query.png"\r\n'
+        b"Content-Type: image/png\r\n\r\n"
+        + content + b"\r\n--" + BOUNDARY + b"--\r\n"
+    )
+
+
+def test_sniffer_returns_the_first_file_bytes_as_soon_as_they_arrive():
+    body = multipart_body(PNG)
+    sniffer = FirstFileSniffer(BOUNDARY)
+    for position in range(len(body)):
+        header = sniffer.feed(body[position:position + 1])
+        if header is not None:
+            break
+
+    assert header == PNG[:SNIFF_BYTES]
+    assert position < len(body) - len(PNG) + SNIFF_BYTES
+    assert sniffer.done
+
+
+def test_sniffer_returns_a_short_file_whole():
+    sniffer = FirstFileSniffer(BOUNDARY)
+    assert sniffer.feed(multipart_body(b"GIF89a")) == b"GIF89a"
+
+
+def upload_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    app.add_middleware(UploadLimitMiddleware, max_bytes=10 * 1024 * 1024)
+    return app
+
+
+def post_in_chunks(app, body: bytes, chunk_size: int = 1024):
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    consumed = 0
+    sent = []
+
+    async def receive():
+        nonlocal consumed
+        consumed += 1
+        chunk = chunks[consumed - 1]
+        return {"type": "http.request", "body": chunk, "more_body": consumed < len(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/upload",
+        "raw_path": b"/upload",
+        "root_path": "",
+        "scheme": "http",
+        "query_string": b"",
+        "headers": [(b"content-type", b"multipart/form-data; boundary=" + BOUNDARY)],
+        "server": ("testserver", 80),
+        "client": ("testclient", 123),
+        "http_version": "1.1",
+    }
+    asyncio.run(app(scope, receive, send))
+    status = next(message["status"] for message in sent if message["type"] == "http.response.start")
+    return status, consumed, len(chunks)
+
+
+def test_non_image_upload_is_refused_before_the_body_is_received():
+    status, consumed, total = post_in_chunks(upload_app(), multipart_body(b"not an image" * 20000))
+
+    assert status == 415
+    assert consumed == 1
+    assert total > 100
+
+
+def test_image_upload_passes_through():
+    status, consumed, total = post_in_chunks(upload_app(), multipart_body(PNG * 100))
+
+    assert status == 200
+    assert consumed == total